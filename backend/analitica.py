@@ -0,0 +1,349 @@
+# analitica.py — analítica por cohortes (estado × tipo_cultivo × trimestre) con NumPy
+#
+# Un Snapshot guarda en arreglos columnares el gasto de cada usuario por trimestre
+# (7 categorías) y, por cohorte, n, suma, p10, mediana y p90 de cada categoría,
+# más los valores ordenados para ubicar a un agricultor dentro de su cohorte.
+#
+# Carga y refresco:
+#   - la primera vez se lee el acumulado gastos_trimestrales y el id_gastos máximo
+#     en la misma transacción de lectura (marca de agua);
+#   - cada ANALITICA_REFRESCO_S solo se leen los gastos con id_gastos > marca y se
+#     suman a la base con operaciones vectorizadas; usuario y cultivos (tablas
+#     chicas) se releen completas para reflejar cambios de estado y cultivos;
+#   - las estadísticas se recalculan completas (son ms) y el snapshot se reemplaza
+#     de forma atómica: las requests nunca ven uno a medio construir.
+# Cada proceso mantiene el suyo; la marca de agua sale de la DB, así que también
+# ve lo que escriben otros workers.
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from db import engine, parte_fecha
+from main import GASTO_CAMPOS
+from respuestas import dumps, respuesta_json
+
+ANALITICA_REFRESCO_S = float(os.getenv("ANALITICA_REFRESCO_S", "300"))  # 0 = sin refresco periódico
+PERCENTILES = (10, 50, 90)
+
+router = APIRouter(prefix="/admin/analytics", tags=["admin"])
+
+
+def _periodo(anio, trimestre):
+    return anio * 4 + (trimestre - 1)
+
+
+def _de_periodo(periodo: int) -> tuple:
+    return int(periodo) // 4, int(periodo) % 4 + 1
+
+
+def _sumar_por_clave(uid, periodo, valores) -> tuple:
+    """Agrupa filas repetidas (uid, periodo) sumando sus valores."""
+    clave = uid.astype(np.int64) * 100_000 + periodo
+    unicas, inversa = np.unique(clave, return_inverse=True)
+    suma = np.zeros((len(unicas), valores.shape[1]))
+    np.add.at(suma, inversa, valores)
+    return (unicas // 100_000).astype(np.int64), (unicas % 100_000).astype(np.int64), suma
+
+
+def _cuantiles_agrupados(ordenados, inicios, conteos, q: float):
+    """Cuantil q (interpolación lineal) de cada grupo contiguo de `ordenados`."""
+    pos = inicios + q * (conteos - 1)
+    bajo = np.floor(pos).astype(np.int64)
+    alto = np.minimum(bajo + 1, inicios + conteos - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (pos - bajo)
+
+
+class Snapshot:
+    def __init__(self, base: tuple, marca: int, dims: dict):
+        t0 = time.perf_counter()
+        self.base = base
+        self.marca = marca
+        uid, periodo, valores = base
+        self.etiquetas_estado = dims["etiquetas_estado"]
+        self.etiquetas_cultivo = dims["etiquetas_cultivo"]
+        self.estado_de = dims["estado_de"]
+        self.pares = (dims["par_uid"], dims["par_cultivo"])
+
+        # Una fila por (usuario, periodo, tipo de cultivo que siembra)
+        par_uid, par_cultivo = self.pares
+        n_uid = max(int(uid.max(initial=0)), int(par_uid.max(initial=0))) + 1
+        por_usuario = np.bincount(par_uid, minlength=n_uid)
+        inicio_usuario = np.cumsum(por_usuario) - por_usuario
+        rep = por_usuario[uid]
+        fila = np.repeat(np.arange(len(uid)), rep)
+        desplazamiento = np.arange(len(fila)) - np.repeat(np.cumsum(rep) - rep, rep)
+        cultivo = par_cultivo[np.repeat(inicio_usuario[uid], rep) + desplazamiento]
+        estado = self.estado_de[uid[fila]] if len(fila) else np.zeros(0, np.int64)
+
+        n_cult = max(len(self.etiquetas_cultivo), 1)
+        clave = (estado.astype(np.int64) * n_cult + cultivo) * 100_000 + periodo[fila]
+        self.claves, grupo = np.unique(clave, return_inverse=True)
+        self.n = np.bincount(grupo, minlength=len(self.claves))
+        self.inicios = np.cumsum(self.n) - self.n
+        vals = valores[fila]
+        k = vals.shape[1]
+        self.suma = np.zeros((len(self.claves), k))
+        self.ordenados = np.zeros_like(vals)
+        self.cuantiles = {p: np.zeros((len(self.claves), k)) for p in PERCENTILES}
+        # Orden (grupo, valor) en dos pasadas: por valor y luego estable por grupo; con
+        # grupo en uint16 la segunda es radix sort (~5x más rápido que np.lexsort)
+        grupo_orden = grupo.astype(np.uint16 if len(self.claves) <= 0xFFFF else np.int64)
+        for j in range(k):
+            self.suma[:, j] = np.bincount(grupo, weights=vals[:, j], minlength=len(self.claves))
+            por_valor = np.argsort(vals[:, j])
+            orden = por_valor[np.argsort(grupo_orden[por_valor], kind="stable")]
+            self.ordenados[:, j] = vals[orden, j]
+            for p in PERCENTILES:
+                self.cuantiles[p][:, j] = _cuantiles_agrupados(
+                    self.ordenados[:, j], self.inicios, self.n, p / 100)
+        self.c_estado = (self.claves // 100_000) // n_cult
+        self.c_cultivo = (self.claves // 100_000) % n_cult
+        self.c_periodo = self.claves % 100_000
+        self.generado_en = datetime.utcnow().replace(microsecond=0)
+        self.calculo_ms = (time.perf_counter() - t0) * 1000
+
+    def _codigo(self, etiquetas: list, valor: str) -> int:
+        try:
+            return etiquetas.index(valor)
+        except ValueError:
+            return -1  # no existe: el filtro no devuelve nada
+
+    def cohortes(self, estado: Optional[str], tipo_cultivo: Optional[str], anio: Optional[int],
+                 trimestre: Optional[int], categorias: tuple) -> list:
+        m = np.ones(len(self.claves), bool)
+        if estado is not None:
+            m &= self.c_estado == self._codigo(self.etiquetas_estado, estado)
+        if tipo_cultivo is not None:
+            m &= self.c_cultivo == self._codigo(self.etiquetas_cultivo, tipo_cultivo)
+        if anio is not None:
+            m &= self.c_periodo // 4 == anio
+        if trimestre is not None:
+            m &= self.c_periodo % 4 == trimestre - 1
+        cols = [GASTO_CAMPOS.index(c) for c in categorias]
+        idx = np.flatnonzero(m)
+        # Conversión a listas de Python una vez por columna, no por celda
+        estados = [self.etiquetas_estado[e] for e in self.c_estado[idx].tolist()]
+        cultivos = [self.etiquetas_cultivo[c] for c in self.c_cultivo[idx].tolist()]
+        periodos = self.c_periodo[idx].tolist()
+        usuarios = self.n[idx].tolist()
+        metricas = [("suma", self.suma)] + [(f"p{p}", self.cuantiles[p]) for p in PERCENTILES]
+        valores = {(j, nombre): np.round(arr[idx, j], 2).tolist() for j in cols for nombre, arr in metricas}
+        out = []
+        for f in range(len(idx)):
+            out.append({
+                "estado": estados[f], "tipo_cultivo": cultivos[f],
+                "anio": periodos[f] // 4, "trimestre": periodos[f] % 4 + 1, "usuarios": usuarios[f],
+                "gastos": {
+                    GASTO_CAMPOS[j]: {nombre: valores[j, nombre][f] for nombre, _ in metricas} for j in cols
+                },
+            })
+        return out
+
+    def comparativo(self, id_usuario: int, anio: Optional[int], trimestre: Optional[int]) -> dict:
+        uid, periodo, valores = self.base
+        filas = np.flatnonzero(uid == id_usuario)
+        if anio is not None and trimestre is not None:
+            filas = filas[periodo[filas] == _periodo(anio, trimestre)]
+        elif len(filas):
+            filas = filas[periodo[filas] == periodo[filas].max()]  # último trimestre con gastos
+        if not len(filas):
+            raise HTTPException(404, "Sin gastos del usuario en ese trimestre")
+        p = int(periodo[filas[0]])
+        propios = valores[filas[0]]
+        n_cult = max(len(self.etiquetas_cultivo), 1)
+        estado = int(self.estado_de[id_usuario])
+        cultivos = self.pares[1][self.pares[0] == id_usuario]
+        cohortes = []
+        for c in np.unique(cultivos):
+            clave = (estado * n_cult + int(c)) * 100_000 + p
+            i = int(np.searchsorted(self.claves, clave))
+            ini, n = int(self.inicios[i]), int(self.n[i])
+            gastos = {}
+            for j, campo in enumerate(GASTO_CAMPOS):
+                grupo = self.ordenados[ini:ini + n, j]
+                # Percentil del agricultor: % de la cohorte con gasto menor o igual
+                gastos[campo] = {
+                    "valor": round(float(propios[j]), 2),
+                    "percentil": round(100 * int(np.searchsorted(grupo, propios[j], side="right")) / n, 1),
+                    **{f"p{q}": round(float(self.cuantiles[q][i, j]), 2) for q in PERCENTILES},
+                }
+            cohortes.append({"tipo_cultivo": self.etiquetas_cultivo[int(c)], "usuarios": n, "gastos": gastos})
+        a, t = _de_periodo(p)
+        return {"id_usuario": id_usuario, "estado": self.etiquetas_estado[estado],
+                "anio": a, "trimestre": t, "cohortes": cohortes}
+
+    def resumen(self) -> dict:
+        return {
+            "generado_en": self.generado_en.isoformat(),
+            "calculo_ms": round(self.calculo_ms, 1),
+            "filas_base": int(len(self.base[0])),
+            "cohortes": int(len(self.claves)),
+            "marca_id_gastos": self.marca,
+        }
+
+
+# =========================
+# Carga desde la DB
+# =========================
+_SUMAS = ", ".join(f"COALESCE({c}, 0)" for c in GASTO_CAMPOS)
+
+
+def _leer_filas(conn, sql: str, params=()) -> tuple:
+    # Tuplas del cursor DBAPI: np.array sobre Row de SQLAlchemy es ~10x más lento
+    r = conn.exec_driver_sql(sql, params).cursor.fetchall()
+    if not r:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros((0, len(GASTO_CAMPOS)))
+    arr = np.array(r, dtype=np.float64)
+    return arr[:, 0].astype(np.int64), arr[:, 1].astype(np.int64), arr[:, 2:]
+
+
+def _cargar_base(conn) -> tuple:
+    marca = conn.exec_driver_sql("SELECT COALESCE(MAX(id_gastos), 0) FROM gastos").scalar()
+    uid, anio, resto = _leer_filas(conn, f"""
+        SELECT id_usuario, anio, trimestre, {", ".join(GASTO_CAMPOS)} FROM gastos_trimestrales""")
+    if len(uid):
+        periodo = _periodo(anio, resto[:, 0].astype(np.int64))
+        return (uid, periodo, resto[:, 1:]), marca
+    return (uid, anio, resto), marca
+
+
+def _cargar_nuevos(conn, marca: int) -> tuple:
+    nueva = conn.exec_driver_sql("SELECT COALESCE(MAX(id_gastos), 0) FROM gastos").scalar()
+    # exec_driver_sql va directo al driver: "?" en sqlite3, "%s" en psycopg
+    marcador = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+    uid, periodo, valores = _leer_filas(conn, f"""
+        SELECT id_usuario,
+               {parte_fecha(conn.dialect, "year", "creado_en")} * 4
+                 + ({parte_fecha(conn.dialect, "month", "creado_en")} - 1) / 3,
+               {_SUMAS}
+        FROM gastos
+        WHERE id_gastos > {marcador} AND id_gastos <= {marcador} AND creado_en IS NOT NULL""", (marca, nueva))
+    return (uid, periodo, valores), nueva
+
+
+def _cargar_dimensiones(conn) -> dict:
+    usuarios = conn.exec_driver_sql("SELECT id_usuario, COALESCE(estado, '') FROM usuario").all()
+    pares = conn.exec_driver_sql("""
+        SELECT DISTINCT p.id_usuario, c.tipo_cultivo
+        FROM cultivo c JOIN parcela p ON p.id_parcela = c.id_parcela
+        ORDER BY p.id_usuario""").all()
+    etiquetas_estado, cod_estado = np.unique(np.array([e for _, e in usuarios] or [""], dtype=object),
+                                             return_inverse=True)
+    ids = np.array([u for u, _ in usuarios] or [0], dtype=np.int64)
+    estado_de = np.zeros(int(ids.max()) + 1, np.int64)
+    estado_de[ids] = cod_estado
+    etiquetas_cultivo, cod_cultivo = np.unique(np.array([c for _, c in pares] or [""], dtype=object),
+                                               return_inverse=True)
+    return {
+        "etiquetas_estado": [e or None for e in etiquetas_estado.tolist()],
+        "estado_de": estado_de,
+        "etiquetas_cultivo": etiquetas_cultivo.tolist(),
+        "par_uid": np.array([u for u, _ in pares], dtype=np.int64),
+        "par_cultivo": cod_cultivo.astype(np.int64) if pares else np.zeros(0, np.int64),
+    }
+
+
+class Analitica:
+    def __init__(self, engine, intervalo_s: float):
+        self.engine = engine
+        self.intervalo_s = intervalo_s
+        self.snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+
+    def refrescar(self, completo: bool = False) -> Snapshot:
+        with self._lock:
+            previo = self.snapshot
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "sqlite":
+                    conn.exec_driver_sql("BEGIN")  # acumulado, marca y gastos nuevos del mismo instante
+                if previo is None or completo:
+                    base, marca = _cargar_base(conn)
+                else:
+                    nuevos, marca = _cargar_nuevos(conn, previo.marca)
+                    base = _sumar_por_clave(*(np.concatenate([a, b]) for a, b in zip(previo.base, nuevos)))
+                dims = _cargar_dimensiones(conn)
+                conn.rollback()
+            # Gastos de un usuario más nuevo que la lectura de `usuario`: estado 0 hasta el próximo refresco
+            uid = base[0]
+            if len(uid) and uid.max() >= len(dims["estado_de"]):
+                dims["estado_de"] = np.pad(dims["estado_de"], (0, int(uid.max()) + 1 - len(dims["estado_de"])))
+            self.snapshot = Snapshot(base, marca, dims)
+            return self.snapshot
+
+    def actual(self) -> Snapshot:
+        return self.snapshot or self.refrescar()
+
+    def iniciar(self) -> None:
+        if self.intervalo_s <= 0 or self._hilo is not None:
+            return
+
+        def ciclo():
+            while not self._parar.wait(self.intervalo_s if self.snapshot else 0):
+                try:
+                    self.refrescar()
+                except Exception as e:  # la próxima vuelta lo reintenta
+                    print(">>> analítica: error al refrescar:", e)
+
+        self._hilo = threading.Thread(target=ciclo, name="analitica", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+
+
+analitica = Analitica(engine, ANALITICA_REFRESCO_S)
+
+
+# =========================
+# Rutas /admin/analytics/*
+# =========================
+def _categorias(categoria: Optional[str]) -> tuple:
+    if categoria is None:
+        return GASTO_CAMPOS
+    if categoria not in GASTO_CAMPOS:
+        raise HTTPException(422, f"categoria debe ser una de: {', '.join(GASTO_CAMPOS)}")
+    return (categoria,)
+
+
+@router.get("/cohortes")
+def cohortes(
+    request: Request,
+    estado: Optional[str] = Query(None),
+    tipo_cultivo: Optional[str] = Query(None),
+    anio: Optional[int] = Query(None, ge=1900, le=9999),
+    trimestre: Optional[int] = Query(None, ge=1, le=4),
+    categoria: Optional[str] = Query(None, description="Una columna gasto_*; por defecto todas"),
+):
+    snap = analitica.actual()
+    # Serializado directo (y comprimido si se acepta): jsonable_encoder recorrería cada celda
+    cuerpo = {**snap.resumen(), "items": snap.cohortes(estado, tipo_cultivo, anio, trimestre, _categorias(categoria))}
+    return respuesta_json(request, dumps(cuerpo))
+
+
+@router.get("/usuarios/{id_usuario}/comparativo")
+def comparativo(
+    id_usuario: int,
+    anio: Optional[int] = Query(None, ge=1900, le=9999),
+    trimestre: Optional[int] = Query(None, ge=1, le=4),
+):
+    if (anio is None) != (trimestre is None):
+        raise HTTPException(422, "Usa anio y trimestre juntos (o ninguno para el último)")
+    return analitica.actual().comparativo(id_usuario, anio, trimestre)
+
+
+@router.get("/estado")
+def estado_snapshot():
+    snap = analitica.snapshot
+    return snap.resumen() if snap else {"generado_en": None}
+
+
+@router.post("/refrescar")
+def refrescar(completo: bool = Query(False, description="Relee el acumulado en vez de solo los gastos nuevos")):
+    return analitica.refrescar(completo).resumen()
@@ -0,0 +1,275 @@
+# archivo.py — gastos viejos fuera de la tabla caliente (archivo frío adjunto)
+#
+# `gastos` crece sin límite y cada consulta por usuario recorre todo su historial.
+# Los gastos con creado_en anterior al corte (ARCHIVO_HORIZONTE_MESES atrás, al
+# primer día del mes) se mueven a archivo.gastos: otro archivo SQLite que db.py
+# adjunta a cada conexión como "archivo". Es WITHOUT ROWID con clave
+# (id_usuario, creado_en, id_gastos): el historial de un usuario queda en páginas
+# contiguas y sin índices aparte. La tabla caliente y su índice quedan chicos y
+# en el page cache.
+#
+# Lo que queda en la DB caliente:
+#   - gastos_trimestrales no cambia (ya incluía esas filas);
+#   - gastos_mensuales_archivados: totales por (usuario, año, mes) de lo archivado,
+#     con los que la serie mensual y el resumen del dashboard siguen exactos.
+# El archivo frío solo se lee con include_archived=true o con un rango de fechas
+# que no cae en bordes de mes.
+#
+# El job corre en línea, por lotes de ARCHIVO_LOTE ids:
+#   1. copia el lote a archivo.gastos (una transacción que solo escribe el archivo frío);
+#   2. suma el lote a los totales mensuales y lo borra de gastos y de sync_cambio
+#      (BEGIN IMMEDIATE corto): un gasto archivado ya no viaja en GET /sync;
+#      después del commit invalida cache_metricas de los usuarios del lote, como
+#      cualquier escritura (cambian las variantes con include_archived);
+# con una pausa de ARCHIVO_PAUSA_MS entre lotes para que entren los escritores.
+# Con WAL un commit sobre dos archivos no es atómico entre ambos; por eso son dos
+# pasos y el 2 solo borra filas que ya están copiadas. Si el proceso muere entre
+# uno y otro, la fila queda en los dos lados hasta la siguiente corrida, que la
+# vuelve a copiar (OR IGNORE) y la borra. El id_gastos máximo nunca se archiva:
+# así SQLite no reutiliza ids ya archivados.
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import text
+
+from db import ARCHIVO_DB, engine
+from main import GASTO_CAMPOS, GASTOS_COLUMNAS, cache_metricas
+
+ARCHIVO_HORIZONTE_MESES = int(os.getenv("ARCHIVO_HORIZONTE_MESES", "24"))
+ARCHIVO_LOTE = int(os.getenv("ARCHIVO_LOTE", "1000"))
+ARCHIVO_PAUSA_MS = float(os.getenv("ARCHIVO_PAUSA_MS", "20"))
+ARCHIVO_INTERVALO_S = float(os.getenv("ARCHIVO_INTERVALO_S", "0"))  # 0 = solo bajo demanda
+
+router = APIRouter(prefix="/admin/gastos", tags=["admin"])
+
+_CAMPOS_DDL = ",\n    ".join(f"{c} FLOAT" for c in GASTO_CAMPOS)
+ARCHIVO_DDL = f"""CREATE TABLE IF NOT EXISTS archivo.gastos (
+    id_gastos INTEGER NOT NULL,
+    id_usuario INTEGER NOT NULL,
+    {_CAMPOS_DDL},
+    creado_en DATETIME NOT NULL,
+    PRIMARY KEY (id_usuario, creado_en, id_gastos)
+) WITHOUT ROWID"""
+
+_RANGO = "g.id_gastos > :desde AND g.id_gastos <= :hasta AND g.creado_en < :corte"
+_COPIADA = ("EXISTS (SELECT 1 FROM archivo.gastos a WHERE a.id_usuario = g.id_usuario "
+            "AND a.creado_en = g.creado_en AND a.id_gastos = g.id_gastos)")
+
+# Keyset por id: cada lote sigue donde terminó el anterior, la tabla se recorre una vez
+_SIGUIENTE_LOTE = text("""
+    SELECT MAX(id_gastos) FROM (
+        SELECT id_gastos FROM main.gastos
+        WHERE id_gastos > :desde AND id_gastos < :tope AND creado_en < :corte
+        ORDER BY id_gastos LIMIT :lote
+    ) AS l""")
+
+_COPIAR = text(f"""
+    INSERT OR IGNORE INTO archivo.gastos ({", ".join(GASTOS_COLUMNAS)})
+    SELECT {", ".join(f"g.{c}" for c in GASTOS_COLUMNAS)} FROM main.gastos g
+    WHERE {_RANGO}""")
+
+_RESUMIR = text(f"""
+    INSERT INTO main.gastos_mensuales_archivados
+        (id_usuario, anio, mes, registros, {", ".join(GASTO_CAMPOS)}, total, ultimo)
+    SELECT g.id_usuario,
+           CAST(strftime('%Y', g.creado_en) AS INTEGER),
+           CAST(strftime('%m', g.creado_en) AS INTEGER),
+           COUNT(*), {", ".join(f"SUM(COALESCE(g.{c}, 0))" for c in GASTO_CAMPOS)},
+           SUM({" + ".join(f"COALESCE(g.{c}, 0)" for c in GASTO_CAMPOS)}), MAX(g.creado_en)
+    FROM main.gastos g
+    WHERE {_RANGO} AND {_COPIADA}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (id_usuario, anio, mes) DO UPDATE SET
+        registros = registros + excluded.registros,
+        {", ".join(f"{c} = {c} + excluded.{c}" for c in GASTO_CAMPOS)},
+        total = total + excluded.total,
+        ultimo = MAX(ultimo, excluded.ultimo)""")
+
+_BORRAR = text(f"DELETE FROM main.gastos AS g WHERE {_RANGO} AND {_COPIADA} RETURNING id_usuario")
+_OLVIDAR_SYNC = text("""
+    DELETE FROM main.sync_cambio
+    WHERE tabla = 'gastos' AND id_fila > :desde AND id_fila <= :hasta
+      AND NOT EXISTS (SELECT 1 FROM main.gastos g WHERE g.id_gastos = sync_cambio.id_fila)""")
+
+
+def corte_para(meses: int, hoy: Optional[date] = None) -> date:
+    """Primer día del mes `meses` meses atrás: cada mes queda entero de un lado o del otro."""
+    hoy = hoy or date.today()
+    n = hoy.year * 12 + hoy.month - 1 - meses
+    return date(n // 12, n % 12 + 1, 1)
+
+
+def _tamano(ruta: Optional[str]) -> int:
+    return os.path.getsize(ruta) if ruta and os.path.exists(ruta) else 0
+
+
+class ArchivoGastos:
+    def __init__(self, engine, intervalo_s: float):
+        self.engine = engine
+        self.intervalo_s = intervalo_s
+        self.ultima: dict = {}
+        self._lock = threading.Lock()  # un job a la vez por proceso
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+
+    @property
+    def disponible(self) -> bool:
+        return ARCHIVO_DB is not None
+
+    def asegurar_esquema(self) -> None:
+        if self.disponible:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(ARCHIVO_DDL)
+
+    def _tomar(self) -> None:
+        if not self.disponible:
+            raise HTTPException(409, "Sin archivo frío: requiere SQLite en disco (ver GASTOS_ARCHIVO_DB)")
+        if not self._lock.acquire(blocking=False):
+            raise HTTPException(409, "Ya hay un archivado en curso")
+
+    def archivar(self, meses: Optional[int] = None) -> dict:
+        self._tomar()
+        try:
+            return self._archivar(meses)
+        finally:
+            self._lock.release()
+
+    def archivar_en_segundo_plano(self, meses: Optional[int] = None) -> None:
+        self._tomar()
+
+        def correr():
+            try:
+                self._archivar(meses)
+            except Exception as e:
+                self.ultima["error"] = str(e)
+                print(">>> archivo: error al archivar:", e)
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=correr, name="archivo-gastos", daemon=True).start()
+
+    def _archivar(self, meses: Optional[int]) -> dict:
+        corte = corte_para(ARCHIVO_HORIZONTE_MESES if meses is None else meses)
+        avance = {"corte": corte.isoformat(), "iniciado_en": datetime.now().isoformat(timespec="seconds"),
+                  "filas": 0, "lotes": 0, "max_bloqueo_ms": 0.0, "segundos": 0.0, "terminado": False}
+        self.ultima = avance  # /admin/gastos/archivo muestra el avance mientras corre
+        t0 = time.perf_counter()
+        params = {"desde": 0, "corte": corte.isoformat()}
+        with self.engine.connect() as conn:
+            params["tope"] = conn.exec_driver_sql("SELECT COALESCE(MAX(id_gastos), 0) FROM main.gastos").scalar()
+            conn.rollback()
+            while not self._parar.is_set():
+                # 1. Copia: esta transacción solo escribe en el archivo frío
+                conn.exec_driver_sql("BEGIN")
+                hasta = conn.execute(_SIGUIENTE_LOTE, {**params, "lote": ARCHIVO_LOTE}).scalar()
+                if hasta is None:
+                    conn.rollback()
+                    break
+                rango = {**params, "hasta": hasta}
+                conn.execute(_COPIAR, rango)
+                conn.commit()
+                # 2. Totales y borrado: el único tramo que deja esperando a los escritores
+                t1 = time.perf_counter()
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                conn.execute(_RESUMIR, rango)
+                usuarios = conn.execute(_BORRAR, rango).scalars().all()
+                conn.execute(_OLVIDAR_SYNC, rango)
+                conn.commit()
+                for uid in set(usuarios):
+                    cache_metricas.invalidar(uid)
+                bloqueo_ms = round((time.perf_counter() - t1) * 1000, 3)
+                avance["max_bloqueo_ms"] = max(avance["max_bloqueo_ms"], bloqueo_ms)
+                avance["filas"] += len(usuarios)
+                avance["lotes"] += 1
+                params["desde"] = hasta
+                time.sleep(ARCHIVO_PAUSA_MS / 1000)
+        avance.update(segundos=round(time.perf_counter() - t0, 3), terminado=True)
+        return avance
+
+    def iniciar(self) -> None:
+        try:
+            self.asegurar_esquema()
+        except Exception as e:
+            print(">>> archivo: no se pudo crear archivo.gastos:", e)
+            return
+        if self.intervalo_s <= 0 or not self.disponible or self._hilo is not None:
+            return
+
+        def ciclo():
+            while not self._parar.wait(self.intervalo_s):
+                try:
+                    self.archivar()
+                except HTTPException:
+                    pass  # ya hay uno en curso (lanzado por la ruta)
+                except Exception as e:  # la próxima vuelta lo reintenta
+                    print(">>> archivo: error al archivar:", e)
+
+        self._hilo = threading.Thread(target=ciclo, name="archivo", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+
+    def estado(self) -> dict:
+        out = {
+            "disponible": self.disponible,
+            "archivo": ARCHIVO_DB,
+            "horizonte_meses": ARCHIVO_HORIZONTE_MESES,
+            "corte": corte_para(ARCHIVO_HORIZONTE_MESES).isoformat(),
+            "en_curso": self._lock.locked(),
+            "ultima": self.ultima or None,
+        }
+        if self.disponible:
+            with self.engine.connect() as conn:
+                out["filas_archivadas"] = conn.exec_driver_sql(
+                    "SELECT COALESCE(SUM(registros), 0) FROM gastos_mensuales_archivados").scalar()
+                # Lo borrado no achica el archivo: esas páginas las reutilizan las altas nuevas
+                libres = conn.exec_driver_sql("PRAGMA main.freelist_count").scalar()
+                pagina = conn.exec_driver_sql("PRAGMA main.page_size").scalar()
+            out["bytes_caliente"] = _tamano(self.engine.url.database)
+            out["bytes_libres_caliente"] = libres * pagina
+            out["bytes_frio"] = _tamano(ARCHIVO_DB)
+        return out
+
+
+archivo_gastos = ArchivoGastos(engine, ARCHIVO_INTERVALO_S)
+
+
+# =========================
+# Rutas /admin/gastos/*
+# =========================
+@router.get("/archivo")
+def estado_archivo():
+    return archivo_gastos.estado()
+
+
+@router.post("/archivar", status_code=202)
+def archivar(meses: Optional[int] = Query(None, ge=1, le=600,
+                                          description=f"Horizonte en meses (por defecto {ARCHIVO_HORIZONTE_MESES})")):
+    # En segundo plano: el avance se consulta en GET /admin/gastos/archivo
+    archivo_gastos.archivar_en_segundo_plano(meses)
+    return archivo_gastos.estado()
+
+
+def main_cli():
+    import argparse
+
+    from main import create_db_and_tables
+
+    ap = argparse.ArgumentParser(description="Mueve los gastos viejos al archivo frío (DATABASE_URL)")
+    ap.add_argument("--meses", type=int, default=ARCHIVO_HORIZONTE_MESES,
+                    help="Se archiva lo anterior al primer día del mes, N meses atrás")
+    args = ap.parse_args()
+    create_db_and_tables()
+    archivo_gastos.asegurar_esquema()
+    r = archivo_gastos.archivar(args.meses)
+    print(f"{r['filas']} gastos anteriores a {r['corte']} archivados en {r['lotes']} lotes, "
+          f"{r['segundos']:.1f} s (bloqueo máximo {r['max_bloqueo_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,101 @@
+# bench/arranque.py — tiempo hasta la primera request (cold start) y costo del esquema al arrancar
+#
+# Mide, sobre una DB generada con generar_datos.py:
+#   - uvicorn: desde lanzar el proceso hasta el primer 200 de /health, con la
+#     DB sin versionar (se aplican todas las migraciones) y ya al día;
+#   - en proceso: migrar() con la versión al día contra el create_all que se
+#     corría antes en cada arranque (reflexión de todas las tablas).
+#
+# Uso (desde backend/):  python bench/arranque.py [--usuarios 2000] [--repeticiones 5]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import BACKEND, generar_db, puerto_libre  # noqa: E402
+
+
+def primera_request(db_url: str) -> float:
+    puerto = puerto_libre()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=BACKEND, env=dict(os.environ, DATABASE_URL=db_url), stdout=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{puerto}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - t0
+            except httpx.TransportError:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn terminó antes de responder")
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _quitar_version(db_path: str) -> None:
+    import sqlite3
+
+    con = sqlite3.connect(db_path)
+    con.execute("DROP TABLE IF EXISTS schema_version")
+    con.commit()
+    con.close()
+
+
+def _en_proceso(db_url: str, repeticiones: int) -> dict:
+    os.environ["DATABASE_URL"] = db_url
+    sys.path.insert(0, str(BACKEND))
+    from sqlmodel import SQLModel
+
+    import main
+    import migraciones
+
+    def medir(fn) -> float:
+        tiempos = []
+        for _ in range(repeticiones):
+            main.engine.dispose()  # conexión nueva, como en un arranque
+            t0 = time.perf_counter()
+            fn()
+            tiempos.append(time.perf_counter() - t0)
+        return statistics.median(tiempos) * 1000
+
+    return {
+        "migrar_al_dia_ms": medir(lambda: migraciones.migrar(main.engine)),
+        "create_all_ms": medir(lambda: SQLModel.metadata.create_all(main.engine)),
+    }
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Tiempo hasta la primera request")
+    ap.add_argument("--usuarios", type=int, default=2000)
+    ap.add_argument("--repeticiones", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/arranque.sqlite3"
+        db_url = f"sqlite:///{db_path}"
+        generar_db(db_url, args.usuarios)
+
+        sin_version, al_dia = [], []
+        for _ in range(args.repeticiones):
+            _quitar_version(db_path)  # DB "legada": el runner revisa y registra todo
+            sin_version.append(primera_request(db_url))
+            al_dia.append(primera_request(db_url))
+        print(f"primera request, DB sin versionar: {statistics.median(sin_version) * 1000:7.0f} ms (mediana)")
+        print(f"primera request, DB al día:        {statistics.median(al_dia) * 1000:7.0f} ms (mediana)")
+        for k, v in _en_proceso(db_url, args.repeticiones).items():
+            print(f"{k:<18} {v:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,165 @@
+# bench/bench_analitica.py — cohortes en NumPy (analitica.py) vs el GROUP BY equivalente en SQL
+#
+# Sobre una DB generada con generar_datos.py mide:
+#   sql_sumas        GROUP BY estado, tipo_cultivo, anio, trimestre con SUM de las 7 categorías
+#   sql_percentiles  lo mismo + p10/p50/p90 por categoría (ROW_NUMBER() y COUNT() OVER, una
+#                    consulta por categoría; SQLite no tiene percentile_cont)
+#   snapshot_total   refresco completo de analitica (lectura de la DB + cálculo NumPy)
+#   snapshot_numpy   solo el cálculo sobre los arreglos ya cargados
+#   refresco_incr    refresco incremental tras insertar --nuevos gastos
+# y la latencia de /admin/analytics/cohortes (todas y filtrada) vía ASGI. Al final
+# verifica que SQL y NumPy den los mismos valores.
+#
+# Uso (desde backend/):  python bench/bench_analitica.py [--usuarios 10000] [--repeticiones 5]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db  # noqa: E402
+
+PERCENTILES = (10, 50, 90)
+
+_BASE = """
+    SELECT COALESCE(u.estado, '') AS estado, pc.tipo_cultivo, gt.anio, gt.trimestre, {columnas}
+    FROM gastos_trimestrales gt
+    JOIN usuario u ON u.id_usuario = gt.id_usuario
+    JOIN (SELECT DISTINCT p.id_usuario, c.tipo_cultivo
+          FROM cultivo c JOIN parcela p ON p.id_parcela = c.id_parcela) pc
+      ON pc.id_usuario = gt.id_usuario"""
+
+
+def _sql_sumas(campos) -> str:
+    sumas = ", ".join(f"SUM({c})" for c in campos)
+    return f"""SELECT estado, tipo_cultivo, anio, trimestre, COUNT(*), {sumas}
+        FROM ({_BASE.format(columnas=", ".join(f"gt.{c}" for c in campos))})
+        GROUP BY 1, 2, 3, 4"""
+
+
+def _sql_percentiles(campo: str) -> str:
+    # Interpolación lineal igual a la de NumPy: pos = q·(n-1) entre las filas floor(pos) y floor(pos)+1
+    cuantiles = []
+    for p in PERCENTILES:
+        pos = f"({p / 100} * (n - 1))"
+        cuantiles.append(
+            f"SUM(CASE WHEN rn = CAST({pos} AS INTEGER) THEN v * (1 - ({pos} - CAST({pos} AS INTEGER))) "
+            f"WHEN rn = CAST({pos} AS INTEGER) + 1 THEN v * ({pos} - CAST({pos} AS INTEGER)) ELSE 0 END)"
+        )
+    return f"""
+        WITH r AS (
+            SELECT estado, tipo_cultivo, anio, trimestre, v,
+                   ROW_NUMBER() OVER w - 1 AS rn,
+                   COUNT(*) OVER (PARTITION BY estado, tipo_cultivo, anio, trimestre) AS n
+            FROM ({_BASE.format(columnas=f"gt.{campo} AS v")})
+            WINDOW w AS (PARTITION BY estado, tipo_cultivo, anio, trimestre ORDER BY v)
+        )
+        SELECT estado, tipo_cultivo, anio, trimestre, COUNT(*), SUM(v), {", ".join(cuantiles)}
+        FROM r GROUP BY 1, 2, 3, 4"""
+
+
+def _mediana_ms(fn, repeticiones: int):
+    tiempos, resultado = [], None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn()
+        tiempos.append(time.perf_counter() - t0)
+    return statistics.median(tiempos) * 1000, resultado
+
+
+async def _latencia(app, params: dict, n: int) -> float:
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as c:
+        await c.get("/admin/analytics/cohortes", params=params)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            r = await c.get("/admin/analytics/cohortes", params=params)
+            assert r.status_code == 200, r.text
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Analítica por cohortes: NumPy vs SQL")
+    ap.add_argument("--usuarios", type=int, default=10000)
+    ap.add_argument("--repeticiones", type=int, default=5)
+    ap.add_argument("--nuevos", type=int, default=500, help="Gastos insertados antes del refresco incremental")
+    ap.add_argument("--requests", type=int, default=50)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/analitica.sqlite3"
+    generar_db(db_url, args.usuarios)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import random
+
+    from sqlmodel import Session
+
+    import main
+    from analitica import Snapshot, analitica
+
+    main.on_startup()
+    campos = main.GASTO_CAMPOS
+    filas = []
+
+    def sql(consultas):
+        with main.engine.connect() as conn:
+            return [conn.exec_driver_sql(q).all() for q in consultas]
+
+    filas.append(("sql_sumas", *_mediana_ms(lambda: sql([_sql_sumas(campos)]), args.repeticiones)))
+    filas.append(("sql_percentiles", *_mediana_ms(
+        lambda: sql([_sql_percentiles(c) for c in campos]), args.repeticiones)))
+    filas.append(("snapshot_total", *_mediana_ms(lambda: analitica.refrescar(completo=True),
+                                                 args.repeticiones)))
+    snap = analitica.snapshot
+    filas.append(("snapshot_numpy", _mediana_ms(lambda: Snapshot(snap.base, snap.marca, {
+        "etiquetas_estado": snap.etiquetas_estado, "estado_de": snap.estado_de,
+        "etiquetas_cultivo": snap.etiquetas_cultivo, "par_uid": snap.pares[0], "par_cultivo": snap.pares[1],
+    }), args.repeticiones)[0], None))
+
+    rng = random.Random(7)
+    with Session(main.engine) as s:
+        ids = s.exec(main.select(main.Usuario.id_usuario)).all()
+        for _ in range(args.nuevos):
+            main._insertar_gastos(s, {"id_usuario": rng.choice(ids),
+                                      **{c: round(rng.uniform(0, 3000), 2) for c in campos}})
+    t0 = time.perf_counter()
+    analitica.refrescar()
+    filas.append(("refresco_incr", (time.perf_counter() - t0) * 1000, None))
+
+    todas = asyncio.run(_latencia(main.app, {}, args.requests))
+    filtrada = asyncio.run(_latencia(main.app, {"estado": "Veracruz", "tipo_cultivo": "Maíz",
+                                                "categoria": "gasto_fertilizantes"}, args.requests))
+
+    print(f"{'cálculo':<16} {'ms':>9}")
+    for nombre, ms, _ in filas:
+        print(f"{nombre:<16} {ms:>9.1f}")
+    print(f"\nGET /admin/analytics/cohortes (todas)      {todas:8.2f} ms/req")
+    print(f"GET /admin/analytics/cohortes (filtrada)   {filtrada:8.2f} ms/req")
+    print("snapshot:", analitica.snapshot.resumen())
+
+    # Verificación: mismas cohortes, n, sumas y percentiles (con los gastos nuevos incluidos)
+    snap = analitica.snapshot
+    items = {(i["estado"] or "", i["tipo_cultivo"], i["anio"], i["trimestre"]): i
+             for i in snap.cohortes(None, None, None, None, campos)}
+    dif = 0.0
+    for campo, resultado in zip(campos, sql([_sql_percentiles(c) for c in campos])):
+        assert len(resultado) == len(items), (len(resultado), len(items))
+        for estado, cultivo, anio, trimestre, n, suma, *cuantiles in resultado:
+            item = items[(estado, cultivo, anio, trimestre)]
+            assert item["usuarios"] == n
+            g = item["gastos"][campo]
+            dif = max(dif, abs(g["suma"] - suma), *(abs(g[f"p{p}"] - v) for p, v in zip(PERCENTILES, cuantiles)))
+    print(f"SQL y NumPy coinciden en {len(items)} cohortes (diferencia máxima {dif:.3f})")
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,198 @@
+# bench/bench_api.py — latencia (p50/p95/p99) y throughput de la API por escenario
+#
+# Para cada tamaño de dataset genera una DB temporal (generar_datos.py) y corre
+# los escenarios contra la app real:
+#   inproc  FastAPI en el mismo proceso vía httpx.ASGITransport (sin red)
+#   http    uvicorn en un subproceso, clientes httpx por TCP
+# Los resultados se guardan en JSON con el commit actual para comparar corridas.
+# Requiere httpx (además de las dependencias de la API).
+#
+# Uso (desde backend/):
+#   python bench/bench_api.py --tamanos 1000,10000 --salida bench/resultados.json
+#   python bench/bench_api.py --tamanos 1000 --comparar bench/resultados.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import BACKEND, generar_db, levantar_uvicorn, medir, puerto_libre  # noqa: E402
+from generar_datos import APELLIDOS, CONTRASENA_DEMO, ESTADOS  # noqa: E402
+
+
+def _escenarios(ctx: dict, rng: random.Random) -> dict:
+    usuarios = ctx["usuarios"]
+
+    def usuario():
+        return rng.choice(usuarios)
+
+    return {
+        "login": lambda c, i: c.post("/auth/login", json={
+            "identificador": usuario()[1], "contrasena": CONTRASENA_DEMO}),
+        "registro": lambda c, i: c.post("/auth/register", json={
+            "nombre_completo": f"Bench {rng.choice(APELLIDOS)}", "contrasena": CONTRASENA_DEMO,
+            "telefono": uuid.uuid4().hex[:12], "estado": rng.choice(list(ESTADOS))}),
+        "metrics_parcelas": lambda c, i: c.get(f"/metrics/parcelas-cultivos/{usuario()[0]}"),
+        "metrics_gastos": lambda c, i: c.get(
+            f"/metrics/gastos-trimestrales/{usuario()[0]}", params={"serie": "trimestre"}),
+        "usuarios_busqueda": lambda c, i: c.get(
+            "/usuarios", params={"q": rng.choice(APELLIDOS)[:4], "limit": 50}),
+        "reporte_cultivos": lambda c, i: c.get("/reportes/cultivos-por-usuario", params={
+            "limit": 200, "formato": "ndjson", "estado": rng.choice(list(ESTADOS))}),
+    }
+
+
+def _contexto(engine) -> dict:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        filas = conn.execute(text(
+            "SELECT id_usuario, telefono FROM usuario WHERE telefono IS NOT NULL "
+            "ORDER BY random() LIMIT 2000"
+        )).all()
+    return {"usuarios": [tuple(f) for f in filas]}
+
+
+async def _correr(client: httpx.AsyncClient, ctx: dict, args) -> list:
+    rng = random.Random(args.semilla)
+    resultados = []
+    for nombre, peticion in _escenarios(ctx, rng).items():
+        if args.escenarios and nombre not in args.escenarios:
+            continue
+        await medir(lambda i: peticion(client, i), min(20, args.requests), args.concurrencia)  # calentamiento
+        r = await medir(lambda i: peticion(client, i), args.requests, args.concurrencia)
+        resultados.append({"escenario": nombre, **r})
+    return resultados
+
+
+def _worker_inproc(args) -> None:
+    """Corre en un subproceso con DATABASE_URL ya fijado (main crea su engine al importarse)."""
+    sys.path.insert(0, str(BACKEND))
+    import main
+
+    main.on_startup()
+    ctx = _contexto(main.engine)
+
+    async def correr():
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=120) as c:
+            return await _correr(c, ctx, args)
+
+    print(json.dumps(asyncio.run(correr())))
+
+
+def _inproc(db_url: str, env: dict, args) -> list:
+    cmd = [sys.executable, __file__, "--worker", "--requests", str(args.requests),
+           "--concurrencia", str(args.concurrencia), "--semilla", str(args.semilla)]
+    if args.escenarios:
+        cmd += ["--escenarios", ",".join(args.escenarios)]
+    salida = subprocess.run(cmd, cwd=BACKEND, env=dict(os.environ, DATABASE_URL=db_url, **env),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def _http(db_url: str, env: dict, args) -> list:
+    sys.path.insert(0, str(BACKEND))
+    from db import crear_engine
+
+    ctx = _contexto(crear_engine(db_url))
+    puerto = puerto_libre()
+    proc = levantar_uvicorn(dict(DATABASE_URL=db_url, **env), puerto)
+    try:
+        async def correr():
+            limites = httpx.Limits(max_connections=args.concurrencia)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", limits=limites,
+                                         timeout=120) as c:
+                return await _correr(c, ctx, args)
+        return asyncio.run(correr())
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def _comparar(actual: list, archivo: str) -> None:
+    previo = {(r["tamano"], r["modo"], r["escenario"]): r
+              for r in json.loads(Path(archivo).read_text(encoding="utf-8"))["resultados"]}
+    print(f"\nvs {archivo}")
+    print(f"{'tamaño':>8} {'modo':<7} {'escenario':<18} {'req/s':>8} {'Δ req/s':>8} {'p95 ms':>8} {'Δ p95':>8}")
+    for r in actual:
+        p = previo.get((r["tamano"], r["modo"], r["escenario"]))
+        if not p:
+            continue
+        d_rps = (r["rps"] / p["rps"] - 1) * 100 if p["rps"] else 0.0
+        d_p95 = (r["p95_ms"] / p["p95_ms"] - 1) * 100 if p["p95_ms"] else 0.0
+        print(f"{r['tamano']:>8} {r['modo']:<7} {r['escenario']:<18} {r['rps']:>8.1f} {d_rps:>+7.1f}%"
+              f" {r['p95_ms']:>8.1f} {d_p95:>+7.1f}%")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de latencia/throughput de la API FINTIVA")
+    ap.add_argument("--tamanos", default="1000,10000", help="Usuarios por dataset, separados por coma")
+    ap.add_argument("--modos", default="inproc,http")
+    ap.add_argument("--escenarios", default="", help="Subconjunto, separados por coma (default: todos)")
+    ap.add_argument("--requests", type=int, default=300, help="Requests por escenario")
+    ap.add_argument("--concurrencia", type=int, default=8)
+    ap.add_argument("--semilla", type=int, default=42)
+    ap.add_argument("--sin-cache", action="store_true", help="METRICS_CACHE_MAX=0")
+    ap.add_argument("--db-async", action="store_true", help="DB_ASYNC=1")
+    ap.add_argument("--salida", help="Archivo JSON de resultados")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    args.escenarios = [e for e in args.escenarios.split(",") if e]
+
+    if args.worker:
+        _worker_inproc(args)
+        return
+
+    env = {"METRICS_CACHE_MAX": "0"} if args.sin_cache else {}
+    if args.db_async:
+        env["DB_ASYNC"] = "1"
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for tamano in (int(t) for t in args.tamanos.split(",")):
+            db_url = f"sqlite:///{tmp}/bench_{tamano}.sqlite3"
+            print(f"Generando {tamano} usuarios...", file=sys.stderr)
+            generar_db(db_url, tamano, args.semilla)
+            for modo in args.modos.split(","):
+                corrida = _inproc(db_url, env, args) if modo == "inproc" else _http(db_url, env, args)
+                resultados += [{"tamano": tamano, "modo": modo, **r} for r in corrida]
+
+    print(f"{'tamaño':>8} {'modo':<7} {'escenario':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5}")
+    for r in resultados:
+        print(f"{r['tamano']:>8} {r['modo']:<7} {r['escenario']:<18} {r['rps']:>8.1f} {r['p50_ms']:>8.1f}"
+              f" {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>5}")
+
+    if args.salida:
+        Path(args.salida).write_text(json.dumps({
+            "commit": _commit(),
+            "fecha": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "parametros": {k: v for k, v in vars(args).items() if k not in ("worker", "salida", "comparar")},
+            "resultados": resultados,
+        }, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.comparar:
+        _comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# bench/bench_archivo.py — tabla caliente chica: antes y después de archivar gastos viejos
+#
+# Sobre una DB generada con generar_datos.py (--anios de historial) mide:
+#   tamaño de gastos + idx_gastos_usuario_creado (dbstat) y filas en la tabla caliente
+#   GET /usuarios/{id}/gastos, con y sin include_archived, y la serie mensual de
+#   /metrics/gastos-trimestrales, sobre --requests usuarios distintos (sin caché)
+#   altas de gastos (un commit cada una) desde otro hilo mientras corre el job:
+#   p50/p99/máx contra las mismas altas sin job
+# y verifica que las métricas respondan lo mismo antes y después.
+#
+# Uso (desde backend/):  python bench/bench_archivo.py [--usuarios 5000] [--anios 6] [--meses 12]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db, percentil  # noqa: E402
+
+
+def _tamano_caliente(conn) -> tuple:
+    paginas = dict(conn.exec_driver_sql(
+        "SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ('gastos', 'idx_gastos_usuario_creado') "
+        "GROUP BY name").all())
+    filas = conn.exec_driver_sql("SELECT COUNT(*) FROM gastos").scalar()
+    return filas, paginas.get("gastos", 0), paginas.get("idx_gastos_usuario_creado", 0)
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark del archivo frío de gastos")
+    ap.add_argument("--usuarios", type=int, default=5000)
+    ap.add_argument("--anios", type=int, default=6)
+    ap.add_argument("--meses", type=int, default=12, help="Horizonte del archivado")
+    ap.add_argument("--requests", type=int, default=300)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/archivo.sqlite3"
+    generar_db(db_url, args.usuarios, anios=args.anios)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["SCORE_REFRESCO_S"] = "0"
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+
+    import main
+    from archivo import archivo_gastos
+
+    rng = random.Random(5)
+    c = TestClient(main.app)
+    c.__enter__()
+
+    def lecturas() -> dict:
+        muestra = rng.sample(range(1, args.usuarios + 1), min(args.requests, args.usuarios))
+        casos = {
+            "gastos": ("/usuarios/{}/gastos", {}),
+            "gastos+archivados": ("/usuarios/{}/gastos", {"include_archived": "true"}),
+            "serie mensual": ("/metrics/gastos-trimestrales/{}", {"serie": "mes"}),
+        }
+        out = {}
+        for nombre, (ruta, params) in casos.items():
+            t0 = time.perf_counter()
+            for uid in muestra:
+                main.cache_metricas.invalidar(uid)
+                c.get(ruta.format(uid), params=params).raise_for_status()
+            out[nombre] = (time.perf_counter() - t0) / len(muestra) * 1000
+        return out
+
+    # Las altas del bench van a otros usuarios: las métricas de estos no deben moverse
+    verificados = range(1, min(args.usuarios // 2, 200) + 1)
+
+    def foto_metricas() -> list:
+        out = []
+        for uid in verificados:
+            main.cache_metricas.invalidar(uid)
+            items = c.get(f"/metrics/gastos-trimestrales/{uid}", params={"serie": "mes"}).json()["items"]
+            out.append([(i["periodo"], round(i["total"], 6)) for i in items])  # otro orden de suma
+        return out
+
+    def altas(duracion_s: float, parar: threading.Event) -> list:
+        latencias = []
+        fin = time.monotonic() + duracion_s
+        with Session(main.engine) as s:
+            while time.monotonic() < fin and not parar.is_set():
+                t0 = time.perf_counter()
+                uid = rng.randint(verificados.stop, args.usuarios)
+                main._insertar_gastos(s, {"id_usuario": uid, "gasto_agua": 10.0})
+                latencias.append(time.perf_counter() - t0)
+        return sorted(latencias)
+
+    def resumen_altas(lat: list) -> str:
+        return (f"{len(lat):>6} altas  p50 {percentil(lat, 50) * 1000:6.2f} ms  "
+                f"p99 {percentil(lat, 99) * 1000:6.2f} ms  máx {lat[-1] * 1000:6.2f} ms")
+
+    with main.engine.connect() as conn:
+        antes = _tamano_caliente(conn)
+    lect_antes = lecturas()
+    metricas_antes = foto_metricas()
+    base = altas(3.0, threading.Event())
+
+    # El job y, en paralelo, altas durante todo lo que dure
+    parar, durante = threading.Event(), []
+    hilo = threading.Thread(target=lambda: durante.extend(altas(3600, parar)))
+    hilo.start()
+    r = archivo_gastos.archivar(args.meses)
+    parar.set()
+    hilo.join()
+
+    with main.engine.connect() as conn:
+        despues = _tamano_caliente(conn)
+    lect_despues = lecturas()
+    iguales = foto_metricas() == metricas_antes
+
+    print(f"archivado: {r['filas']} filas anteriores a {r['corte']} en {r['lotes']} lotes, "
+          f"{r['segundos']:.2f} s, bloqueo máximo {r['max_bloqueo_ms']:.1f} ms")
+    print(f"\n{'tabla caliente':<10} {'filas':>9} {'gastos KiB':>11} {'índice KiB':>11}")
+    for nombre, (n, t, i) in (("antes", antes), ("después", despues)):
+        print(f"{nombre:<10} {n:>9} {t / 1024:>11.0f} {i / 1024:>11.0f}")
+    print(f"\n{'lectura':<20} {'antes ms':>9} {'después ms':>11}")
+    for nombre in lect_antes:
+        print(f"{nombre:<20} {lect_antes[nombre]:>9.2f} {lect_despues[nombre]:>11.2f}")
+    print("\naltas sin job     ", resumen_altas(base))
+    print("altas durante job ", resumen_altas(durante))
+    print("\nserie mensual igual antes y después:", "sí" if iguales else "NO")
+    c.__exit__(None, None, None)
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+# bench/bench_auth.py — costo por request de verificar el Bearer token
+#
+# Compara, por llamada:
+#   decode+db     jwt.decode + session.get(Usuario) (la versión ingenua)
+#   decode        solo jwt.decode (HS256)
+#   cache         verificar_token con los claims ya en caché (camino normal)
+#   current_user  la dependencia completa (caché + revocación + UsuarioActual)
+# y de punta a punta vía ASGI: GET /health (sin auth, síncrona) y GET /auth/me.
+#
+# Uso (desde backend/):  python bench/bench_auth.py [--iteraciones 20000] [--requests 2000]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _por_llamada(fn, n: int) -> float:
+    fn()  # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6  # µs
+
+
+async def _por_request(client, ruta: str, headers: dict, n: int) -> float:
+    await client.get(ruta, headers=headers)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        r = await client.get(ruta, headers=headers)
+        assert r.status_code == 200, r.text
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Microbenchmark de verificación de JWT")
+    ap.add_argument("--iteraciones", type=int, default=20000)
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/auth.sqlite3"  # antes de importar main
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import httpx
+    from fastapi.security import HTTPAuthorizationCredentials
+    from jose import jwt
+    from sqlmodel import Session
+
+    import main
+
+    main.on_startup()
+    with Session(main.engine) as s:
+        u = main.Usuario(nombre_completo="Bench Auth", contrasena_hash="x", telefono="5550000000")
+        s.add(u)
+        s.commit()
+        s.refresh(u)
+        token = main.create_access_token({"sub": str(u.id_usuario), "name": u.nombre_completo})
+
+    def decode_db():
+        claims = jwt.decode(token, main.SECRET_KEY, algorithms=[main.ALGORITHM])
+        with Session(main.engine) as s:
+            s.get(main.Usuario, int(claims["sub"]))
+
+    filas = [
+        ("decode+db", _por_llamada(decode_db, args.iteraciones // 10)),
+        ("decode", _por_llamada(lambda: jwt.decode(token, main.SECRET_KEY, algorithms=[main.ALGORITHM]),
+                                args.iteraciones)),
+        ("cache", _por_llamada(lambda: main.verificar_token(token), args.iteraciones)),
+    ]
+    credenciales = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    async def dependencia():
+        t0 = time.perf_counter()
+        for _ in range(args.iteraciones):
+            await main.current_user(credenciales)
+        return (time.perf_counter() - t0) / args.iteraciones * 1e6
+
+    filas.append(("current_user", asyncio.run(dependencia())))
+
+    async def e2e():
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as c:
+            base = await _por_request(c, "/health", {}, args.requests)
+            auth = await _por_request(c, "/auth/me", {"Authorization": f"Bearer {token}"}, args.requests)
+        return base, auth
+
+    base, auth = asyncio.run(e2e())
+    print(f"{'verificación':<14} {'µs/llamada':>11}")
+    for nombre, us in filas:
+        print(f"{nombre:<14} {us:>11.1f}")
+    print(f"\n/health  {base:8.1f} µs/req\n/auth/me {auth:8.1f} µs/req")
+    print("cache de claims:", main.cache_claims.estadisticas())
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
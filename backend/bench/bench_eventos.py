@@ -0,0 +1,185 @@
+# bench/bench_eventos.py — dashboards abiertos: polling de /metrics/* vs deltas por SSE
+#
+# Levanta uvicorn sobre una DB generada con generar_datos.py y abre --dashboards
+# dashboards (un usuario cada uno) durante --segundos, mientras otro cliente da de
+# alta --escrituras-por-s gastos de esos usuarios. Dos modos:
+#   polling  cada dashboard pide las dos métricas cada --intervalo s (con If-None-Match)
+#   sse      las pide una vez y luego escucha /usuarios/{id}/eventos
+# y al final, sin escrituras, --segundos más con los streams abiertos (dashboards ociosos).
+# Reporta requests y queries SQL de las rutas de métricas después de la carga
+# inicial (la misma en ambos modos), y el retraso entre el alta y el momento en
+# que el dashboard se entera.
+#
+# Uso (desde backend/):  python bench/bench_eventos.py [--usuarios 2000] [--dashboards 200]
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db, levantar_uvicorn, percentil, puerto_libre  # noqa: E402
+
+METRICAS = ("/metrics/parcelas-cultivos/{}", "/metrics/gastos-trimestrales/{}")
+_QUERIES_METRICAS = re.compile(
+    r'^fintiva_db_queries_total\{method="GET",route="/metrics/(?:parcelas-cultivos|gastos-trimestrales)/'
+    r'[^"]+"\} (\d+)$', re.M)
+
+
+async def queries_metricas(c: httpx.AsyncClient) -> int:
+    texto = (await c.get("/metrics/prometheus")).text
+    return sum(int(n) for n in _QUERIES_METRICAS.findall(texto))
+
+
+async def escritor(c: httpx.AsyncClient, usuarios: list, por_s: float, segundos: float,
+                   altas: dict, rng: random.Random) -> None:
+    """Altas de gastos a ritmo fijo; altas[uid] = momento en que se envió la primera no vista."""
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        uid = rng.choice(usuarios)
+        altas.setdefault(uid, time.monotonic())
+        (await c.post("/gastos", json={"id_usuario": uid, "gasto_agua": 10.0})).raise_for_status()
+        await asyncio.sleep(1 / por_s)
+
+
+async def modo_polling(base: str, usuarios: list, args, rng) -> dict:
+    altas, retrasos, estado = {}, [], {"requests": 0, "304": 0}
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=30) as c:
+        etags = {uid: {} for uid in usuarios}
+
+        async def dashboard(uid: int, fin: float) -> None:
+            await asyncio.sleep(rng.uniform(0, args.intervalo))  # no todos a la vez
+            while time.monotonic() < fin:
+                cambio = False
+                for ruta in METRICAS:
+                    r = await c.get(ruta.format(uid), headers={"If-None-Match": etags[uid][ruta]})
+                    estado["requests"] += 1
+                    if r.status_code == 304:
+                        estado["304"] += 1
+                    else:
+                        cambio = True
+                        etags[uid][ruta] = r.headers["etag"]
+                if cambio and uid in altas:
+                    retrasos.append(time.monotonic() - altas.pop(uid))
+                await asyncio.sleep(args.intervalo)
+
+        # Carga inicial, igual que en sse
+        for uid in usuarios:
+            for ruta in METRICAS:
+                etags[uid][ruta] = (await c.get(ruta.format(uid))).headers["etag"]
+        q0 = await queries_metricas(c)
+        fin = time.monotonic() + args.segundos
+        await asyncio.gather(escritor(c, usuarios, args.escrituras_por_s, args.segundos, altas, rng),
+                             *(dashboard(uid, fin) for uid in usuarios))
+        q_activo = await queries_metricas(c) - q0
+        r_activo, r304 = estado["requests"], estado["304"]
+        # Ociosos: nadie escribe, los dashboards (ya al día) siguen preguntando
+        for uid in usuarios:
+            for ruta in METRICAS:
+                etags[uid][ruta] = (await c.get(ruta.format(uid))).headers["etag"]
+        q1, r1 = await queries_metricas(c), estado["requests"]
+        fin = time.monotonic() + args.segundos
+        await asyncio.gather(*(dashboard(uid, fin) for uid in usuarios))
+        q_ocioso = await queries_metricas(c) - q1
+    return {"requests": r_activo, "304": r304, "queries": q_activo, "retrasos": sorted(retrasos),
+            "requests_ocioso": estado["requests"] - r1, "queries_ocioso": q_ocioso}
+
+
+async def modo_sse(base: str, usuarios: list, args, rng) -> dict:
+    altas, retrasos, eventos = {}, [], [0]
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=httpx.Timeout(30, read=None)) as c:
+        q0 = await queries_metricas(c)
+        listos = asyncio.Semaphore(0)
+
+        async def dashboard(uid: int) -> None:
+            for ruta in METRICAS:
+                (await c.get(ruta.format(uid))).raise_for_status()
+            async with c.stream("GET", f"/usuarios/{uid}/eventos", headers=args.tokens[uid]) as r:
+                listos.release()
+                async for linea in r.aiter_lines():
+                    if linea.startswith("event: gastos-trimestrales"):
+                        eventos[0] += 1
+                        if uid in altas:
+                            retrasos.append(time.monotonic() - altas.pop(uid))
+
+        tareas = [asyncio.create_task(dashboard(uid)) for uid in usuarios]
+        for _ in usuarios:
+            await listos.acquire()
+        q_inicial = await queries_metricas(c) - q0
+        q1 = await queries_metricas(c)
+        await escritor(c, usuarios, args.escrituras_por_s, args.segundos, altas, rng)
+        await asyncio.sleep(0.5)
+        q_activo = await queries_metricas(c) - q1
+        q2 = await queries_metricas(c)
+        await asyncio.sleep(args.segundos)
+        q_ocioso = await queries_metricas(c) - q2
+        estadisticas = (await c.get("/metrics/eventos")).json()
+        for t in tareas:
+            t.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+    return {"requests": 0, "queries_inicial": q_inicial, "queries": q_activo,
+            "eventos": eventos[0], "retrasos": sorted(retrasos), "requests_ocioso": 0,
+            "queries_ocioso": q_ocioso, "canal": estadisticas}
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark de polling vs SSE para el dashboard")
+    ap.add_argument("--usuarios", type=int, default=2000)
+    ap.add_argument("--dashboards", type=int, default=200)
+    ap.add_argument("--segundos", type=float, default=15)
+    ap.add_argument("--intervalo", type=float, default=5, help="Polling: segundos entre refrescos")
+    ap.add_argument("--escrituras-por-s", type=float, default=5)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/eventos.sqlite3"
+    generar_db(db_url, args.usuarios)
+    rng = random.Random(7)
+    usuarios = rng.sample(range(1, args.usuarios + 1), args.dashboards)
+    # El stream pide el token del propio usuario (misma SECRET_KEY que el servidor)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from main import create_access_token
+
+    args.tokens = {uid: {"authorization": "Bearer " + create_access_token({"sub": str(uid)})}
+                   for uid in usuarios}
+
+    resultados = {}
+    for modo, fn in (("polling", modo_polling), ("sse", modo_sse)):
+        puerto = puerto_libre()
+        proc = levantar_uvicorn({"DATABASE_URL": db_url, "SCORE_REFRESCO_S": "0",
+                                 "ANALITICA_REFRESCO_S": "0"}, puerto)
+        try:
+            resultados[modo] = asyncio.run(fn(f"http://127.0.0.1:{puerto}", usuarios, args, rng))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    p, s = resultados["polling"], resultados["sse"]
+    print(f"{args.dashboards} dashboards, {args.segundos:.0f} s con {args.escrituras_por_s:g} altas/s "
+          f"y {args.segundos:.0f} s ociosos; polling cada {args.intervalo:g} s")
+    print(f"\n{'':<26} {'polling':>10} {'sse':>10}")
+    print(f"{'requests de métricas':<26} {p['requests']:>10} {s['requests']:>10}")
+    print(f"{'  de ellas 304':<26} {p['304']:>10} {'-':>10}")
+    print(f"{'queries (con altas)':<26} {p['queries']:>10} {s['queries']:>10}")
+    print(f"{'requests (ociosos)':<26} {p['requests_ocioso']:>10} {s['requests_ocioso']:>10}")
+    print(f"{'queries (ociosos)':<26} {p['queries_ocioso']:>10} {s['queries_ocioso']:>10}")
+    for nombre, r in (("polling", p), ("sse", s)):
+        ret = r["retrasos"]
+        print(f"retraso alta -> dashboard {nombre:<8} p50 {percentil(ret, 50) * 1000:8.1f} ms  "
+              f"p99 {percentil(ret, 99) * 1000:8.1f} ms  ({len(ret)} muestras)")
+    print(f"\nsse: {s['queries_inicial']} queries de la carga inicial, {s['eventos']} eventos recibidos; "
+          f"canal {s['canal']}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
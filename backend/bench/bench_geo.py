@@ -0,0 +1,112 @@
+# bench/bench_geo.py — parcelas por zona: parsear todo en Python vs columnas + R*Tree
+#
+# Sobre una DB generada con generar_datos.py compara, por consulta:
+#   python   leer ubicacion/tamano de todas las parcelas y parsearlas (lo de antes)
+#   scan     las rutas actuales sin R*Tree (filtro de latitud/longitud sobre parcela)
+#   rtree    las rutas actuales con parcela_geo
+# para /parcelas/cercanas (radio y caja) y /parcelas/mapa (zona y país), y verifica
+# que los tres den el mismo resultado.
+#
+# Uso (desde backend/):  python bench/bench_geo.py [--usuarios 50000] [--requests 50]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db  # noqa: E402
+
+CONSULTAS = {
+    "radio 25 km": ("/parcelas/cercanas", {"lat": 19.54, "lon": -96.91, "radio_km": 25, "limit": 1000}),
+    "caja 1°x1°": ("/parcelas/cercanas", {"sur": 19, "oeste": -97.5, "norte": 20, "este": -96.5, "limit": 1000}),
+    "mapa 0.1°": ("/parcelas/mapa", {"sur": 19.5, "oeste": -97, "norte": 19.6, "este": -96.9, "celda": 0.01}),
+    "mapa zona 2°": ("/parcelas/mapa", {"sur": 18.5, "oeste": -98, "norte": 20.5, "este": -96, "celda": 0.1}),
+    "mapa país": ("/parcelas/mapa", {"sur": 14, "oeste": -118, "norte": 33, "este": -86, "celda": 0.5}),
+}
+
+
+def _en_python(main, geo, ruta: str, p: dict):
+    """Lo que había que hacer sin columnas numéricas: leer y parsear todas las parcelas."""
+    with main.engine.connect() as conn:
+        filas = conn.exec_driver_sql("SELECT id_parcela, ubicacion, tamano FROM parcela").all()
+    puntos = []
+    for id_parcela, ubicacion, tamano in filas:
+        d = geo.campos_geo(ubicacion, tamano)
+        if d["latitud"] is not None:
+            puntos.append((id_parcela, d["latitud"], d["longitud"], d["hectareas"] or 0.0))
+    if "radio_km" in p:
+        cerca = sorted((geo.distancia_km(p["lat"], p["lon"], a, b), i) for i, a, b, _ in puntos)
+        return [i for d, i in cerca if d <= p["radio_km"]][:p["limit"]]
+    dentro = [(i, a, b, h) for i, a, b, h in puntos
+              if p["sur"] <= a <= p["norte"] and p["oeste"] <= b <= p["este"]]
+    if ruta.endswith("cercanas"):
+        return sorted(i for i, *_ in dentro)[:p["limit"]]
+    filas_g, columnas_g = geo.grilla((p["sur"], p["oeste"], p["norte"], p["este"]), p["celda"])
+    celdas = {}
+    for _, a, b, _h in dentro:
+        clave = (min(int((a - p["sur"]) / p["celda"]), filas_g - 1),
+                 min(int((b - p["oeste"]) / p["celda"]), columnas_g - 1))
+        celdas[clave] = celdas.get(clave, 0) + 1
+    return sorted(celdas.items())
+
+
+def _de_respuesta(ruta: str, cuerpo):
+    if ruta.endswith("cercanas"):
+        return [f["id_parcela"] for f in cuerpo]
+    return [((i["fila"], i["columna"]), i["parcelas"]) for i in cuerpo["items"]]
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark de consultas por zona")
+    ap.add_argument("--usuarios", type=int, default=50000)
+    ap.add_argument("--requests", type=int, default=50)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/geo.sqlite3"
+    generar_db(db_url, args.usuarios)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["SCORE_REFRESCO_S"] = "0"
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from fastapi.testclient import TestClient
+
+    import geo
+    import main
+
+    c = TestClient(main.app)
+    c.__enter__()
+    with main.engine.connect() as conn:
+        n_parcelas = conn.exec_driver_sql("SELECT COUNT(*) FROM parcela").scalar()
+
+    def medir(fn) -> tuple:
+        r = fn()
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            fn()
+        return (time.perf_counter() - t0) / args.requests * 1000, r
+
+    filas = []
+    for nombre, (ruta, params) in CONSULTAS.items():
+        ms_py, esperado = medir(lambda: _en_python(main, geo, ruta, params))
+        tiempos = {}
+        for modo, activo in (("scan", False), ("rtree", True)):
+            main.parcela_geo_activo = activo
+            ms, r = medir(lambda: c.get(ruta, params=params))
+            assert _de_respuesta(ruta, r.json()) == esperado, (nombre, modo)
+            tiempos[modo] = ms
+        filas.append((nombre, len(esperado), ms_py, tiempos["scan"], tiempos["rtree"]))
+
+    print(f"{n_parcelas} parcelas; resultados iguales en los tres modos")
+    print(f"{'consulta':<14} {'filas':>6} {'python ms':>10} {'scan ms':>9} {'rtree ms':>9}")
+    for nombre, n, py, scan, rtree in filas:
+        print(f"{nombre:<14} {n:>6} {py:>10.2f} {scan:>9.2f} {rtree:>9.2f}")
+    c.__exit__(None, None, None)
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,104 @@
+# bench/bench_listas.py — listas de 1k filas: ORM + response_model vs columnas + orjson
+#
+# Compara, vía ASGI y sobre una DB generada con generar_datos.py:
+#   antes      select(Modelo) con response_model=List[Modelo] (la versión anterior,
+#              montada aquí en /antes/...): objetos ORM, validación y serialización Pydantic
+#   lean       la ruta actual: tuplas de las columnas pedidas serializadas con orjson
+#   fields     la ruta actual con un subconjunto de columnas
+#   gzip / br  la ruta actual con Accept-Encoding (br solo si está instalado brotli)
+# para GET /usuarios?limit=1000 y GET /usuarios/{id}/gastos con 1000 gastos.
+#
+# Uso (desde backend/):  python bench/bench_listas.py [--requests 200]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db  # noqa: E402
+
+
+async def _medir(c, ruta: str, params: dict, headers: dict, n: int) -> tuple:
+    r = await c.get(ruta, params=params, headers=headers)
+    assert r.status_code == 200, r.text
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await c.get(ruta, params=params, headers=headers)
+    return (time.perf_counter() - t0) / n * 1000, int(r.headers["content-length"])  # bytes en el cable
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Listas de 1k filas antes/después")
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/listas.sqlite3"
+    generar_db(db_url, 1500)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["SCORE_REFRESCO_S"] = "0"
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import httpx
+    from fastapi import Depends
+    from sqlmodel import Session, select
+
+    import main
+    import respuestas
+
+    main.on_startup()
+    id_usuario = 1
+    with main.engine.begin() as conn:
+        conn.execute(main.Gastos.__table__.delete().where(main.Gastos.id_usuario == id_usuario))
+        conn.execute(main.insert(main.Gastos.__table__), [
+            {"id_usuario": id_usuario, "gasto_agua": i * 1.5, "gasto_luz": 300.0,
+             "creado_en": main.datetime(2024, 1 + i % 12, 1 + i % 28)} for i in range(1000)
+        ])
+
+    # La versión anterior de las rutas, para comparar en el mismo proceso
+    @main.app.get("/antes/usuarios", response_model=List[main.Usuario])
+    def antes_usuarios(limit: int = 1000, session: Session = Depends(main.get_session)):
+        return session.exec(select(main.Usuario).order_by(main.Usuario.id_usuario).limit(limit)).all()
+
+    @main.app.get("/antes/usuarios/{id_usuario}/gastos", response_model=List[main.Gastos])
+    def antes_gastos(id_usuario: int, session: Session = Depends(main.get_session)):
+        return session.exec(select(main.Gastos).where(main.Gastos.id_usuario == id_usuario)).all()
+
+    sin = {"accept-encoding": "identity"}
+    casos = [
+        ("usuarios", "antes", "/antes/usuarios", {"limit": 1000}, sin),
+        ("usuarios", "lean", "/usuarios", {"limit": 1000}, sin),
+        ("usuarios", "fields", "/usuarios", {"limit": 1000, "fields": "id_usuario,nombre_completo,estado"}, sin),
+        ("usuarios", "gzip", "/usuarios", {"limit": 1000}, {"accept-encoding": "gzip"}),
+        ("gastos", "antes", f"/antes/usuarios/{id_usuario}/gastos", {}, sin),
+        ("gastos", "lean", f"/usuarios/{id_usuario}/gastos", {}, sin),
+        ("gastos", "fields", f"/usuarios/{id_usuario}/gastos", {"fields": "creado_en,gasto_agua"}, sin),
+        ("gastos", "gzip", f"/usuarios/{id_usuario}/gastos", {}, {"accept-encoding": "gzip"}),
+    ]
+    if respuestas.brotli is not None:
+        casos += [("usuarios", "br", "/usuarios", {"limit": 1000}, {"accept-encoding": "br"}),
+                  ("gastos", "br", f"/usuarios/{id_usuario}/gastos", {}, {"accept-encoding": "br"})]
+
+    async def correr():
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as c:
+            filas = []
+            for lista, modo, ruta, params, headers in casos:
+                filas.append((lista, modo, *await _medir(c, ruta, params, headers, args.requests)))
+            return filas
+
+    filas = asyncio.run(correr())
+    print(f"orjson: {'sí' if respuestas.orjson else 'no'}   brotli: {'sí' if respuestas.brotli else 'no'}")
+    print(f"{'lista':<9} {'modo':<7} {'ms/req':>8} {'bytes':>9}")
+    for lista, modo, ms, n in sorted(filas, key=lambda f: f[0], reverse=True):
+        print(f"{lista:<9} {modo:<7} {ms:>8.2f} {n:>9}")
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
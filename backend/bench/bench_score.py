@@ -0,0 +1,84 @@
+# bench/bench_score.py — recálculo del score crediticio: completo, en paralelo e incremental
+#
+# Sobre una DB generada con generar_datos.py mide:
+#   completo  1 proceso    todos los usuarios por rangos de id, en el proceso actual
+#   completo  N procesos   lo mismo repartido en el pool (spawn); solo el principal escribe
+#   incremental            solo los usuarios marcados por --escrituras altas de gastos
+#   GET /usuarios/{id}/score, con el score al día y recién marcado (se calcula en la request)
+# y extrapola el completo a 1M de usuarios con el throughput medido.
+#
+# Uso (desde backend/):  python bench/bench_score.py [--usuarios 20000] [--procesos 4]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db  # noqa: E402
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark del score crediticio")
+    ap.add_argument("--usuarios", type=int, default=20000)
+    ap.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--escrituras", type=int, default=1000)
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/score.sqlite3"
+    generar_db(db_url, args.usuarios)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["SCORE_REFRESCO_S"] = "0"
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+
+    import main
+
+    main.on_startup()
+    servicio = main.servicio_score
+    filas = []
+    for procesos in sorted({1, args.procesos}):
+        t0 = time.perf_counter()
+        hechos = servicio.recalcular_todos(procesos)
+        filas.append((f"completo {procesos} proceso(s)", hechos, time.perf_counter() - t0))
+
+    rng = random.Random(3)
+    with Session(main.engine) as s:
+        ids = s.exec(main.select(main.Usuario.id_usuario)).all()
+        for _ in range(args.escrituras):
+            main._insertar_gastos(s, {"id_usuario": rng.choice(ids), "gasto_agua": 100.0})
+    t0 = time.perf_counter()
+    hechos = servicio.recalcular_pendientes()
+    filas.append(("incremental", hechos, time.perf_counter() - t0))
+
+    with TestClient(main.app) as c:
+        muestra = [rng.choice(ids) for _ in range(args.requests)]
+        t0 = time.perf_counter()
+        for uid in muestra:
+            c.get(f"/usuarios/{uid}/score").raise_for_status()
+        al_dia = (time.perf_counter() - t0) / args.requests * 1000
+        with main.engine.begin() as conn:
+            main.marcar_pendientes(conn, muestra)
+        t0 = time.perf_counter()
+        for uid in dict.fromkeys(muestra):
+            c.get(f"/usuarios/{uid}/score").raise_for_status()
+        marcado = (time.perf_counter() - t0) / len(dict.fromkeys(muestra)) * 1000
+
+    print(f"{'recálculo':<24} {'usuarios':>9} {'s':>8} {'usuarios/s':>11}")
+    for nombre, n, s in filas:
+        print(f"{nombre:<24} {n:>9} {s:>8.2f} {n / s:>11.0f}")
+    mejor = max(n / s for nombre, n, s in filas if nombre.startswith("completo"))
+    print(f"\n1M usuarios al mejor throughput: ~{1_000_000 / mejor / 60:.1f} min")
+    print(f"GET /usuarios/{{id}}/score  al día {al_dia:.2f} ms/req, recién marcado {marcado:.2f} ms/req")
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
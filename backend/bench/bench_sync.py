@@ -0,0 +1,100 @@
+# bench/bench_sync.py — refrescar un cliente de campo: volver a pedir todo vs GET /sync
+#
+# Sobre una DB generada con generar_datos.py (--anios de historial), para --muestra
+# usuarios distintos y vía ASGI, mide bytes en el cable (gzip), requests, queries
+# SQL (header Server-Timing) y ms de:
+#   completo     /usuarios/{id}/parcelas + /parcelas/{id}/cultivos de cada una +
+#                /usuarios/{id}/gastos (lo que hace hoy el cliente para refrescar)
+#   sync 0       GET /sync?since=0 (primera sincronización, todas las páginas)
+#   sync 1 alta  GET /sync?since=<token> después de un gasto nuevo
+#   sync nada    GET /sync?since=<token> sin cambios
+# y verifica que sync 0 traiga las mismas filas que el refresco completo.
+#
+# Uso (desde backend/):  python bench/bench_sync.py [--usuarios 5000] [--anios 6] [--muestra 100]
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db  # noqa: E402
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+GZIP = {"accept-encoding": "gzip"}
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark de la sincronización incremental")
+    ap.add_argument("--usuarios", type=int, default=5000)
+    ap.add_argument("--anios", type=int, default=6)
+    ap.add_argument("--muestra", type=int, default=100)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{tmp.name}/sync.sqlite3"
+    generar_db(db_url, args.usuarios, anios=args.anios)
+    os.environ["DATABASE_URL"] = db_url  # antes de importar main
+    os.environ["SCORE_REFRESCO_S"] = "0"
+    os.environ["ANALITICA_REFRESCO_S"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from fastapi.testclient import TestClient
+
+    import main
+
+    c = TestClient(main.app)
+    c.__enter__()
+    totales = {k: [0, 0, 0, 0.0] for k in ("completo", "sync 0", "sync 1 alta", "sync nada")}
+
+    def pedir(caso: str, ruta: str, **kw):
+        t0 = time.perf_counter()
+        r = c.get(ruta, **kw)
+        ms = (time.perf_counter() - t0) * 1000
+        r.raise_for_status()
+        t = totales[caso]
+        t[0] += int(r.headers["content-length"])
+        t[1] += 1
+        t[2] += int(_QUERIES.search(r.headers["server-timing"]).group(1))
+        t[3] += ms
+        return r.json()
+
+    for uid in random.Random(3).sample(range(1, args.usuarios + 1), args.muestra):
+        parcelas = pedir("completo", f"/usuarios/{uid}/parcelas", headers=GZIP)
+        cultivos = sum(len(pedir("completo", f"/parcelas/{p['id_parcela']}/cultivos", headers=GZIP))
+                       for p in parcelas)
+        gastos = pedir("completo", f"/usuarios/{uid}/gastos", headers=GZIP)
+
+        token = main.create_access_token({"sub": str(uid), "id_usuario": uid, "nombre_completo": "bench",
+                                          "jti": f"bench-{uid}"})
+        h = {**GZIP, "authorization": f"Bearer {token}"}
+        since, filas = "0", {}
+        while True:
+            j = pedir("sync 0", "/sync", params={"since": since}, headers=h)
+            for tabla in ("parcela", "cultivo", "gastos"):
+                filas[tabla] = filas.get(tabla, 0) + len(j.get(tabla, {}).get("filas", []))
+            since = j["token"]
+            if not j["mas"]:
+                break
+        assert filas == {"parcela": len(parcelas), "cultivo": cultivos, "gastos": len(gastos)}, (uid, filas)
+
+        with main.Session(main.engine) as s:
+            main._insertar_gastos(s, {"id_usuario": uid, "gasto_agua": 12.5})
+        j = pedir("sync 1 alta", "/sync", params={"since": since}, headers=h)
+        assert len(j["gastos"]["filas"]) == 1
+        pedir("sync nada", "/sync", params={"since": j["token"]}, headers=h)
+
+    n = args.muestra
+    print(f"{args.usuarios} usuarios con {args.anios} años de gastos; promedio por refresco de {n} usuarios")
+    print(f"{'refresco':<12} {'bytes':>8} {'requests':>9} {'queries':>8} {'ms':>8}")
+    for caso, (b, req, q, ms) in totales.items():
+        print(f"{caso:<12} {b / n:>8.0f} {req / n:>9.1f} {q / n:>8.1f} {ms / n:>8.2f}")
+    c.__exit__(None, None, None)
+    main.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,93 @@
+# bench/carga_async.py — compara throughput del modo síncrono vs DB_ASYNC=1
+#
+# Levanta uvicorn dos veces sobre la misma DB temporal (generar_datos.py)
+# y dispara lecturas concurrentes con httpx. Requiere uvicorn, httpx y aiosqlite.
+#
+# Uso (desde backend/):  python bench/carga_async.py [--usuarios 200] [--concurrencia 64] [--duracion 10]
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db, levantar_uvicorn, puerto_libre  # noqa: E402
+
+
+def _ids_usuarios(db_url: str) -> list:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from sqlalchemy import text
+    from db import crear_engine
+
+    with crear_engine(db_url).connect() as conn:
+        return list(conn.execute(text("SELECT id_usuario FROM usuario")).scalars())
+
+
+async def _carga(base: str, ids: list, concurrencia: int, duracion: float) -> dict:
+    rutas = ["/usuarios/{u}/parcelas", "/usuarios/{u}/gastos",
+             "/metrics/parcelas-cultivos/{u}", "/metrics/gastos-trimestrales/{u}"]
+    latencias, errores = [], 0
+    fin = time.perf_counter() + duracion
+    limites = httpx.Limits(max_connections=concurrencia)
+
+    async def worker(client):
+        nonlocal errores
+        while time.perf_counter() < fin:
+            ruta = random.choice(rutas).format(u=random.choice(ids))
+            t0 = time.perf_counter()
+            r = await client.get(ruta)
+            latencias.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errores += 1
+
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60) as client:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrencia)))
+        total = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "requests": len(latencias),
+        "errores": errores,
+        "rps": len(latencias) / total,
+        "p50_ms": statistics.median(latencias) * 1000,
+        "p99_ms": latencias[int(len(latencias) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--usuarios", type=int, default=200)
+    ap.add_argument("--concurrencia", type=int, default=64)
+    ap.add_argument("--duracion", type=float, default=10)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/bench.sqlite3"
+        generar_db(db_url, args.usuarios)
+        ids = _ids_usuarios(db_url)
+        resultados = {}
+        for modo_async in (False, True):
+            puerto = puerto_libre()
+            # Sin caché de métricas: se mide el acceso a la DB
+            env = {"DATABASE_URL": db_url, "DB_ASYNC": "1" if modo_async else "0", "METRICS_CACHE_MAX": "0"}
+            proc = levantar_uvicorn(env, puerto)
+            try:
+                resultados["async" if modo_async else "sync"] = asyncio.run(
+                    _carga(f"http://127.0.0.1:{puerto}", ids, args.concurrencia, args.duracion)
+                )
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(f"{'modo':<6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for modo, r in resultados.items():
+        print(f"{modo:<6} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>8}")
+
+
+if __name__ == "__main__":
+    main()
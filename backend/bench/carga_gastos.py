@@ -0,0 +1,70 @@
+# bench/carga_gastos.py — altas de gastos concurrentes: commit por request vs escritura agrupada
+#
+# Levanta uvicorn sobre una DB temporal (generar_datos.py) y dispara POST /gastos
+# con --concurrencia agentes a la vez, primero con el camino normal (un commit
+# por request) y luego con GASTOS_ESCRITURA_AGRUPADA=1 (un commit por lote).
+# Compara req/s y latencias y muestra cómo se agruparon los lotes.
+#
+# Uso (desde backend/):  python bench/carga_gastos.py [--usuarios 1000] [--altas 3000] [--concurrencia 64]
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import generar_db, levantar_uvicorn, medir, puerto_libre  # noqa: E402
+
+
+async def _correr(base: str, args) -> tuple:
+    rng = random.Random(11)
+    limites = httpx.Limits(max_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=120) as c:
+        def alta(i):
+            return c.post("/gastos", json={
+                "id_usuario": rng.randint(1, args.usuarios),
+                "gasto_agua": round(rng.uniform(0, 800), 2), "gasto_combustible": round(rng.uniform(0, 900), 2),
+            })
+
+        await medir(alta, 100, 8)  # calentamiento
+        r = await medir(alta, args.altas, args.concurrencia, ok=(201,))
+        cola = (await c.get("/metrics/gastos-cola")).json()
+    return r, cola
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga de altas de gastos")
+    ap.add_argument("--usuarios", type=int, default=1000)
+    ap.add_argument("--altas", type=int, default=3000)
+    ap.add_argument("--concurrencia", type=int, default=64)
+    args = ap.parse_args()
+
+    configuraciones = {
+        "por_request": {"GASTOS_ESCRITURA_AGRUPADA": "0"},
+        "agrupada": {"GASTOS_ESCRITURA_AGRUPADA": "1"},
+    }
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/gastos.sqlite3"
+        generar_db(db_url, args.usuarios)
+        for nombre, env in configuraciones.items():
+            puerto = puerto_libre()
+            proc = levantar_uvicorn(dict(DATABASE_URL=db_url, SCORE_REFRESCO_S="0",
+                                         ANALITICA_REFRESCO_S="0", **env), puerto)
+            try:
+                filas.append((nombre, *asyncio.run(_correr(f"http://127.0.0.1:{puerto}", args))))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(f"{'modo':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'no-201':>7} {'lotes':>6} {'filas/lote':>10}")
+    for nombre, r, cola in filas:
+        print(f"{nombre:<12} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>7} "
+              f"{cola['lotes']:>6} {cola['filas_por_lote']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench/carga_login.py — logins concurrentes con hash real vs lecturas en paralelo
+#
+# Levanta uvicorn sobre una DB temporal (generar_datos.py) y dispara a la vez
+# una ráfaga de logins y un flujo de lecturas baratas (/usuarios/{id}).
+# Compara el pool de hash acotado (HASH_COLA_MAX por defecto) contra una cola
+# sin límite: con límite, los logins que no caben reciben 503 y el p99 de los
+# aceptados y de las lecturas se mantiene; sin límite la cola crece y el p99
+# de todos se dispara.
+#
+# Uso (desde backend/):  python bench/carga_login.py [--usuarios 300] [--logins 400] [--concurrencia 64]
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from comun import BACKEND, generar_db, levantar_uvicorn, medir, puerto_libre  # noqa: E402
+from generar_datos import CONTRASENA_DEMO  # noqa: E402
+
+
+def _usuarios(db_url: str) -> list:
+    sys.path.insert(0, str(BACKEND))
+    from sqlalchemy import text
+    from db import crear_engine
+
+    with crear_engine(db_url).connect() as conn:
+        return [tuple(f) for f in conn.execute(text("SELECT id_usuario, telefono FROM usuario"))]
+
+
+async def _correr(base: str, usuarios: list, args) -> tuple:
+    limites = httpx.Limits(max_connections=args.concurrencia + args.lectores)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=120) as c:
+        # Calentamiento; en la primera corrida además re-hashea las contraseñas heredadas
+        await medir(lambda i: c.post("/auth/login", json={
+            "identificador": usuarios[i][1], "contrasena": CONTRASENA_DEMO}), len(usuarios), 4)
+
+        def login(i):
+            return c.post("/auth/login", json={
+                "identificador": random.choice(usuarios)[1], "contrasena": CONTRASENA_DEMO})
+
+        def lectura(i):
+            return c.get(f"/usuarios/{random.choice(usuarios)[0]}")
+
+        return await asyncio.gather(
+            medir(login, args.logins, args.concurrencia, ok=(200,)),
+            medir(lectura, args.lecturas, args.lectores),
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga de login con hash de contraseñas")
+    ap.add_argument("--usuarios", type=int, default=300)
+    ap.add_argument("--logins", type=int, default=400)
+    ap.add_argument("--concurrencia", type=int, default=64, help="Logins simultáneos")
+    ap.add_argument("--lecturas", type=int, default=2000)
+    ap.add_argument("--lectores", type=int, default=8)
+    args = ap.parse_args()
+
+    configuraciones = {"acotado": {}, "sin_limite": {"HASH_COLA_MAX": "1000000"}}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/login.sqlite3"
+        generar_db(db_url, args.usuarios)
+        usuarios = _usuarios(db_url)
+        filas = []
+        for nombre, env in configuraciones.items():
+            puerto = puerto_libre()
+            proc = levantar_uvicorn(dict(DATABASE_URL=db_url, **env), puerto)
+            try:
+                logins, lecturas = asyncio.run(_correr(f"http://127.0.0.1:{puerto}", usuarios, args))
+            finally:
+                proc.terminate()
+                proc.wait()
+            filas += [(nombre, "login", logins), (nombre, "lectura", lecturas)]
+
+    print(f"{'pool':<11} {'ruta':<8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'no-200':>7}")
+    for nombre, ruta, r in filas:
+        print(f"{nombre:<11} {ruta:<8} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>7}")
+
+
+if __name__ == "__main__":
+    main()
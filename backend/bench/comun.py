@@ -0,0 +1,82 @@
+# bench/comun.py — utilidades compartidas por los scripts de benchmark
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_uvicorn(env_extra: dict, puerto: int) -> subprocess.Popen:
+    """Arranca `uvicorn main:app` con las variables dadas y espera a /health."""
+    env = dict(os.environ, **env_extra)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=BACKEND, env=env,
+    )
+    for _ in range(200):
+        try:
+            if httpx.get(f"http://127.0.0.1:{puerto}/health").status_code == 200:
+                return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("uvicorn no arrancó")
+
+
+def generar_db(db_url: str, usuarios: int, semilla: int = 42, anios: int = 3) -> None:
+    subprocess.run(
+        [sys.executable, str(BACKEND / "bench" / "generar_datos.py"),
+         "--usuarios", str(usuarios), "--db-url", db_url, "--semilla", str(semilla), "--anios", str(anios)],
+        cwd=BACKEND, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def percentil(ordenadas: list, p: float) -> float:
+    # Nearest-rank sobre una lista ya ordenada
+    if not ordenadas:
+        return 0.0
+    k = max(0, min(len(ordenadas) - 1, int(round(p / 100 * len(ordenadas) + 0.5)) - 1))
+    return ordenadas[k]
+
+
+def resumen(latencias: list, errores: int, duracion: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "requests": len(ordenadas),
+        "errores": errores,
+        "rps": len(ordenadas) / duracion if duracion else 0.0,
+        "p50_ms": percentil(ordenadas, 50) * 1000,
+        "p95_ms": percentil(ordenadas, 95) * 1000,
+        "p99_ms": percentil(ordenadas, 99) * 1000,
+    }
+
+
+async def medir(peticion, total: int, concurrencia: int, ok=(200, 201, 204)) -> dict:
+    """Ejecuta `peticion(i)` (corutina que devuelve un httpx.Response) `total` veces."""
+    latencias, errores = [], 0
+    siguiente = iter(range(total))
+
+    async def worker():
+        nonlocal errores
+        for i in siguiente:
+            t0 = time.perf_counter()
+            r = await peticion(i)
+            latencias.append(time.perf_counter() - t0)
+            if r.status_code not in ok:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    return resumen(latencias, errores, time.perf_counter() - inicio)
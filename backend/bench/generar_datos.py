@@ -0,0 +1,180 @@
+# bench/generar_datos.py — genera usuarios sintéticos con parcelas, cultivos y gastos
+#
+# Escribe directo en la DB (sin pasar por la API) con INSERTs por lotes y luego
+# reconstruye gastos_trimestrales. Reproducible con --semilla.
+#
+# Uso (desde backend/):
+#   python bench/generar_datos.py --usuarios 10000                      # db.sqlite3
+#   python bench/generar_datos.py --usuarios 10000 --db-url sqlite:////tmp/b.sqlite3
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+NOMBRES = ["Juan", "José", "María", "Guadalupe", "Francisco", "Antonio", "Rosa", "Margarita",
+           "Jesús", "Ramón", "Verónica", "Sofía", "Miguel", "Ángel", "Lucía", "Héctor",
+           "Andrés", "Esperanza", "Raúl", "Josefina", "Oscar", "Dairen", "Concepción", "Efraín"]
+APELLIDOS = ["Hernández", "García", "Martínez", "López", "González", "Pérez", "Rodríguez",
+             "Sánchez", "Ramírez", "Cruz", "Flores", "Gómez", "Morales", "Vázquez", "Jiménez",
+             "Reyes", "Díaz", "Torres", "Gutiérrez", "Ruiz", "Aguilar", "Mendoza", "Núñez", "Chávez"]
+# estado -> (lat, lon) aproximado para ubicar parcelas
+ESTADOS = {
+    "Veracruz": (19.54, -96.91), "Puebla": (19.04, -98.21), "Chiapas": (16.75, -93.12),
+    "Oaxaca": (17.07, -96.72), "Jalisco": (20.67, -103.35), "Michoacán": (19.70, -101.19),
+    "Guerrero": (17.55, -99.50), "Sinaloa": (24.80, -107.39), "Guanajuato": (21.02, -101.26),
+    "Tabasco": (17.99, -92.93),
+}
+MUNICIPIOS = ["Xalapa", "Cosamaloapan", "Coatepec", "Tehuacán", "Tapachula", "Juchitán",
+              "Zapopan", "Uruapan", "Iguala", "Culiacán", "Irapuato", "Cárdenas"]
+CULTIVOS = ["Maíz", "Frijol", "Café", "Caña", "Chile", "Sorgo", "Aguacate", "Limón",
+            "Jitomate", "Trigo", "Naranja", "Mango"]
+TENENCIAS = ["propia", "ejidal", "rentada", "comunal"]
+RIEGOS = ["goteo", "aspersión", "gravedad", "temporal"]
+CONTRASENA_DEMO = "demo1234"
+LOTE = 5000
+
+
+def _curp(rng: random.Random) -> str:
+    letras = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return ("".join(rng.choice(letras) for _ in range(4)) + f"{rng.randint(0, 999999):06d}"
+            + rng.choice("HM") + "".join(rng.choice(letras) for _ in range(5)) + f"{rng.randint(0, 99):02d}")
+
+
+def filas_usuario(rng: random.Random, n: int) -> dict:
+    estado = rng.choice(list(ESTADOS))
+    return {
+        "nombre_completo": f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}",
+        "contrasena_hash": CONTRASENA_DEMO,
+        "sociedad": rng.choice(["NO", "SI"]),
+        "dia_nac": rng.randint(1, 28), "mes_nac": rng.randint(1, 12), "anio_nac": rng.randint(1950, 2002),
+        "curp": _curp(rng),
+        "telefono": f"9{n:09d}",  # único y derivable: el bench lo usa para /auth/login
+        "calle": f"Calle {rng.randint(1, 300)}", "colonia": "Centro",
+        "municipio": rng.choice(MUNICIPIOS), "estado": estado,
+        "persona_referenciada": rng.choice(NOMBRES), "telefono_referencia": f"8{rng.randint(0, 999999999):09d}",
+    }
+
+
+def filas_parcela(rng: random.Random, id_usuario: int, estado: str, k: int) -> dict:
+    lat, lon = ESTADOS[estado]
+    return {
+        "id_usuario": id_usuario,
+        "nombre_parcela": f"Parcela {k + 1}",
+        "ubicacion": f"{lat + rng.uniform(-1, 1):.5f},{lon + rng.uniform(-1, 1):.5f}",
+        "tamano": f"{rng.lognormvariate(0.8, 0.7):.1f} ha",
+        "tipo_tenencia": rng.choice(TENENCIAS),
+        "sistema_riego": rng.choice(RIEGOS),
+    }
+
+
+def filas_cultivo(rng: random.Random, id_parcela: int) -> dict:
+    siembra = rng.randint(1, 12)
+    pasado = rng.randint(2, 40)
+    return {
+        "id_parcela": id_parcela,
+        "tipo_cultivo": rng.choice(CULTIVOS),
+        "mes_siembra": siembra,
+        "mes_cosecha": (siembra + rng.randint(3, 8) - 1) % 12 + 1,
+        "produccion_anio_pasado": pasado,
+        "produccion_anio_antepasado": max(0, pasado + rng.randint(-6, 6)),
+    }
+
+
+def filas_gasto(rng: random.Random, id_usuario: int, fecha: datetime, escala: float) -> dict:
+    def g(media: float) -> float:
+        return round(max(0.0, rng.gauss(media, media / 3)) * escala, 2)
+
+    return {
+        "id_usuario": id_usuario,
+        "gasto_agua": g(400), "gasto_gas": g(250), "gasto_luz": g(300),
+        "gasto_semillas": g(900), "gasto_fertilizantes": g(1100),
+        "gasto_mantenimiento": g(350), "gasto_combustible": g(600),
+        "creado_en": fecha,
+    }
+
+
+def generar(usuarios: int, semilla: int = 42, anios: int = 3) -> dict:
+    """Inserta `usuarios` agricultores en main.engine. Devuelve los conteos insertados."""
+    import main
+    from geo import campos_geo
+    from sqlalchemy import insert, func, select
+    from sqlmodel import Session
+
+    rng = random.Random(semilla)
+    main.on_startup()
+    hoy = datetime.utcnow().replace(microsecond=0)
+    conteos = {"usuarios": 0, "parcelas": 0, "cultivos": 0, "gastos": 0}
+
+    with main.engine.begin() as conn:
+        base = conn.execute(select(func.coalesce(func.max(main.Usuario.id_usuario), 0))).scalar()
+        for inicio in range(0, usuarios, LOTE):
+            n_lote = min(LOTE, usuarios - inicio)
+            us = [filas_usuario(rng, base + inicio + i) for i in range(n_lote)]
+            ids_u = list(conn.execute(
+                insert(main.Usuario.__table__).returning(
+                    main.Usuario.__table__.c.id_usuario, sort_by_parameter_order=True), us
+            ).scalars())
+
+            # Distribución sesgada: la mayoría con 1-2 parcelas, algunos con muchas
+            ps, gs = [], []
+            for id_u, u in zip(ids_u, us):
+                for k in range(min(8, 1 + int(rng.expovariate(0.9)))):
+                    ps.append(filas_parcela(rng, id_u, u["estado"], k))
+                escala = rng.lognormvariate(0, 0.5)
+                for _ in range(rng.randint(6, 12 * anios)):
+                    fecha = hoy - timedelta(days=rng.uniform(0, 365 * anios))
+                    gs.append(filas_gasto(rng, id_u, fecha.replace(microsecond=0), escala))
+            for p in ps:
+                p.update(campos_geo(p["ubicacion"], p["tamano"]))  # como crear_parcela
+            ids_p = list(conn.execute(
+                insert(main.Parcela.__table__).returning(
+                    main.Parcela.__table__.c.id_parcela, sort_by_parameter_order=True), ps
+            ).scalars())
+            cs = [filas_cultivo(rng, id_p) for id_p in ids_p for _ in range(rng.randint(1, 3))]
+            ids_c = list(conn.execute(
+                insert(main.Cultivo.__table__).returning(
+                    main.Cultivo.__table__.c.id_cultivo, sort_by_parameter_order=True), cs
+            ).scalars())
+            ids_g = list(conn.execute(
+                insert(main.Gastos.__table__).returning(
+                    main.Gastos.__table__.c.id_gastos, sort_by_parameter_order=True), gs
+            ).scalars())
+            # Como las altas por la API: score pendiente y registro de cambios para /sync
+            main.marcar_pendientes(conn, ids_u)
+            dueno_p = {id_p: p["id_usuario"] for id_p, p in zip(ids_p, ps)}
+            main.registrar_altas(conn, "usuario", [(i, i) for i in ids_u])
+            main.registrar_altas(conn, "parcela", [(p["id_usuario"], i) for i, p in zip(ids_p, ps)])
+            main.registrar_altas(conn, "cultivo", [(dueno_p[c["id_parcela"]], i) for i, c in zip(ids_c, cs)])
+            main.registrar_altas(conn, "gastos", [(g["id_usuario"], i) for i, g in zip(ids_g, gs)])
+
+            conteos["usuarios"] += len(ids_u)
+            conteos["parcelas"] += len(ids_p)
+            conteos["cultivos"] += len(cs)
+            conteos["gastos"] += len(gs)
+
+    with Session(main.engine) as session:
+        main.reconstruir_gastos_trimestrales(session)
+    return conteos
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Genera datos sintéticos de FINTIVA")
+    ap.add_argument("--usuarios", type=int, required=True)
+    ap.add_argument("--db-url", help="Por defecto DATABASE_URL o backend/db.sqlite3")
+    ap.add_argument("--semilla", type=int, default=42)
+    ap.add_argument("--anios", type=int, default=3, help="Años de historial de gastos")
+    args = ap.parse_args()
+
+    if args.db_url:
+        os.environ["DATABASE_URL"] = args.db_url  # antes de importar main/db
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    t0 = time.perf_counter()
+    conteos = generar(args.usuarios, args.semilla, args.anios)
+    print(f"Listo en {time.perf_counter() - t0:.1f}s:", conteos)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,123 @@
+# cache_metricas.py — caché LRU en proceso para las respuestas de /metrics/*
+#
+# Las entradas se guardan ya serializadas junto con su ETag, por usuario, y se
+# invalidan desde los handlers que escriben parcelas, cultivos o gastos. Es local
+# a cada proceso: con varios workers cada uno mantiene (e invalida) la suya, y una
+# escritura que este proceso no ve (otro worker, un script) se nota a lo sumo a los
+# max_edad_s, cuando la entrada vence.
+#
+# Para no guardar un valor calculado antes de una invalidación hay un reloj lógico
+# que sube en cada una: se recuerda el de la última por usuario (a lo sumo
+# max_entradas usuarios; los más viejos salen y su reloj sube `_piso`, que cuenta
+# como invalidación de todos ellos). Así la memoria no crece con los usuarios
+# escritos; lo peor que pasa es que un cálculo en curso no se guarde.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+def calcular_etag(cuerpo: bytes) -> str:
+    # ETag fuerte: depende solo de los bytes exactos del cuerpo
+    return '"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"'
+
+
+class CacheMetricas:
+    def __init__(self, max_entradas: int = 1024, max_edad_s: float = 300.0):
+        self.max_entradas = max_entradas
+        self.max_edad_s = max_edad_s  # 0 = sin vencimiento
+        # (id_usuario, clave) -> (etag, cuerpo, vence_en monotonic)
+        self._entradas: "OrderedDict[Tuple[int, Hashable], Tuple[str, bytes, float]]" = OrderedDict()
+        self._por_usuario: Dict[int, Set[Hashable]] = {}
+        self._reloj = 0
+        self._invalidado_en: "OrderedDict[int, int]" = OrderedDict()
+        self._piso = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.vencidas = 0
+        self.invalidaciones = 0
+
+    def generacion(self, id_usuario: int) -> int:
+        """Marca a tomar antes de calcular y pasar a guardar()."""
+        with self._lock:
+            return self._reloj
+
+    def _quitar(self, id_usuario: int, clave: Hashable) -> None:
+        # Con el lock tomado
+        self._entradas.pop((id_usuario, clave), None)
+        claves = self._por_usuario.get(id_usuario)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._por_usuario[id_usuario]
+
+    def obtener(self, id_usuario: int, clave: Hashable) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entrada = self._entradas.get((id_usuario, clave))
+            if entrada is not None and self.max_edad_s > 0 and time.monotonic() >= entrada[2]:
+                self._quitar(id_usuario, clave)
+                self.vencidas += 1
+                entrada = None
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end((id_usuario, clave))
+            self.hits += 1
+            return entrada[0], entrada[1]
+
+    def guardar(self, id_usuario: int, clave: Hashable, cuerpo: bytes, generacion: int) -> str:
+        etag = calcular_etag(cuerpo)
+        with self._lock:
+            if self._invalidado_en.get(id_usuario, self._piso) > generacion:
+                return etag  # hubo una escritura mientras se calculaba
+            self._entradas[(id_usuario, clave)] = (etag, cuerpo, time.monotonic() + self.max_edad_s)
+            self._entradas.move_to_end((id_usuario, clave))
+            self._por_usuario.setdefault(id_usuario, set()).add(clave)
+            while len(self._entradas) > self.max_entradas:
+                (uid, vieja) = next(iter(self._entradas))
+                self._quitar(uid, vieja)
+                self.evictions += 1
+        return etag
+
+    def invalidar(self, id_usuario: Optional[int]) -> None:
+        if id_usuario is None:
+            return
+        with self._lock:
+            self._reloj += 1
+            self._invalidado_en[id_usuario] = self._reloj
+            self._invalidado_en.move_to_end(id_usuario)
+            while len(self._invalidado_en) > self.max_entradas:
+                _, reloj = self._invalidado_en.popitem(last=False)
+                self._piso = max(self._piso, reloj)
+            for clave in self._por_usuario.pop(id_usuario, ()):
+                self._entradas.pop((id_usuario, clave), None)
+            self.invalidaciones += 1
+
+    def obtener_o_calcular(self, id_usuario: int, clave: Hashable,
+                           calcular: Callable[[], bytes]) -> Tuple[str, bytes]:
+        entrada = self.obtener(id_usuario, clave)
+        if entrada is not None:
+            return entrada
+        generacion = self.generacion(id_usuario)
+        cuerpo = calcular()
+        return self.guardar(id_usuario, clave, cuerpo, generacion), cuerpo
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "usuarios": len(self._por_usuario),
+                "usuarios_invalidados": len(self._invalidado_en),
+                "max_edad_s": self.max_edad_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "vencidas": self.vencidas,
+                "invalidaciones": self.invalidaciones,
+                "hit_ratio": (self.hits / consultas) if consultas else 0.0,
+            }
@@ -0,0 +1,135 @@
+# cola_escritura.py — escritura agrupada (group commit) con un solo hilo escritor
+#
+# Las requests dejan su fila en una cola y esperan un Future. El hilo escritor
+# toma la primera fila, junta las que lleguen en los siguientes `espera_ms` (o
+# hasta `max_filas`) y llama a `escribir_lote` con todas: un INSERT múltiple y
+# UN commit en lugar de uno por request. Cada Future se resuelve después del
+# commit con el resultado de su fila (p. ej. la fila con su id) o con la
+# excepción que le toque, así que la respuesta confirma una fila ya committed,
+# visible para cualquier otra conexión. Lo que promete ante un corte de luz es
+# lo del commit: con journal_mode=WAL y synchronous=NORMAL (db.py) SQLite no
+# hace fsync en cada commit, y los últimos lotes pueden perderse si el sistema
+# cae antes del siguiente checkpoint (una caída solo del proceso no los pierde).
+#
+# Con la cola llena (`max_cola`) se rechaza de inmediato con Saturado (503).
+# Los contadores los tocan los hilos de las requests y el escritor: van con _lock.
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from contrasenas import Saturado
+
+_FIN = object()
+
+
+class ColaEscritura:
+    def __init__(self, escribir_lote: Callable[[list], list], max_filas: int = 500,
+                 espera_ms: float = 2.0, max_cola: int = 10000, nombre: str = "escritor"):
+        self.escribir_lote = escribir_lote  # lista de filas -> resultado o excepción por fila
+        self.max_filas = max_filas
+        self.espera_s = espera_ms / 1000
+        self.max_cola = max_cola
+        self.nombre = nombre
+        self._cola: "queue.Queue" = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Métricas
+        self.lotes = 0
+        self.filas = 0
+        self.errores = 0
+        self.rechazadas = 0
+        self.ultimo_lote = 0
+        self.max_lote = 0
+        self.ultimo_commit_ms = 0.0
+
+    def _iniciar(self) -> None:
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name=self.nombre, daemon=True)
+                self._hilo.start()
+
+    def enviar_nowait(self, fila) -> Future:
+        if self._hilo is None:
+            self._iniciar()
+        futuro: Future = Future()
+        with self._lock:
+            if self._cola.qsize() >= self.max_cola:
+                self.rechazadas += 1
+                raise Saturado()
+            self._cola.put((fila, futuro))  # sin tope: no bloquea
+        return futuro
+
+    async def enviar(self, fila):
+        """Encola la fila y espera (sin bloquear el event loop) al commit de su lote."""
+        return await asyncio.wrap_future(self.enviar_nowait(fila))
+
+    def _juntar(self, primero) -> tuple:
+        lote, fin = [primero], False
+        limite = time.monotonic() + self.espera_s
+        while len(lote) < self.max_filas:
+            try:
+                # Lo que ya está en cola entra sin esperar; después, hasta el límite de tiempo
+                resto = limite - time.monotonic()
+                item = self._cola.get_nowait() if resto <= 0 else self._cola.get(timeout=resto)
+            except queue.Empty:
+                break
+            if item is _FIN:
+                fin = True
+                break
+            lote.append(item)
+        return lote, fin
+
+    def _ciclo(self) -> None:
+        while True:
+            primero = self._cola.get()
+            if primero is _FIN:
+                return
+            lote, fin = self._juntar(primero)
+            self._escribir(lote)
+            if fin:
+                return
+
+    def _escribir(self, lote: List[tuple]) -> None:
+        t0 = time.perf_counter()
+        try:
+            resultados = self.escribir_lote([fila for fila, _ in lote])
+        except Exception as e:  # falló la transacción: ninguna fila quedó escrita
+            resultados = [e] * len(lote)
+        commit_ms = (time.perf_counter() - t0) * 1000
+        errores = sum(isinstance(r, Exception) for r in resultados)
+        with self._lock:
+            self.ultimo_commit_ms = commit_ms
+            self.lotes += 1
+            self.filas += len(lote)
+            self.ultimo_lote = len(lote)
+            self.max_lote = max(self.max_lote, len(lote))
+            self.errores += errores
+        for (_, futuro), r in zip(lote, resultados):
+            if isinstance(r, Exception):
+                futuro.set_exception(r)
+            else:
+                futuro.set_result(r)
+
+    def detener(self, timeout: float = 10.0) -> None:
+        """Escribe lo que quede en cola y termina el hilo escritor."""
+        if self._hilo is not None:
+            self._cola.put(_FIN)
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "profundidad": self._cola.qsize(),
+                "lotes": self.lotes,
+                "filas": self.filas,
+                "filas_por_lote": round(self.filas / self.lotes, 2) if self.lotes else 0.0,
+                "ultimo_lote": self.ultimo_lote,
+                "max_lote": self.max_lote,
+                "ultimo_commit_ms": round(self.ultimo_commit_ms, 3),
+                "errores": self.errores,
+                "rechazadas": self.rechazadas,
+            }
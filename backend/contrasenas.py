@@ -0,0 +1,181 @@
+# contrasenas.py — hash de contraseñas (scrypt) fuera del event loop
+#
+# Cada hash cuesta decenas de ms de CPU a propósito. Para que los logins no
+# acaparen el threadpool de Starlette (y con él al resto de las rutas) se
+# calculan en un pool propio y acotado:
+#   - HASH_WORKERS hilos (hashlib.scrypt suelta el GIL mientras calcula)
+#   - HASH_COLA_MAX trabajos entre en curso y en espera; pasado eso se rechaza
+#     con Saturado (la API responde 503 + Retry-After) en vez de encolar sin fin,
+#     así la latencia de un login aceptado queda acotada.
+# El costo (n = 2**ln) se calibra al arrancar, como primer trabajo del pool (nunca en
+# el event loop), para acercarse a HASH_OBJETIVO_MS. Cada hash reserva ~128·r·2**ln
+# bytes: mem_max acota ln_max (64 MiB -> ln 16), y el pico de memoria es workers × eso.
+# La calibración depende del tiempo medido y puede dar distinto en cada worker: solo
+# se re-hashea lo que está por debajo del ln de este proceso, nunca hacia abajo.
+# Formato guardado: $scrypt$ln=14,r=8,p=1$<sal b64>$<hash b64>. Lo que no empieza
+# con $scrypt$ es una contraseña heredada en texto plano.
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+PREFIJO = "$scrypt$"
+R, P, LARGO = 8, 1, 32
+
+
+class Saturado(Exception):
+    """Cola llena (pool de hash, escritura agrupada de gastos): se responde 503."""
+
+
+def _b64(b: bytes) -> str:
+    return base64.b64encode(b).decode().rstrip("=")
+
+
+def _de_b64(s: str) -> bytes:
+    return base64.b64decode(s + "=" * (-len(s) % 4))
+
+
+def _memoria(ln: int) -> int:
+    return 128 * R * (1 << ln)
+
+
+def _kdf(contrasena: str, sal: bytes, ln: int) -> bytes:
+    # maxmem con holgura sobre _memoria(ln): verificar un hash guardado no debe fallar
+    n = 1 << ln
+    return hashlib.scrypt(contrasena.encode(), salt=sal, n=n, r=R, p=P,
+                          maxmem=256 * R * n, dklen=LARGO)
+
+
+def es_hash(guardado: Optional[str]) -> bool:
+    return bool(guardado) and guardado.startswith(PREFIJO)
+
+
+def _parsear(guardado: str) -> tuple:
+    _, _, params, sal, digest = guardado.split("$")
+    valores = dict(kv.split("=") for kv in params.split(","))
+    return int(valores["ln"]), _de_b64(sal), _de_b64(digest)
+
+
+class ServicioHash:
+    def __init__(self, workers: int = 2, cola_max: int = 16, objetivo_ms: float = 100.0,
+                 ln: Optional[int] = None, ln_min: int = 14, ln_max: int = 17,
+                 mem_max: int = 64 * 1024 * 1024):
+        self.workers = workers
+        self.cola_max = cola_max
+        self.objetivo_ms = objetivo_ms
+        self.mem_max = mem_max
+        # Mayor ln que entra en mem_max (sin bajar de ln_min)
+        self.ln_min = ln_min
+        self.ln_max = max(ln_min, min(ln_max, (mem_max // _memoria(0)).bit_length() - 1))
+        self._ln = ln
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self._cupo = threading.BoundedSemaphore(cola_max)
+        self._lock = threading.Lock()
+        self._lock_calibracion = threading.Lock()
+        self._dummy: Optional[str] = None
+        self.pendientes = 0
+        self.completados = 0
+        self.rechazos = 0
+        self.rehashes = 0
+
+    # ---- parámetros ----
+    @property
+    def ln(self) -> int:
+        # Solo desde el pool o código síncrono: puede esperar a la calibración
+        if self._ln is None:
+            self.calibrar()
+        return self._ln
+
+    def iniciar(self) -> Future:
+        """Calibra en el pool al arrancar; los hashes que lleguen antes esperan en sus hilos."""
+        return self._pool.submit(self.calibrar)
+
+    def calibrar(self) -> int:
+        """Mayor ln en [ln_min, ln_max] cuyo hash no pasa de objetivo_ms en esta máquina."""
+        with self._lock_calibracion:
+            if self._ln is None:
+                elegido = self.ln_min
+                for ln in range(self.ln_min, self.ln_max + 1):
+                    t0 = time.perf_counter()
+                    _kdf("calibracion", os.urandom(16), ln)
+                    if (time.perf_counter() - t0) * 1000 > self.objetivo_ms:
+                        break
+                    elegido = ln
+                self._ln = elegido
+            if self._dummy is None:
+                # Hash de referencia para usuarios inexistentes (mismo costo que uno real)
+                self._dummy = self.hashear_sync(os.urandom(16).hex())
+        return self._ln
+
+    def necesita_rehash(self, guardado: Optional[str]) -> bool:
+        """Texto plano o ln menor al de este proceso. No bloquea: sin calibrar, compara con ln_min."""
+        if not es_hash(guardado):
+            return True
+        return _parsear(guardado)[0] < (self._ln or self.ln_min)
+
+    # ---- trabajo en el hilo actual ----
+    def hashear_sync(self, contrasena: str) -> str:
+        ln = self.ln
+        sal = os.urandom(16)
+        return f"{PREFIJO}ln={ln},r={R},p={P}${_b64(sal)}${_b64(_kdf(contrasena, sal, ln))}"
+
+    def verificar_sync(self, contrasena: str, guardado: Optional[str]) -> bool:
+        if guardado is None:
+            self.verificar_sync(contrasena, self._dummy or self.hashear_sync(""))
+            return False
+        if not es_hash(guardado):
+            return hmac.compare_digest(contrasena.encode(), guardado.encode())
+        ln, sal, digest = _parsear(guardado)
+        return hmac.compare_digest(_kdf(contrasena, sal, ln), digest)
+
+    # ---- pool acotado ----
+    def _enviar(self, fn, *args) -> Future:
+        if not self._cupo.acquire(blocking=False):
+            with self._lock:
+                self.rechazos += 1
+            raise Saturado()
+        with self._lock:
+            self.pendientes += 1
+        futuro = self._pool.submit(fn, *args)
+        futuro.add_done_callback(self._liberar)
+        return futuro
+
+    def _liberar(self, _futuro: Future) -> None:
+        with self._lock:
+            self.pendientes -= 1
+            self.completados += 1
+        self._cupo.release()
+
+    async def hashear(self, contrasena: str) -> str:
+        return await asyncio.wrap_future(self._enviar(self.hashear_sync, contrasena))
+
+    async def verificar(self, contrasena: str, guardado: Optional[str]) -> bool:
+        if guardado is not None and not es_hash(guardado):
+            return self.verificar_sync(contrasena, guardado)  # texto plano: no cuesta nada
+        return await asyncio.wrap_future(self._enviar(self.verificar_sync, contrasena, guardado))
+
+    def hashear_bloqueante(self, contrasena: str) -> str:
+        """Para handlers síncronos: respeta el mismo límite de cola."""
+        return self._enviar(self.hashear_sync, contrasena).result()
+
+    def contar_rehash(self) -> None:
+        with self._lock:
+            self.rehashes += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "ln": self._ln,
+                "ln_max": self.ln_max,
+                "workers": self.workers,
+                "cola_max": self.cola_max,
+                "pendientes": self.pendientes,
+                "completados": self.completados,
+                "rechazos": self.rechazos,
+                "rehashes": self.rehashes,
+            }
@@ -0,0 +1,147 @@
+# db.py — engines de base de datos (síncrono y, opcionalmente, asíncrono)
+#
+# DATABASE_URL elige el motor (por defecto el db.sqlite3 de esta carpeta).
+# Con DB_ASYNC=1 se crea además un engine asyncio (aiosqlite / asyncpg) que
+# usan las rutas de rutas_async.py.
+# Con SQLite cada conexión adjunta además el archivo frío de gastos como
+# "archivo" (ver archivo.py).
+import os
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import Integer, cast, event, extract, literal_column
+from sqlalchemy.engine import make_url
+from sqlmodel import Session, create_engine
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_FILE = (BASE_DIR / "db.sqlite3").as_posix()
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_FILE}")
+# Render y Heroku entregan postgres://, que SQLAlchemy ya no acepta
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "si", "sí", "yes")
+
+# Pool de conexiones (los workers del threadpool de Starlette comparten este pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Ajustes de SQLite aplicados a cada conexión nueva
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Archivo frío de gastos: por defecto <db>_archivo.sqlite3 junto a la DB; vacío = sin archivo
+GASTOS_ARCHIVO_DB = os.getenv("GASTOS_ARCHIVO_DB")
+
+
+def _es_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _es_memoria(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _pragmas_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: los lectores no bloquean al escritor; NORMAL sigue siendo seguro con WAL
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")  # negativo = KiB
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def parte_fecha(dialect, parte: str, columna: str) -> str:
+    """SQL entero de year/month de `columna` para consultas en texto: strftime en SQLite,
+    EXTRACT en PostgreSQL."""
+    return str(cast(extract(parte, literal_column(columna)), Integer).compile(dialect=dialect))
+
+
+def ruta_archivo(url: str) -> Optional[str]:
+    """Ruta del archivo frío que se adjunta a las conexiones de `url` (None si no aplica)."""
+    if not _es_sqlite(url) or _es_memoria(url):
+        return None
+    if GASTOS_ARCHIVO_DB is not None:
+        return GASTOS_ARCHIVO_DB or None
+    db = Path(make_url(url).database)
+    return db.with_name(f"{db.stem}_archivo.sqlite3").as_posix()
+
+
+def _adjuntar_archivo(ruta: str):
+    def adjuntar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("ATTACH DATABASE ? AS archivo", (ruta,))
+        # Sin mmap ni cache_size grande: lo frío no compite por memoria con lo caliente
+        cursor.execute("PRAGMA archivo.journal_mode=WAL")
+        cursor.execute("PRAGMA archivo.synchronous=NORMAL")
+        cursor.close()
+    return adjuntar
+
+
+def _opciones_engine(url: str) -> dict:
+    if _es_sqlite(url):
+        opciones = {"connect_args": {"check_same_thread": False}}
+        if _es_memoria(url):
+            return opciones  # SQLAlchemy usa un pool de una sola conexión
+    else:
+        opciones = {"pool_pre_ping": True}
+    opciones.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return opciones
+
+
+def crear_engine(url: str = DATABASE_URL):
+    engine = create_engine(url, echo=False, **_opciones_engine(url))
+    if _es_sqlite(url) and not _es_memoria(url):
+        event.listen(engine, "connect", _pragmas_sqlite)
+    if ruta_archivo(url):
+        event.listen(engine, "connect", _adjuntar_archivo(ruta_archivo(url)))
+    return engine
+
+
+def url_async(url: str) -> str:
+    """sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://"""
+    u = make_url(url)
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}.get(u.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Sin driver asyncio conocido para {u.get_backend_name()}")
+    return u.set(drivername=f"{u.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def crear_engine_async(url: str = DATABASE_URL):
+    # Import diferido: aiosqlite/asyncpg y greenlet solo se requieren con DB_ASYNC=1
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    opciones = _opciones_engine(url)
+    opciones.pop("connect_args", None)  # aiosqlite no usa check_same_thread
+    engine = create_async_engine(url_async(url), echo=False, **opciones)
+    if _es_sqlite(url) and not _es_memoria(url):
+        event.listen(engine.sync_engine, "connect", _pragmas_sqlite)
+    if ruta_archivo(url):
+        event.listen(engine.sync_engine, "connect", _adjuntar_archivo(ruta_archivo(url)))
+    return engine
+
+
+engine = crear_engine()
+ARCHIVO_DB = ruta_archivo(DATABASE_URL)
+async_engine = crear_engine_async() if DB_ASYNC else None
+
+
+def get_session():
+    with Session(engine) as session:
+        yield session
+
+
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,165 @@
+# eventos.py — avisos en vivo por usuario (Server-Sent Events) para el dashboard
+#
+# En lugar de que cada pestaña vuelva a pedir /metrics/* cada N segundos, los
+# handlers que escriben parcelas, cultivos o gastos publican (después del commit)
+# un delta chico de las métricas de ese usuario. Cada conexión a
+# /usuarios/{id}/eventos tiene su cola asyncio; publicar solo reparte en memoria,
+# así que un dashboard abierto sin cambios no cuesta ninguna query: solo un
+# comentario de heartbeat cada `heartbeat_s` para que proxies y balanceadores no
+# corten la conexión.
+#
+# - Cada evento lleva id "<época>-<n>", creciente por usuario. Al reconectar, el
+#   navegador manda Last-Event-ID y se reenvía lo que siga en el historial (los
+#   últimos `historial` por usuario). Si ya no está (o el proceso se reinició) se
+#   manda "recargar" y el cliente vuelve a pedir las métricas (con ETag).
+# - Una conexión que no lee y llena su cola recibe "recargar" en vez de lo perdido.
+# - `retry:` (con jitter, para que no reconecten todos a la vez tras un reinicio)
+#   dice cuánto esperar antes de reconectar. Con `max_conexiones` se lanza
+#   Saturado (503 + Retry-After).
+# Es local al proceso, como cache_metricas: con varios workers cada uno avisa de
+# las escrituras que atendió.
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Set
+
+from contrasenas import Saturado
+
+_RECARGAR = ("recargar", {})
+
+
+class _Suscripcion:
+    __slots__ = ("id_usuario", "loop", "cola")
+
+    def __init__(self, id_usuario: int, loop: asyncio.AbstractEventLoop, max_cola: int):
+        self.id_usuario = id_usuario
+        self.loop = loop
+        self.cola: "asyncio.Queue" = asyncio.Queue(max_cola)
+
+
+class CanalEventos:
+    def __init__(self, max_conexiones: int = 1000, historial: int = 64, max_usuarios: int = 10000,
+                 max_cola: int = 256, heartbeat_s: float = 15.0, retry_ms: int = 3000):
+        self.max_conexiones = max_conexiones
+        self.historial = historial
+        self.max_usuarios = max_usuarios
+        self.max_cola = max_cola
+        self.heartbeat_s = heartbeat_s
+        self.retry_ms = retry_ms
+        # Un id de otro proceso (o de antes de un reinicio) no se puede reanudar
+        self.epoca = format(int(time.time() * 1000), "x")
+        self._suscriptores: Dict[int, Set[_Suscripcion]] = {}
+        # id_usuario -> (último n, deque de (n, tipo, datos)); LRU acotado a max_usuarios
+        self._historiales: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Métricas
+        self.conexiones = 0
+        self.publicados = 0
+        self.entregados = 0
+        self.desbordes = 0
+        self.rechazadas = 0
+
+    # ---- publicar (desde cualquier hilo) ----
+    def publicar(self, id_usuario: Optional[int], tipo: str, datos: dict) -> None:
+        if id_usuario is None:
+            return
+        with self._lock:
+            entrada = self._historiales.get(id_usuario)
+            n = (entrada[0] if entrada else 0) + 1
+            eventos = entrada[1] if entrada else deque(maxlen=self.historial)
+            eventos.append((n, tipo, datos))
+            self._historiales[id_usuario] = (n, eventos)
+            self._historiales.move_to_end(id_usuario)
+            while len(self._historiales) > self.max_usuarios:
+                self._historiales.popitem(last=False)
+            suscripciones = list(self._suscriptores.get(id_usuario, ()))
+            self.publicados += 1
+        for s in suscripciones:
+            s.loop.call_soon_threadsafe(self._encolar, s, (n, tipo, datos))
+
+    def _encolar(self, s: _Suscripcion, evento: tuple) -> None:
+        # Corre en el loop de la conexión
+        try:
+            s.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordes += 1
+            while not s.cola.empty():
+                s.cola.get_nowait()
+            s.cola.put_nowait((evento[0], *_RECARGAR))
+
+    # ---- conexiones ----
+    def _suscribir(self, id_usuario: int, ultimo_id: Optional[str]) -> tuple:
+        """(suscripción, eventos a reenviar o None si hay que recargar, n actual)."""
+        s = _Suscripcion(id_usuario, asyncio.get_running_loop(), self.max_cola)
+        with self._lock:
+            self.conexiones += 1
+            self._suscriptores.setdefault(id_usuario, set()).add(s)
+            n, eventos = self._historiales.get(id_usuario, (0, ()))
+            pendientes = list(eventos)
+        if ultimo_id is None:
+            return s, [], n
+        epoca, _, desde = ultimo_id.partition("-")
+        if epoca != self.epoca or not desde.isdigit() or int(desde) > n:
+            return s, None, n
+        desde = int(desde)
+        if desde < n and (not pendientes or pendientes[0][0] > desde + 1):
+            return s, None, n  # lo que falta ya salió del historial
+        return s, [e for e in pendientes if e[0] > desde], n
+
+    def _desuscribir(self, s: _Suscripcion) -> None:
+        with self._lock:
+            self.conexiones -= 1
+            suscripciones = self._suscriptores.get(s.id_usuario)
+            if suscripciones is not None:
+                suscripciones.discard(s)
+                if not suscripciones:
+                    del self._suscriptores[s.id_usuario]
+
+    def _trama(self, n: int, tipo: str, datos: dict) -> str:
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(",", ":"), default=str)
+        return f"id: {self.epoca}-{n}\nevent: {tipo}\ndata: {cuerpo}\n\n"
+
+    def verificar_cupo(self) -> None:
+        """Saturado antes de abrir el stream (adentro ya no se puede responder 503)."""
+        if self.conexiones >= self.max_conexiones:
+            self.rechazadas += 1
+            raise Saturado()
+
+    async def flujo(self, id_usuario: int, ultimo_id: Optional[str] = None):
+        """Generador de texto text/event-stream para un usuario."""
+        s, pendientes, n = self._suscribir(id_usuario, ultimo_id)
+        try:
+            retry = int(self.retry_ms * random.uniform(1.0, 1.5))
+            yield f"retry: {retry}\n\n"
+            if pendientes is None:
+                yield self._trama(n, *_RECARGAR)
+            elif ultimo_id is None:
+                yield self._trama(n, "hola", {"id_usuario": id_usuario})
+            for evento in pendientes or ():
+                yield self._trama(*evento)
+            while True:
+                try:
+                    evento = await asyncio.wait_for(s.cola.get(), self.heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                self.entregados += 1
+                yield self._trama(*evento)
+        finally:
+            self._desuscribir(s)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "conexiones": self.conexiones,
+                "max_conexiones": self.max_conexiones,
+                "usuarios_conectados": len(self._suscriptores),
+                "usuarios_con_historial": len(self._historiales),
+                "publicados": self.publicados,
+                "entregados": self.entregados,
+                "desbordes": self.desbordes,
+                "rechazadas": self.rechazadas,
+            }
@@ -1,64 +1,233 @@
-
+-- fintiva_schema.sql — GENERADO con `python migrar.py --volcar-esquema`; no editar a mano.
+-- La fuente del esquema son las migraciones de migraciones.py.
 PRAGMA foreign_keys = ON;
 
--- Tabla: usuario
-CREATE TABLE IF NOT EXISTS usuario (
-  id_usuario            INTEGER PRIMARY KEY,
-  nombre_completo       VARCHAR(200) NOT NULL,
-  contrasena_hash       VARCHAR(255) NOT NULL,
-  sociedad              VARCHAR(120),
-  dia_nac               INTEGER,
-  mes_nac               INTEGER,
-  anio_nac              INTEGER,
-  curp                  VARCHAR(18),
-  telefono              VARCHAR(30),
-  calle                 VARCHAR(200),
-  colonia               VARCHAR(200),
-  municipio             VARCHAR(200),
-  estado                VARCHAR(120),
-  persona_referenciada  VARCHAR(200),
-  telefono_referencia   VARCHAR(30)
+CREATE TABLE schema_version (
+    version     INTEGER PRIMARY KEY,
+    nombre      VARCHAR(120) NOT NULL,
+    aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE usuario (
+	id_usuario INTEGER NOT NULL,
+	nombre_completo VARCHAR NOT NULL,
+	contrasena_hash VARCHAR NOT NULL,
+	sociedad VARCHAR,
+	dia_nac INTEGER,
+	mes_nac INTEGER,
+	anio_nac INTEGER,
+	curp VARCHAR(18),
+	telefono VARCHAR,
+	calle VARCHAR,
+	colonia VARCHAR,
+	municipio VARCHAR,
+	estado VARCHAR,
+	persona_referenciada VARCHAR,
+	telefono_referencia VARCHAR,
+	PRIMARY KEY (id_usuario)
+);
+
+CREATE TABLE parcela (
+	id_parcela INTEGER NOT NULL,
+	id_usuario INTEGER NOT NULL,
+	nombre_parcela VARCHAR NOT NULL,
+	ubicacion VARCHAR,
+	tamano VARCHAR,
+	tipo_tenencia VARCHAR,
+	sistema_riego VARCHAR,
+	latitud FLOAT,
+	longitud FLOAT,
+	hectareas FLOAT,
+	PRIMARY KEY (id_parcela),
+	FOREIGN KEY(id_usuario) REFERENCES usuario (id_usuario)
+);
+
+CREATE TABLE cultivo (
+	id_cultivo INTEGER NOT NULL,
+	id_parcela INTEGER NOT NULL,
+	tipo_cultivo VARCHAR NOT NULL,
+	mes_siembra INTEGER,
+	mes_cosecha INTEGER,
+	produccion_anio_pasado INTEGER,
+	produccion_anio_antepasado INTEGER,
+	PRIMARY KEY (id_cultivo),
+	FOREIGN KEY(id_parcela) REFERENCES parcela (id_parcela)
+);
+
+CREATE TABLE gastos (
+	id_gastos INTEGER NOT NULL,
+	id_usuario INTEGER NOT NULL,
+	gasto_agua FLOAT NOT NULL,
+	gasto_gas FLOAT NOT NULL,
+	gasto_luz FLOAT NOT NULL,
+	gasto_semillas FLOAT NOT NULL,
+	gasto_fertilizantes FLOAT NOT NULL,
+	gasto_mantenimiento FLOAT NOT NULL,
+	gasto_combustible FLOAT NOT NULL,
+	creado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+	PRIMARY KEY (id_gastos),
+	FOREIGN KEY(id_usuario) REFERENCES usuario (id_usuario)
 );
 
-CREATE INDEX IF NOT EXISTS idx_usuario_curp ON usuario(curp);
-CREATE INDEX IF NOT EXISTS idx_usuario_estado ON usuario(estado);
-
--- Parcela (N:1 con usuario)
-CREATE TABLE IF NOT EXISTS parcela (
-  id_parcela     INTEGER PRIMARY KEY,
-  id_usuario     INTEGER NOT NULL,
-  nombre_parcela VARCHAR(120) NOT NULL,
-  ubicacion      VARCHAR(255),
-  tamano         VARCHAR(60),
-  tipo_tenencia  VARCHAR(60),
-  sistema_riego  VARCHAR(80),
-  FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario) ON DELETE CASCADE
+CREATE TABLE gastos_trimestrales (
+	id_usuario INTEGER NOT NULL,
+	anio INTEGER NOT NULL,
+	trimestre INTEGER NOT NULL,
+	registros INTEGER NOT NULL,
+	gasto_agua FLOAT NOT NULL,
+	gasto_gas FLOAT NOT NULL,
+	gasto_luz FLOAT NOT NULL,
+	gasto_semillas FLOAT NOT NULL,
+	gasto_fertilizantes FLOAT NOT NULL,
+	gasto_mantenimiento FLOAT NOT NULL,
+	gasto_combustible FLOAT NOT NULL,
+	total FLOAT NOT NULL,
+	PRIMARY KEY (id_usuario, anio, trimestre),
+	FOREIGN KEY(id_usuario) REFERENCES usuario (id_usuario)
 );
-CREATE INDEX IF NOT EXISTS idx_parcela_usuario ON parcela(id_usuario);
-
--- Cultivo (N:1 con parcela)
-CREATE TABLE IF NOT EXISTS cultivo (
-  id_cultivo                  INTEGER PRIMARY KEY,
-  id_parcela                  INTEGER NOT NULL,
-  tipo_cultivo                VARCHAR(100) NOT NULL,
-  mes_siembra                 INTEGER,
-  mes_cosecha                 INTEGER,
-  produccion_anio_pasado      INTEGER,
-  produccion_anio_antepasado  INTEGER,
-  FOREIGN KEY (id_parcela) REFERENCES parcela(id_parcela) ON DELETE CASCADE
+
+CREATE VIRTUAL TABLE usuario_fts USING fts5(
+        nombre_completo, curp, telefono,
+        content='usuario', content_rowid='id_usuario',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+
+CREATE TABLE token_revocado (
+	id INTEGER NOT NULL,
+	jti VARCHAR,
+	id_usuario INTEGER,
+	revocado_en FLOAT NOT NULL,
+	expira_en FLOAT NOT NULL,
+	PRIMARY KEY (id)
 );
-CREATE INDEX IF NOT EXISTS idx_cultivo_parcela ON cultivo(id_parcela);
-
--- Gastos (N:1 con usuario)
-CREATE TABLE IF NOT EXISTS gastos (
-  id_gastos           INTEGER PRIMARY KEY,
-  id_usuario          INTEGER NOT NULL,
-  gasto_agua          REAL DEFAULT 0,
-  gasto_gas           REAL DEFAULT 0,
-  gasto_luz           REAL DEFAULT 0,
-  gasto_semillas      REAL DEFAULT 0,
-  gasto_fertilizantes REAL DEFAULT 0,
-  gasto_mantenimiento REAL DEFAULT 0,
-  gasto_combustible   REAL DEFAULT 0,
-  FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario) ON DELETE CASCADE
+
+CREATE TABLE score (
+	id_usuario INTEGER NOT NULL,
+	puntaje FLOAT,
+	nivel VARCHAR(1),
+	hectareas FLOAT,
+	tenencia FLOAT,
+	riego FLOAT,
+	rendimiento FLOAT,
+	crecimiento FLOAT,
+	historial FLOAT,
+	estabilidad FLOAT,
+	diversificacion FLOAT,
+	version INTEGER,
+	calculado_en DATETIME,
+	pendiente INTEGER NOT NULL,
+	PRIMARY KEY (id_usuario)
 );
+
+CREATE TABLE gastos_mensuales_archivados (
+	id_usuario INTEGER NOT NULL,
+	anio INTEGER NOT NULL,
+	mes INTEGER NOT NULL,
+	registros INTEGER NOT NULL,
+	gasto_agua FLOAT NOT NULL,
+	gasto_gas FLOAT NOT NULL,
+	gasto_luz FLOAT NOT NULL,
+	gasto_semillas FLOAT NOT NULL,
+	gasto_fertilizantes FLOAT NOT NULL,
+	gasto_mantenimiento FLOAT NOT NULL,
+	gasto_combustible FLOAT NOT NULL,
+	total FLOAT NOT NULL,
+	ultimo DATETIME,
+	PRIMARY KEY (id_usuario, anio, mes),
+	FOREIGN KEY(id_usuario) REFERENCES usuario (id_usuario)
+);
+
+CREATE VIRTUAL TABLE parcela_geo USING rtree(
+        id_parcela, min_lat, max_lat, min_lon, max_lon
+    );
+
+CREATE TABLE sync_cambio (
+	seq INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+	id_usuario INTEGER NOT NULL,
+	tabla VARCHAR(16) NOT NULL,
+	id_fila INTEGER NOT NULL
+);
+
+CREATE TABLE sync_subida (
+	id_usuario INTEGER NOT NULL,
+	id_local VARCHAR(64) NOT NULL,
+	tabla VARCHAR(16) NOT NULL,
+	id_fila INTEGER NOT NULL,
+	PRIMARY KEY (id_usuario, id_local)
+);
+
+CREATE INDEX idx_usuario_curp ON usuario (curp);
+
+CREATE INDEX idx_usuario_estado ON usuario (estado);
+
+CREATE INDEX idx_usuario_nombre ON usuario (nombre_completo);
+
+CREATE INDEX idx_usuario_telefono ON usuario (telefono);
+
+CREATE INDEX idx_parcela_lat_lon_ha ON parcela (latitud, longitud, hectareas);
+
+CREATE INDEX idx_parcela_usuario ON parcela (id_usuario);
+
+CREATE INDEX idx_cultivo_parcela ON cultivo (id_parcela);
+
+CREATE INDEX idx_gastos_usuario_creado ON gastos (id_usuario, creado_en);
+
+CREATE INDEX idx_score_pendiente ON score (id_usuario) WHERE pendiente > 0;
+
+CREATE INDEX idx_sync_cambio_fila ON sync_cambio (tabla, id_fila);
+
+CREATE INDEX idx_sync_cambio_usuario ON sync_cambio (id_usuario, seq);
+
+CREATE TRIGGER usuario_fts_ai AFTER INSERT ON usuario BEGIN
+        INSERT INTO usuario_fts(rowid, nombre_completo, curp, telefono)
+        VALUES (new.id_usuario, new.nombre_completo, new.curp, new.telefono);
+    END;
+
+CREATE TRIGGER usuario_fts_ad AFTER DELETE ON usuario BEGIN
+        INSERT INTO usuario_fts(usuario_fts, rowid, nombre_completo, curp, telefono)
+        VALUES ('delete', old.id_usuario, old.nombre_completo, old.curp, old.telefono);
+    END;
+
+CREATE TRIGGER usuario_fts_au AFTER UPDATE OF nombre_completo, curp, telefono ON usuario BEGIN
+        INSERT INTO usuario_fts(usuario_fts, rowid, nombre_completo, curp, telefono)
+        VALUES ('delete', old.id_usuario, old.nombre_completo, old.curp, old.telefono);
+        INSERT INTO usuario_fts(rowid, nombre_completo, curp, telefono)
+        VALUES (new.id_usuario, new.nombre_completo, new.curp, new.telefono);
+    END;
+
+CREATE TRIGGER parcela_geo_ai AFTER INSERT ON parcela
+    WHEN new.latitud IS NOT NULL AND new.longitud IS NOT NULL BEGIN
+        INSERT INTO parcela_geo VALUES (new.id_parcela, new.latitud, new.latitud,
+                                        new.longitud, new.longitud);
+    END;
+
+CREATE TRIGGER parcela_geo_ad AFTER DELETE ON parcela BEGIN
+        DELETE FROM parcela_geo WHERE id_parcela = old.id_parcela;
+    END;
+
+CREATE TRIGGER parcela_geo_au AFTER UPDATE OF latitud, longitud ON parcela BEGIN
+        DELETE FROM parcela_geo WHERE id_parcela = old.id_parcela;
+        INSERT INTO parcela_geo SELECT new.id_parcela, new.latitud, new.latitud,
+                                       new.longitud, new.longitud
+        WHERE new.latitud IS NOT NULL AND new.longitud IS NOT NULL;
+    END;
+
+INSERT INTO schema_version (version, nombre) VALUES (1, 'tablas_base');
+
+INSERT INTO schema_version (version, nombre) VALUES (2, 'gastos_creado_en');
+
+INSERT INTO schema_version (version, nombre) VALUES (3, 'indices');
+
+INSERT INTO schema_version (version, nombre) VALUES (4, 'gastos_trimestrales');
+
+INSERT INTO schema_version (version, nombre) VALUES (5, 'usuario_fts');
+
+INSERT INTO schema_version (version, nombre) VALUES (6, 'token_revocado');
+
+INSERT INTO schema_version (version, nombre) VALUES (7, 'score');
+
+INSERT INTO schema_version (version, nombre) VALUES (8, 'gastos_mensuales_archivados');
+
+INSERT INTO schema_version (version, nombre) VALUES (9, 'parcela_geo');
+
+INSERT INTO schema_version (version, nombre) VALUES (10, 'sync_cambio');
@@ -0,0 +1,109 @@
+# geo.py — coordenadas y superficie numéricas de las parcelas, y consultas por zona
+#
+# Parcela.ubicacion es texto libre ('19.54,-96.91' o el nombre de un municipio) y
+# tamano también ('2.3 ha', '2000 m2', '50'). Al escribir una parcela se guardan
+# además latitud, longitud y hectareas ya parseadas (None si el texto no las trae).
+# En SQLite la tabla R*Tree parcela_geo (migración 9) indexa cada parcela como un
+# punto y la mantienen triggers sobre parcela. El R*Tree guarda float32 (redondeado
+# hacia afuera): solo da los ids candidatos, y el filtro exacto usa parcela.latitud/longitud.
+#   - cercanas: ids de la caja en el R*Tree -> filas de parcela por PK -> distancia (haversine)
+#   - mapa por celdas: GROUP BY sobre el índice idx_parcela_lat_lon_ha, que tiene todo
+#     lo que se lee; recorre solo la franja de latitud de la caja. Leer columnas
+#     auxiliares del R*Tree cuesta más cuando la caja abarca buena parte de las filas.
+# Sin R*Tree (PostgreSQL, o SQLite compilado sin el módulo) cercanas filtra
+# latitud/longitud sobre parcela con el mismo índice.
+import math
+import re
+from typing import Optional
+
+from sqlalchemy import text
+
+from puntaje import hectareas
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = 111.32  # de latitud (y de longitud en el ecuador)
+
+_COORDENADAS = re.compile(r"^\s*(-?\d{1,3}(?:\.\d+)?)\s*[,;\s]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+_DIGITO = re.compile(r"\d")
+
+
+def coordenadas(ubicacion: Optional[str]) -> Optional[tuple]:
+    """'19.54,-96.91' -> (19.54, -96.91); None si no son coordenadas válidas."""
+    m = _COORDENADAS.match(ubicacion or "")
+    if not m:
+        return None
+    lat, lon = float(m.group(1)), float(m.group(2))
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def campos_geo(ubicacion: Optional[str], tamano: Optional[str]) -> dict:
+    """latitud, longitud y hectareas derivadas del texto de la parcela."""
+    lat, lon = coordenadas(ubicacion) or (None, None)
+    ha = hectareas(tamano) if tamano and _DIGITO.search(tamano) else None
+    return {"latitud": lat, "longitud": lon, "hectareas": ha}
+
+
+def caja_de_radio(lat: float, lon: float, radio_km: float) -> tuple:
+    """(sur, oeste, norte, este) que contiene el círculo."""
+    dlat = radio_km / KM_POR_GRADO
+    dlon = radio_km / (KM_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6))
+    return max(lat - dlat, -90.0), max(lon - dlon, -180.0), min(lat + dlat, 90.0), min(lon + dlon, 180.0)
+
+
+def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _params_caja(caja: tuple) -> dict:
+    return dict(zip(("sur", "oeste", "norte", "este"), caja))
+
+
+def parcelas_en_caja(session, columnas: list, caja: tuple, usar_rtree: bool,
+                     limite: Optional[int] = None) -> list:
+    """Filas (columnas pedidas) de las parcelas cuyo punto cae en la caja."""
+    seleccion = ", ".join(f"p.{c}" for c in columnas)
+    exacto = "p.latitud BETWEEN :sur AND :norte AND p.longitud BETWEEN :oeste AND :este"
+    sql = f"SELECT {seleccion} FROM parcela p WHERE {exacto}"
+    if usar_rtree:
+        # Con un JOIN SQLite lee el R*Tree fila a fila; con IN arma primero la lista de ids
+        sql += """ AND p.id_parcela IN (SELECT id_parcela FROM parcela_geo
+            WHERE min_lat <= :norte AND max_lat >= :sur AND min_lon <= :este AND max_lon >= :oeste)"""
+    params = _params_caja(caja)
+    if limite is not None:
+        sql += " ORDER BY p.id_parcela LIMIT :limite"
+        params["limite"] = limite
+    return session.execute(text(sql), params).all()
+
+
+def grilla(caja: tuple, celda: float) -> tuple:
+    """(filas, columnas) de celdas de `celda` grados que cubren la caja."""
+    sur, oeste, norte, este = caja
+    return max(1, math.ceil((norte - sur) / celda)), max(1, math.ceil((este - oeste) / celda))
+
+
+def celdas_en_caja(session, caja: tuple, celda: float) -> dict:
+    """{(fila, columna): [parcelas, hectareas, suma lat, suma lon]} por celda de `celda` grados."""
+    filas, columnas = grilla(caja, celda)
+    # Los índices no son negativos: CAST trunca como FLOOR en SQLite
+    piso = "CAST({} AS INTEGER)" if session.get_bind().dialect.name == "sqlite" else "FLOOR({})"
+    filas_sql = session.execute(text(f"""
+        SELECT {piso.format("(latitud - :sur) / :celda")}, {piso.format("(longitud - :oeste) / :celda")},
+               COUNT(*), COALESCE(SUM(hectareas), 0), SUM(latitud), SUM(longitud)
+        FROM parcela
+        WHERE latitud BETWEEN :sur AND :norte AND longitud BETWEEN :oeste AND :este
+        GROUP BY 1, 2"""), {**_params_caja(caja), "celda": celda}).all()
+    # Un punto justo en el borde norte/este se cuenta en la última celda
+    celdas = {}
+    for f, c, n, ha, slat, slon in filas_sql:
+        clave = (min(max(int(f), 0), filas - 1), min(max(int(c), 0), columnas - 1))
+        acc = celdas.setdefault(clave, [0, 0.0, 0.0, 0.0])
+        acc[0] += n
+        acc[1] += float(ha)
+        acc[2] += slat
+        acc[3] += slon
+    return celdas
@@ -0,0 +1,209 @@
+# instrumentacion.py — métricas por ruta, conteo de queries SQL y formato Prometheus
+#
+# - MiddlewareMetricas mide cada request (histograma de latencia y conteo por
+#   status) y agrega el header Server-Timing con el tiempo total y el de DB.
+# - instalar_hooks_sql() engancha before/after_cursor_execute de un engine para
+#   contar queries y tiempo de DB por request (vía contextvar).
+# - Con SLOW_QUERY_MS > 0 las queries más lentas se registran con su
+#   EXPLAIN QUERY PLAN (SQLite) y se marcan las que recorren tablas completas.
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 = desactivado
+BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log_lento = logging.getLogger("fintiva.sql.lento")
+
+# Acumulado de la request en curso: [queries, segundos en DB]
+_stats_request: ContextVar[Optional[list]] = ContextVar("_stats_request", default=None)
+
+# "SCAN gastos" (sin índice) es un recorrido completo; "SCAN t USING INDEX" no cuenta
+_SCAN_COMPLETO = re.compile(r"^SCAN (\w+)$")
+
+
+class Registro:
+    """Contadores del proceso; se exponen en /metrics/prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (método, ruta) -> [conteos por bucket..., +Inf], suma, total
+        self.latencias: Dict[Tuple[str, str], list] = {}
+        self.status: Dict[Tuple[str, str, int], int] = {}
+        self.db_queries: Dict[Tuple[str, str], int] = {}
+        self.db_segundos: Dict[Tuple[str, str], float] = {}
+        self.queries_total = 0
+        self.queries_lentas = 0
+        self.scans_completos = 0
+
+    def observar(self, metodo: str, ruta: str, status: int, dur: float, queries: int, db: float):
+        clave = (metodo, ruta)
+        with self._lock:
+            h = self.latencias.get(clave)
+            if h is None:
+                h = self.latencias[clave] = [[0] * (len(BUCKETS_S) + 1), 0.0, 0]
+            for i, limite in enumerate(BUCKETS_S):
+                if dur <= limite:
+                    h[0][i] += 1
+                    break
+            else:
+                h[0][-1] += 1
+            h[1] += dur
+            h[2] += 1
+            k = (metodo, ruta, status)
+            self.status[k] = self.status.get(k, 0) + 1
+            self.db_queries[clave] = self.db_queries.get(clave, 0) + queries
+            self.db_segundos[clave] = self.db_segundos.get(clave, 0.0) + db
+
+    def contar_query(self):
+        with self._lock:
+            self.queries_total += 1
+
+    def contar_lenta(self, scan_completo: bool):
+        with self._lock:
+            self.queries_lentas += 1
+            if scan_completo:
+                self.scans_completos += 1
+
+    def exposicion(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """Texto en formato de exposición de Prometheus (0.0.4)."""
+        def etiquetas(**kv) -> str:
+            return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in kv.items()) + "}"
+
+        out = [
+            "# HELP fintiva_http_request_duration_seconds Latencia de requests por ruta",
+            "# TYPE fintiva_http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (metodo, ruta), (cuentas, suma, total) in sorted(self.latencias.items()):
+                acumulado = 0
+                for limite, n in zip(BUCKETS_S + (float("inf"),), cuentas):
+                    acumulado += n
+                    le = "+Inf" if limite == float("inf") else repr(limite)
+                    out.append("fintiva_http_request_duration_seconds_bucket"
+                               f"{etiquetas(method=metodo, route=ruta, le=le)} {acumulado}")
+                out.append(f"fintiva_http_request_duration_seconds_sum{etiquetas(method=metodo, route=ruta)} {suma}")
+                out.append(f"fintiva_http_request_duration_seconds_count{etiquetas(method=metodo, route=ruta)} {total}")
+            out += ["# HELP fintiva_http_requests_total Requests por ruta y status",
+                    "# TYPE fintiva_http_requests_total counter"]
+            for (metodo, ruta, status), n in sorted(self.status.items()):
+                out.append(f"fintiva_http_requests_total{etiquetas(method=metodo, route=ruta, status=status)} {n}")
+            out += ["# HELP fintiva_db_queries_total Queries SQL ejecutadas por ruta",
+                    "# TYPE fintiva_db_queries_total counter"]
+            for (metodo, ruta), n in sorted(self.db_queries.items()):
+                out.append(f"fintiva_db_queries_total{etiquetas(method=metodo, route=ruta)} {n}")
+            out += ["# HELP fintiva_db_seconds_total Tiempo en DB por ruta",
+                    "# TYPE fintiva_db_seconds_total counter"]
+            for (metodo, ruta), s in sorted(self.db_segundos.items()):
+                out.append(f"fintiva_db_seconds_total{etiquetas(method=metodo, route=ruta)} {s}")
+            for nombre, valor, ayuda in (
+                ("fintiva_db_queries_all_total", self.queries_total, "Queries SQL del proceso (incluye fuera de requests)"),
+                ("fintiva_db_slow_queries_total", self.queries_lentas, "Queries por encima de SLOW_QUERY_MS"),
+                ("fintiva_db_full_scans_total", self.scans_completos, "Queries lentas con SCAN de tabla completa"),
+            ):
+                out += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter", f"{nombre} {valor}"]
+        for nombre, valor in (extra or {}).items():
+            out += [f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+        return "\n".join(out) + "\n"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registro = Registro()
+
+
+# =========================
+# Hooks de SQLAlchemy
+# =========================
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de la ejecución: si el execute falla (IntegrityError, lock) no
+    # queda nada en la conexión que se empareje con la query siguiente
+    ahora = time.perf_counter()
+    if context is not None:
+        context._t0_sql = ahora
+    else:
+        conn.info["_t0_sql"] = ahora  # ejecuciones internas sin contexto; se pisa en la siguiente
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_t0_sql", None) if context is not None else conn.info.pop("_t0_sql", None)
+    if inicio is None:
+        return
+    dur = time.perf_counter() - inicio
+    stats = _stats_request.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += dur
+    registro.contar_query()
+    if SLOW_QUERY_MS and dur * 1000 >= SLOW_QUERY_MS:
+        _registrar_lenta(conn, cursor, statement, parameters, executemany, dur)
+
+
+def _registrar_lenta(conn, cursor, statement, parameters, executemany, dur):
+    plan = []
+    if conn.dialect.name == "sqlite" and not executemany and statement.lstrip().upper().startswith("SELECT"):
+        try:
+            c = cursor.connection.cursor()
+            c.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            plan = [fila[-1] for fila in c.fetchall()]
+            c.close()
+        except Exception:
+            plan = []
+    scans = [m.group(1) for m in (_SCAN_COMPLETO.match(p) for p in plan) if m]
+    registro.contar_lenta(bool(scans))
+    log_lento.warning(
+        "query lenta %.1f ms%s: %s%s",
+        dur * 1000,
+        f" [SCAN completo: {', '.join(scans)}]" if scans else "",
+        " ".join(statement.split()),
+        ("\n  plan: " + "\n  plan: ".join(plan)) if plan else "",
+    )
+
+
+def instalar_hooks_sql(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _antes)
+    event.listen(engine, "after_cursor_execute", _despues)
+
+
+# =========================
+# Middleware ASGI
+# =========================
+class MiddlewareMetricas:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = [0, 0.0]
+        token = _stats_request.set(stats)
+        inicio = time.perf_counter()
+        status = 500
+
+        async def send_con_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - inicio) * 1000
+                timing = (f'app;dur={total_ms:.1f}, '
+                          f'db;dur={stats[1] * 1000:.1f};desc="{stats[0]} queries"')
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_timing)
+        finally:
+            _stats_request.reset(token)
+            route = scope.get("route")
+            ruta = getattr(route, "path", None) or "sin_ruta"  # plantilla, no el path real
+            registro.observar(scope["method"], ruta, status, time.perf_counter() - inicio, stats[0], stats[1])
@@ -1,15 +1,41 @@
+import os
+import io
+import csv
+import json
+import re
+import base64
+import time
+import uuid
+import zlib
 from typing import List, Optional
-from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response, Path
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text, func, Integer, DateTime, Column
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi.routing import APIRoute
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text, func, insert, update, union_all, bindparam, Date, DateTime, Column, Index, MetaData, Table
+from sqlmodel import SQLModel, Field, Session, select
 
 # === JWT (solo para sesiones) ===
-from jose import jwt
-from pydantic import BaseModel
+from jose import JWTError, jwt
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from cache_metricas import CacheMetricas
+from db import ARCHIVO_DB, DATABASE_URL, DB_ASYNC, engine, async_engine, get_session, parte_fecha
+from migraciones import migrar, tabla_existe
+from contrasenas import Saturado, ServicioHash
+from cola_escritura import ColaEscritura
+from eventos import CanalEventos
+from respuestas import columnas_pedidas, dumps, filas_json, respuesta_json
+from sesiones import CacheClaims, Revocaciones
+from instrumentacion import MiddlewareMetricas, instalar_hooks_sql, registro as registro_metricas
+from puntaje import MODELO_VERSION, VARIABLES, ServicioScore, marcar_pendientes
+from sincronizacion import (cambios_desde, registrar_altas, olvidar_usuario, registrar_cambio,
+                            registrar_subidas, subidas_previas)
+from geo import caja_de_radio, campos_geo, celdas_en_caja, distancia_km, grilla, parcelas_en_caja
 
 SECRET_KEY = "CAMBIA-ESTE-VALOR-LARGO-Y-ALEATORIO"
 ALGORITHM = "HS256"
@@ -17,23 +43,32 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 120
 
 def create_access_token(data: dict, minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
     to_encode = data.copy()
-    to_encode.update({"exp": datetime.utcnow() + timedelta(minutes=minutes)})
+    ahora = time.time()
+    # iat con milisegundos: un login justo después de un cambio de contraseña ya vale
+    to_encode.update({"exp": int(ahora + minutes * 60), "iat": round(ahora, 3),
+                      "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 # =========================
 # MODELOS (tablas)
 # =========================
 class Usuario(SQLModel, table=True):
+    __table_args__ = (
+        Index("idx_usuario_curp", "curp"),
+        Index("idx_usuario_telefono", "telefono"),  # login por teléfono
+        Index("idx_usuario_estado", "estado"),
+        Index("idx_usuario_nombre", "nombre_completo"),  # orden/rango del reporte de cultivos
+    )
     id_usuario: Optional[int] = Field(default=None, primary_key=True)
     nombre_completo: str
-    # Guardado en TEXTO PLANO por requerimiento
+    # scrypt (ver contrasenas.py); las filas viejas en texto plano se re-hashean al iniciar sesión
     contrasena_hash: str
     sociedad: Optional[str] = None
     dia_nac: Optional[int] = None
     mes_nac: Optional[int] = None
     anio_nac: Optional[int] = None
-    curp: Optional[str] = Field(default=None, max_length=18, index=True)
-    telefono: Optional[str] = Field(default=None, index=True)
+    curp: Optional[str] = Field(default=None, max_length=18)
+    telefono: Optional[str] = None
     calle: Optional[str] = None
     colonia: Optional[str] = None
     municipio: Optional[str] = None
@@ -42,6 +77,11 @@ class Usuario(SQLModel, table=True):
     telefono_referencia: Optional[str] = None
 
 class Parcela(SQLModel, table=True):
+    __table_args__ = (
+        Index("idx_parcela_usuario", "id_usuario"),
+        # Cubre /parcelas/mapa: una caja chica recorre solo su franja de latitud
+        Index("idx_parcela_lat_lon_ha", "latitud", "longitud", "hectareas"),
+    )
     id_parcela: Optional[int] = Field(default=None, primary_key=True)
     id_usuario: int = Field(foreign_key="usuario.id_usuario")
     nombre_parcela: str
@@ -49,8 +89,13 @@ class Parcela(SQLModel, table=True):
     tamano: Optional[str] = None
     tipo_tenencia: Optional[str] = None
     sistema_riego: Optional[str] = None
+    # Derivadas de ubicacion y tamano al escribir (ver geo.py); en SQLite las indexa parcela_geo
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+    hectareas: Optional[float] = None
 
 class Cultivo(SQLModel, table=True):
+    __table_args__ = (Index("idx_cultivo_parcela", "id_parcela"),)
     id_cultivo: Optional[int] = Field(default=None, primary_key=True)
     id_parcela: int = Field(foreign_key="parcela.id_parcela")
     tipo_cultivo: str
@@ -60,6 +105,8 @@ class Cultivo(SQLModel, table=True):
     produccion_anio_antepasado: Optional[int] = None
 
 class Gastos(SQLModel, table=True):
+    # Rango por usuario y fecha (métricas, series) sin recorrer todo el historial
+    __table_args__ = (Index("idx_gastos_usuario_creado", "id_usuario", "creado_en"),)
     id_gastos: Optional[int] = Field(default=None, primary_key=True)
     id_usuario: int = Field(foreign_key="usuario.id_usuario")
     gasto_agua: float = 0.0
@@ -75,6 +122,96 @@ class Gastos(SQLModel, table=True):
         sa_column=Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
     )
 
+# Acumulado de gastos por (usuario, año, trimestre); se mantiene en cada alta de gastos
+class GastosTrimestrales(SQLModel, table=True):
+    __tablename__ = "gastos_trimestrales"
+    id_usuario: int = Field(foreign_key="usuario.id_usuario", primary_key=True)
+    anio: int = Field(primary_key=True)
+    trimestre: int = Field(primary_key=True)  # 1..4
+    registros: int = 0
+    gasto_agua: float = 0.0
+    gasto_gas: float = 0.0
+    gasto_luz: float = 0.0
+    gasto_semillas: float = 0.0
+    gasto_fertilizantes: float = 0.0
+    gasto_mantenimiento: float = 0.0
+    gasto_combustible: float = 0.0
+    total: float = 0.0
+
+# Totales por (usuario, año, mes) de los gastos movidos al archivo frío (ver archivo.py)
+class GastosMensualesArchivados(SQLModel, table=True):
+    __tablename__ = "gastos_mensuales_archivados"
+    id_usuario: int = Field(foreign_key="usuario.id_usuario", primary_key=True)
+    anio: int = Field(primary_key=True)
+    mes: int = Field(primary_key=True)  # 1..12
+    registros: int = 0
+    gasto_agua: float = 0.0
+    gasto_gas: float = 0.0
+    gasto_luz: float = 0.0
+    gasto_semillas: float = 0.0
+    gasto_fertilizantes: float = 0.0
+    gasto_mantenimiento: float = 0.0
+    gasto_combustible: float = 0.0
+    total: float = 0.0
+    ultimo: Optional[datetime] = None  # creado_en más reciente archivado en ese mes
+
+# Los mismos gastos ya archivados: archivo.gastos en el SQLite adjunto (solo lectura aquí)
+gastos_archivo = Table("gastos", MetaData(schema="archivo"),
+                       *(Column(c.name, c.type) for c in Gastos.__table__.columns))
+
+# Logout (jti) o cambio de contraseña (id_usuario: revoca todo lo emitido antes)
+class TokenRevocado(SQLModel, table=True):
+    __tablename__ = "token_revocado"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    jti: Optional[str] = None
+    id_usuario: Optional[int] = None  # sin FK: también se escribe al borrar el usuario
+    revocado_en: float  # epoch
+    expira_en: float    # después de esto la fila ya no revoca nada vigente
+
+# Score crediticio (ver puntaje.py); pendiente > 0 = hay cambios sin recalcular
+class Score(SQLModel, table=True):
+    __tablename__ = "score"
+    __table_args__ = (
+        # Solo las filas pendientes: el recálculo incremental no recorre toda la tabla
+        Index("idx_score_pendiente", "id_usuario",
+              sqlite_where=text("pendiente > 0"), postgresql_where=text("pendiente > 0")),
+    )
+    id_usuario: int = Field(primary_key=True)  # sin FK, como token_revocado; borrar_usuario la quita
+    puntaje: Optional[float] = None  # 300..850
+    nivel: Optional[str] = Field(default=None, max_length=1)  # A..E
+    hectareas: Optional[float] = None
+    tenencia: Optional[float] = None
+    riego: Optional[float] = None
+    rendimiento: Optional[float] = None
+    crecimiento: Optional[float] = None
+    historial: Optional[float] = None
+    estabilidad: Optional[float] = None
+    diversificacion: Optional[float] = None
+    version: Optional[int] = None
+    calculado_en: Optional[datetime] = None
+    pendiente: int = 0
+
+# Registro de cambios para /sync (ver sincronizacion.py)
+class SyncCambio(SQLModel, table=True):
+    __tablename__ = "sync_cambio"
+    __table_args__ = (
+        Index("idx_sync_cambio_usuario", "id_usuario", "seq"),  # lo posterior al token de un usuario
+        Index("idx_sync_cambio_fila", "tabla", "id_fila"),
+        {"sqlite_autoincrement": True},  # seq nunca se reutiliza
+    )
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    id_usuario: int  # sin FK, como score: borrar_usuario limpia lo suyo
+    tabla: str = Field(max_length=16)
+    id_fila: int
+
+# id del servidor de cada id_local subido por POST /sync (reintentos idempotentes)
+class SyncSubida(SQLModel, table=True):
+    __tablename__ = "sync_subida"
+    id_usuario: int = Field(primary_key=True)
+    id_local: str = Field(primary_key=True, max_length=64)
+    tabla: str = Field(max_length=16)
+    id_fila: int
+
 # =========================
 # Schemas (entradas/salidas)
 # =========================
@@ -89,19 +226,25 @@ class UsuarioOut(BaseModel):
 
 class RegistrarUsuarioIn(BaseModel):
     nombre_completo: str
-    contrasena: str                 # TEXTO PLANO
+    contrasena: str
     curp: Optional[str] = None
     telefono: Optional[str] = None
     estado: Optional[str] = None
 
 class LoginIn(BaseModel):
     identificador: str  # teléfono o CURP
-    contrasena: str     # TEXTO PLANO
+    contrasena: str
 
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+# Lo que viaja en el token: suficiente para la mayoría de las rutas sin ir a la DB
+class UsuarioActual(BaseModel):
+    id_usuario: int
+    nombre_completo: str
+    estado: Optional[str] = None
+
 class GastosIn(SQLModel):
     id_usuario: Optional[int] = None
     gasto_agua: Optional[float] = 0.0
@@ -112,25 +255,86 @@ class GastosIn(SQLModel):
     gasto_mantenimiento: Optional[float] = 0.0
     gasto_combustible: Optional[float] = 0.0
 
+# Filas de carga masiva (/bulk/*): se validan una por una antes del INSERT.
+# Una columna desconocida (p. ej. mal escrita) es un error, no un valor perdido en silencio
+class ParcelaIn(SQLModel):
+    model_config = ConfigDict(extra="forbid")
+    id_usuario: int
+    nombre_parcela: str
+    ubicacion: Optional[str] = None
+    tamano: Optional[str] = None
+    tipo_tenencia: Optional[str] = None
+    sistema_riego: Optional[str] = None
+
+class CultivoIn(SQLModel):
+    model_config = ConfigDict(extra="forbid")
+    id_parcela: int
+    tipo_cultivo: str
+    mes_siembra: Optional[int] = None
+    mes_cosecha: Optional[int] = None
+    produccion_anio_pasado: Optional[int] = None
+    produccion_anio_antepasado: Optional[int] = None
+
+class GastosBulkIn(GastosIn):
+    model_config = ConfigDict(extra="forbid")
+    id_usuario: int
+    creado_en: Optional[datetime] = None  # historial importado; por defecto, ahora
+
+class BulkOut(BaseModel):
+    insertados: int
+    ids: List[int]
+    errores: List[dict]
+
+# Fila de /usuarios: todo menos contrasena_hash
+class UsuarioPublico(BaseModel):
+    id_usuario: int
+    nombre_completo: str
+    sociedad: Optional[str] = None
+    dia_nac: Optional[int] = None
+    mes_nac: Optional[int] = None
+    anio_nac: Optional[int] = None
+    curp: Optional[str] = None
+    telefono: Optional[str] = None
+    calle: Optional[str] = None
+    colonia: Optional[str] = None
+    municipio: Optional[str] = None
+    estado: Optional[str] = None
+    persona_referenciada: Optional[str] = None
+    telefono_referencia: Optional[str] = None
+
+class ScoreOut(BaseModel):
+    id_usuario: int
+    puntaje: float
+    nivel: str
+    variables: dict
+    version: int
+    calculado_en: datetime
+
 # =========================
 # DB ENGINE / SESSION
 # =========================
-BASE_DIR = Path(__file__).resolve().parent
-DB_FILE = (BASE_DIR / "db.sqlite3").as_posix()
-DATABASE_URL = f"sqlite:///{DB_FILE}"
+def create_db_and_tables() -> list:
+    """Aplica las migraciones pendientes (ver migraciones.py)."""
+    return migrar(engine)
 
-engine = create_engine(
-    DATABASE_URL,
-    echo=False,
-    connect_args={"check_same_thread": False},
-)
+# Respuestas de /metrics/* por usuario; se invalidan en cada escritura de ese usuario
+METRICS_CACHE_MAX = int(os.getenv("METRICS_CACHE_MAX", "1024"))
+# Tope de antigüedad: lo que escriben otros procesos se ve a lo sumo con este retraso
+METRICS_CACHE_TTL_S = float(os.getenv("METRICS_CACHE_TTL_S", "300"))
+cache_metricas = CacheMetricas(METRICS_CACHE_MAX, METRICS_CACHE_TTL_S)
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+# Deltas de esas métricas en vivo por SSE (ver eventos.py); se publican junto a cada invalidación
+EVENTOS_MAX_ITEMS = int(os.getenv("EVENTOS_MAX_ITEMS", "200"))  # más que esto: "recargar"
+canal_eventos = CanalEventos(
+    max_conexiones=int(os.getenv("EVENTOS_MAX_CONEXIONES", "1000")),
+    heartbeat_s=float(os.getenv("EVENTOS_HEARTBEAT_S", "15")),
+)
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+def _avisar(id_usuario: int, metrica: str, items: list) -> None:
+    if len(items) > EVENTOS_MAX_ITEMS:
+        canal_eventos.publicar(id_usuario, "recargar", {})
+    elif items:
+        canal_eventos.publicar(id_usuario, metrica, {"items": items})
 
 # =========================
 # APP
@@ -150,21 +354,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Next-Cursor"],
 )
+# Latencia por ruta, queries por request y Server-Timing (ver instrumentacion.py)
+app.add_middleware(MiddlewareMetricas)
+instalar_hooks_sql(engine)
+if async_engine is not None:
+    instalar_hooks_sql(async_engine.sync_engine)
+
+# /usuarios?q= usa usuario_fts si la migración pudo crearla (SQLite con FTS5)
+usuario_fts_activo = False
+# /parcelas/cercanas y /parcelas/mapa usan el R*Tree parcela_geo si existe
+parcela_geo_activo = False
 
 # ÚNICA función de startup
 @app.on_event("startup")
 def on_startup():
-    print(">>> DB path:", (BASE_DIR / "db.sqlite3").resolve())
-    create_db_and_tables()
-    # Garantiza la columna 'creado_en' si la DB ya existía
+    global usuario_fts_activo, parcela_geo_activo
+    print(">>> DB:", engine.url.render_as_string(hide_password=True))
+    # Con la versión al día es una sola consulta; si no, aplica lo pendiente en una transacción
+    aplicadas = create_db_and_tables()
+    if aplicadas:
+        print(">>> Migraciones aplicadas:", aplicadas)
     with engine.connect() as conn:
-        try:
-            conn.exec_driver_sql(
-                "ALTER TABLE gastos ADD COLUMN creado_en DATETIME DEFAULT (CURRENT_TIMESTAMP);"
-            )
-        except Exception:
-            pass  # ya existe
+        usuario_fts_activo = tabla_existe(conn, "usuario_fts")
+        parcela_geo_activo = tabla_existe(conn, "parcela_geo")
+    # La calibración del hash (~0.3 s) corre en su pool: no retrasa el arranque ni bloquea el loop
+    servicio_hash.iniciar()
+    # Primer snapshot de analítica en segundo plano; luego se refresca cada ANALITICA_REFRESCO_S
+    analitica.iniciar()
+    # Scores pendientes (escrituras en parcelas/cultivos/gastos) cada SCORE_REFRESCO_S
+    servicio_score.iniciar()
+    # archivo.gastos en el SQLite adjunto; con ARCHIVO_INTERVALO_S > 0, archivado periódico
+    archivo_gastos.iniciar()
 
 # =========================
 # ROOT & HEALTH
@@ -178,69 +400,230 @@ def health():
     return {"status": "ok"}
 
 # =========================
-# AUTH (registro + login) – SIN HASHES
+# AUTH (registro + login)
 # =========================
-@app.post("/auth/register", response_model=UsuarioOut, status_code=201)
-def registrar_usuario(payload: RegistrarUsuarioIn, session: Session = Depends(get_session)):
-    if payload.telefono:
-        if session.exec(select(Usuario).where(Usuario.telefono == payload.telefono)).first():
-            raise HTTPException(409, "Teléfono ya registrado")
-    if payload.curp:
-        if session.exec(select(Usuario).where(Usuario.curp == payload.curp)).first():
-            raise HTTPException(409, "CURP ya registrada")
+# Hash de contraseñas en un pool acotado; con la cola llena se responde 503
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+servicio_hash = ServicioHash(
+    workers=HASH_WORKERS,
+    # ~8 hashes en espera por worker: a lo sumo ~1 s de cola con el objetivo de 100 ms
+    cola_max=int(os.getenv("HASH_COLA_MAX", str(8 * HASH_WORKERS))),
+    objetivo_ms=float(os.getenv("HASH_OBJETIVO_MS", "100")),
+    ln=int(os.environ["HASH_LN"]) if os.getenv("HASH_LN") else None,
+    # Memoria por hash en curso (pico: HASH_WORKERS × esto); acota el ln de la calibración
+    mem_max=int(os.getenv("HASH_MEM_MAX_MB", "64")) * 1024 * 1024,
+)
+
+@app.exception_handler(Saturado)
+def servicio_saturado(request: Request, exc: Saturado):
+    return JSONResponse({"detail": "Servicio ocupado, intenta de nuevo"}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+# Claims verificados por digest del token; la revocación se consulta en memoria
+CLAIMS_CACHE_MAX = int(os.getenv("CLAIMS_CACHE_MAX", "10000"))
+CLAIMS_CACHE_TTL_S = float(os.getenv("CLAIMS_CACHE_TTL_S", "300"))
+REVOCACION_REFRESCO_S = float(os.getenv("REVOCACION_REFRESCO_S", "5"))
 
+def _cargar_revocaciones(desde_id: int) -> list:
+    with Session(engine) as session:
+        return session.exec(
+            select(TokenRevocado.id, TokenRevocado.jti, TokenRevocado.id_usuario,
+                   TokenRevocado.revocado_en, TokenRevocado.expira_en)
+            .where(TokenRevocado.id > desde_id, TokenRevocado.expira_en > time.time())
+            .order_by(TokenRevocado.id)
+        ).all()
+
+cache_claims = CacheClaims(CLAIMS_CACHE_MAX, CLAIMS_CACHE_TTL_S)
+revocaciones = Revocaciones(_cargar_revocaciones, REVOCACION_REFRESCO_S)
+bearer = HTTPBearer(auto_error=False)
+
+def _no_autorizado(detalle: str) -> HTTPException:
+    return HTTPException(401, detalle, headers={"WWW-Authenticate": "Bearer"})
+
+def verificar_token(token: str) -> dict:
+    claims = cache_claims.obtener(token)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise _no_autorizado("Token inválido o expirado")
+        if not claims.get("sub") or not claims.get("jti"):
+            raise _no_autorizado("Token inválido o expirado")
+        cache_claims.guardar(token, claims)
+    if revocaciones.revocado(claims):
+        raise _no_autorizado("Sesión cerrada")
+    return claims
+
+async def current_user(
+    credenciales: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+) -> UsuarioActual:
+    """Usuario del Bearer token. async: el camino con caché no pasa por el threadpool."""
+    if credenciales is None:
+        raise _no_autorizado("Falta el token")
+    if revocaciones.necesita_refresco():
+        await run_in_threadpool(revocaciones.refrescar)
+    claims = verificar_token(credenciales.credentials)
+    return UsuarioActual(id_usuario=int(claims["sub"]), nombre_completo=claims.get("name", ""),
+                         estado=claims.get("estado"))
+
+def revocar_tokens_de_usuario(session: Session, id_usuario: int) -> dict:
+    """Invalida todos los tokens emitidos hasta ahora (cambio de contraseña, baja).
+    La fila entra en la transacción del llamador; después de su commit,
+    revocaciones.agregar(**lo devuelto) la aplica en este proceso."""
+    ahora = time.time()
+    revocacion = {"id_usuario": id_usuario, "revocado_en": ahora,
+                  "expira_en": ahora + ACCESS_TOKEN_EXPIRE_MINUTES * 60}
+    session.add(TokenRevocado(**revocacion))
+    return revocacion
+
+# register/login son async y usan sesiones cortas en el threadpool: mientras se
+# espera el hash no se retiene ni un worker del threadpool ni una conexión del pool
+def _validar_registro(payload: RegistrarUsuarioIn) -> None:
+    with Session(engine) as session:
+        if payload.telefono:
+            if session.exec(select(Usuario).where(Usuario.telefono == payload.telefono)).first():
+                raise HTTPException(409, "Teléfono ya registrado")
+        if payload.curp:
+            if session.exec(select(Usuario).where(Usuario.curp == payload.curp)).first():
+                raise HTTPException(409, "CURP ya registrada")
+
+def _guardar_usuario(user: Usuario) -> Usuario:
+    with Session(engine) as session:
+        session.add(user)
+        session.flush()
+        marcar_pendientes(session, [user.id_usuario])
+        registrar_altas(session, "usuario", [(user.id_usuario, user.id_usuario)])
+        session.commit()
+        session.refresh(user)
+        return user
+
+@app.post("/auth/register", response_model=UsuarioOut, status_code=201)
+async def registrar_usuario(payload: RegistrarUsuarioIn):
+    await run_in_threadpool(_validar_registro, payload)
     user = Usuario(
         nombre_completo=payload.nombre_completo,
-        contrasena_hash=payload.contrasena,   # TEXTO PLANO
+        contrasena_hash=await servicio_hash.hashear(payload.contrasena),
         curp=payload.curp,
         telefono=payload.telefono,
         estado=payload.estado,
     )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
-    return user
+    return await run_in_threadpool(_guardar_usuario, user)
 
-@app.post("/auth/login", response_model=TokenResponse)
-def login(payload: LoginIn, session: Session = Depends(get_session)):
-    user = session.exec(
-        select(Usuario).where(
-            (Usuario.telefono == payload.identificador) | (Usuario.curp == payload.identificador)
-        )
-    ).first()
+def _buscar_para_login(identificador: str) -> Optional[Usuario]:
+    with Session(engine) as session:
+        return session.exec(
+            select(Usuario).where(
+                (Usuario.telefono == identificador) | (Usuario.curp == identificador)
+            )
+        ).first()
 
-    # Comparación en TEXTO PLANO
-    if not user or (user.contrasena_hash or "") != payload.contrasena:
+def _actualizar_hash(id_usuario: int, nuevo: str) -> None:
+    with Session(engine) as session:
+        session.execute(update(Usuario).where(Usuario.id_usuario == id_usuario)
+                        .values(contrasena_hash=nuevo))
+        session.commit()
+
+@app.post("/auth/login", response_model=TokenResponse)
+async def login(payload: LoginIn):
+    user = await run_in_threadpool(_buscar_para_login, payload.identificador)
+    guardado = (user.contrasena_hash or "") if user else None
+    # Sin usuario se verifica igual contra un hash de referencia (mismo tiempo de respuesta)
+    if not await servicio_hash.verificar(payload.contrasena, guardado) or not user:
         raise HTTPException(401, "Credenciales inválidas")
 
-    token = create_access_token({"sub": str(user.id_usuario), "name": user.nombre_completo})
+    # Texto plano heredado o parámetros viejos: se re-hashea ahora que tenemos la contraseña
+    if servicio_hash.necesita_rehash(guardado):
+        try:
+            await run_in_threadpool(_actualizar_hash, user.id_usuario,
+                                    await servicio_hash.hashear(payload.contrasena))
+            servicio_hash.contar_rehash()
+        except Saturado:
+            pass  # se intenta en el próximo login
+
+    token = create_access_token({"sub": str(user.id_usuario), "name": user.nombre_completo,
+                                 "estado": user.estado})
     return TokenResponse(access_token=token)
 
+@app.get("/auth/me", response_model=UsuarioActual)
+async def usuario_actual(usuario: UsuarioActual = Depends(current_user)):
+    return usuario
+
+@app.post("/auth/logout", status_code=204)
+def logout(
+    credenciales: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+    session: Session = Depends(get_session),
+):
+    if credenciales is None:
+        raise _no_autorizado("Falta el token")
+    claims = verificar_token(credenciales.credentials)
+    fila = TokenRevocado(jti=claims["jti"], revocado_en=time.time(), expira_en=float(claims["exp"]))
+    session.add(fila)
+    session.commit()
+    revocaciones.agregar(jti=fila.jti, expira_en=fila.expira_en)
+    return
+
 # =========================
 # USUARIOS (CRUD)
 # =========================
 @app.post("/usuarios", response_model=Usuario, status_code=201)
 def crear_usuario(payload: Usuario, session: Session = Depends(get_session)):
+    payload.contrasena_hash = servicio_hash.hashear_bloqueante(payload.contrasena_hash)
     session.add(payload)
+    session.flush()
+    marcar_pendientes(session, [payload.id_usuario])
+    registrar_altas(session, "usuario", [(payload.id_usuario, payload.id_usuario)])
     session.commit()
     session.refresh(payload)
     return payload
 
-@app.get("/usuarios", response_model=List[Usuario])
+def _consulta_fts(q: str) -> Optional[str]:
+    # Cada palabra como prefijo entre comillas (AND implícito): "per"* "osc"*
+    palabras = re.findall(r"\w+", q)
+    return " ".join(f'"{p}"*' for p in palabras) or None
+
+# Listas: solo las columnas pedidas (?fields=), como tuplas y sin validar fila por fila
+USUARIO_COLUMNAS = tuple(c.name for c in Usuario.__table__.columns if c.name != "contrasena_hash")
+PARCELA_COLUMNAS = tuple(c.name for c in Parcela.__table__.columns)
+CULTIVO_COLUMNAS = tuple(c.name for c in Cultivo.__table__.columns)
+GASTOS_COLUMNAS = tuple(c.name for c in Gastos.__table__.columns)
+FIELDS_DESC = "Columnas separadas por coma; por defecto todas"
+
+def _select_columnas(tabla, columnas: list):
+    return select(*(tabla.c[c] for c in columnas))
+
+@app.get("/usuarios", response_model=List[UsuarioPublico])
 def listar_usuarios(
-    q: Optional[str] = Query(None, description="Busca por nombre (contains)"),
+    request: Request,
+    q: Optional[str] = Query(None, description="Busca por nombre, CURP o teléfono (prefijo, sin acentos)"),
     estado: Optional[str] = Query(None),
+    cursor: Optional[int] = Query(None, ge=0, description="X-Next-Cursor de la página anterior"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
     session: Session = Depends(get_session),
 ):
-    stmt = select(Usuario)
+    columnas = columnas_pedidas(fields, USUARIO_COLUMNAS)
+    # id_usuario siempre se lee: es el cursor de la página siguiente
+    con_id = columnas if "id_usuario" in columnas else ["id_usuario"] + columnas
+    stmt = _select_columnas(Usuario.__table__, con_id)
     if q:
-        stmt = stmt.where(Usuario.nombre_completo.contains(q))
+        consulta = _consulta_fts(q) if usuario_fts_activo else None
+        if consulta:
+            ids = text("SELECT rowid FROM usuario_fts WHERE usuario_fts MATCH :consulta")
+            stmt = stmt.where(Usuario.id_usuario.in_(ids.bindparams(consulta=consulta)))
+        else:
+            stmt = stmt.where(Usuario.nombre_completo.contains(q))
     if estado:
         stmt = stmt.where(Usuario.estado == estado)
-    stmt = stmt.offset(skip).limit(limit)
-    return session.exec(stmt).all()
+    # Keyset sobre la PK: páginas profundas sin recorrer las anteriores
+    if cursor is not None:
+        stmt = stmt.where(Usuario.id_usuario > cursor)
+    stmt = stmt.order_by(Usuario.id_usuario).offset(skip).limit(limit)
+    rows = session.execute(stmt).all()
+    headers = {"X-Next-Cursor": str(rows[-1].id_usuario)} if len(rows) == limit else None
+    if con_id is not columnas:
+        rows = [r[1:] for r in rows]
+    return respuesta_json(request, filas_json(columnas, rows), headers)
 
 @app.get("/usuarios/{id_usuario}", response_model=Usuario)
 def obtener_usuario(id_usuario: int, session: Session = Depends(get_session)):
@@ -260,11 +643,23 @@ def actualizar_usuario(
         raise HTTPException(404, "Usuario no encontrado")
     data = payload.model_dump(exclude_unset=True)
     data.pop("id_usuario", None)
+    cambio_contrasena = "contrasena_hash" in data
+    if cambio_contrasena:
+        # El campo llega con la contraseña nueva en claro
+        data["contrasena_hash"] = servicio_hash.hashear_bloqueante(data["contrasena_hash"])
     for k, v in data.items():
         setattr(obj, k, v)
     session.add(obj)
+    if set(data) - {"contrasena_hash"}:
+        registrar_cambio(session, "usuario", id_usuario, id_usuario)
+    # Contraseña nueva y revocación de los tokens anteriores en la misma transacción
+    revocacion = revocar_tokens_de_usuario(session, id_usuario) if cambio_contrasena else None
     session.commit()
     session.refresh(obj)
+    if revocacion:
+        revocaciones.agregar(**revocacion)
+    cache_metricas.invalidar(id_usuario)  # el dashboard incluye los datos del usuario
+    canal_eventos.publicar(id_usuario, "usuario", {"campos": sorted(set(data) - {"contrasena_hash"})})
     return obj
 
 @app.delete("/usuarios/{id_usuario}", status_code=204)
@@ -273,7 +668,13 @@ def borrar_usuario(id_usuario: int, session: Session = Depends(get_session)):
     if not obj:
         raise HTTPException(404, "Usuario no encontrado")
     session.delete(obj)
+    session.execute(text("DELETE FROM score WHERE id_usuario = :id"), {"id": id_usuario})
+    olvidar_usuario(session, id_usuario)
+    revocacion = revocar_tokens_de_usuario(session, id_usuario)
     session.commit()
+    revocaciones.agregar(**revocacion)
+    cache_metricas.invalidar(id_usuario)
+    canal_eventos.publicar(id_usuario, "usuario", {"borrado": True})
     return
 
 # =========================
@@ -283,11 +684,91 @@ def borrar_usuario(id_usuario: int, session: Session = Depends(get_session)):
 def crear_parcela(payload: Parcela, session: Session = Depends(get_session)):
     if not session.get(Usuario, payload.id_usuario):
         raise HTTPException(400, "id_usuario inválido")
+    payload.sqlmodel_update(campos_geo(payload.ubicacion, payload.tamano))
     session.add(payload)
+    session.flush()
+    marcar_pendientes(session, [payload.id_usuario])
+    registrar_altas(session, "parcela", [(payload.id_usuario, payload.id_parcela)])
     session.commit()
     session.refresh(payload)
+    cache_metricas.invalidar(payload.id_usuario)
+    _avisar(payload.id_usuario, "parcelas-cultivos",
+            [{"id_parcela": payload.id_parcela, "parcela": payload.nombre_parcela, "cultivos": 0}])
     return payload
 
+# Por zona (ver geo.py); van antes de /parcelas/{id_parcela} para que esa ruta no las capture
+MAPA_MAX_CELDAS = int(os.getenv("MAPA_MAX_CELDAS", "10000"))
+
+def _caja(sur: Optional[float], oeste: Optional[float], norte: Optional[float],
+          este: Optional[float]) -> Optional[tuple]:
+    dados = [v is not None for v in (sur, oeste, norte, este)]
+    if not any(dados):
+        return None
+    if not all(dados):
+        raise HTTPException(422, "La caja necesita sur, oeste, norte y este")
+    if sur > norte or oeste > este:
+        raise HTTPException(422, "La caja debe cumplir sur <= norte y oeste <= este")
+    return (sur, oeste, norte, este)
+
+@app.get("/parcelas/cercanas", response_model=List[Parcela])
+def parcelas_cercanas(
+    request: Request,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radio_km: Optional[float] = Query(None, gt=0, le=500),
+    sur: Optional[float] = Query(None, ge=-90, le=90),
+    oeste: Optional[float] = Query(None, ge=-180, le=180),
+    norte: Optional[float] = Query(None, ge=-90, le=90),
+    este: Optional[float] = Query(None, ge=-180, le=180),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    session: Session = Depends(get_session),
+):
+    """Parcelas a radio_km de (lat, lon), de la más cercana a la más lejana, o dentro de una caja."""
+    columnas = columnas_pedidas(fields, PARCELA_COLUMNAS)
+    caja = _caja(sur, oeste, norte, este)
+    if caja is not None:
+        if lat is not None or lon is not None or radio_km is not None:
+            raise HTTPException(422, "Usa lat/lon/radio_km o sur/oeste/norte/este, no ambos")
+        filas = parcelas_en_caja(session, columnas, caja, parcela_geo_activo, limit)
+        return respuesta_json(request, filas_json(columnas, filas))
+    if lat is None or lon is None or radio_km is None:
+        raise HTTPException(422, "Faltan lat, lon y radio_km (o la caja sur/oeste/norte/este)")
+    # Candidatos de la caja que contiene el círculo; la distancia exacta se calcula aquí
+    leidas = list(dict.fromkeys(["latitud", "longitud", *columnas]))
+    posiciones = [leidas.index(c) for c in columnas]
+    cerca = []
+    for f in parcelas_en_caja(session, leidas, caja_de_radio(lat, lon, radio_km), parcela_geo_activo):
+        d = distancia_km(lat, lon, f[0], f[1])
+        if d <= radio_km:
+            cerca.append((d, f))
+    cerca.sort(key=lambda x: x[0])
+    filas = [(*(f[i] for i in posiciones), round(d, 3)) for d, f in cerca[:limit]]
+    return respuesta_json(request, filas_json([*columnas, "distancia_km"], filas))
+
+@app.get("/parcelas/mapa")
+def mapa_parcelas(
+    sur: float = Query(..., ge=-90, le=90),
+    oeste: float = Query(..., ge=-180, le=180),
+    norte: float = Query(..., ge=-90, le=90),
+    este: float = Query(..., ge=-180, le=180),
+    celda: float = Query(0.1, gt=0, le=10, description="Lado de la celda en grados"),
+    session: Session = Depends(get_session),
+):
+    """Parcelas y hectáreas por celda de la grilla, con el centro medio de cada celda."""
+    caja = _caja(sur, oeste, norte, este)
+    filas, columnas = grilla(caja, celda)
+    if filas * columnas > MAPA_MAX_CELDAS:
+        raise HTTPException(422, f"Demasiadas celdas ({filas * columnas}); usa una celda más grande")
+    items = [
+        {"fila": f, "columna": c, "sur": round(sur + f * celda, 6), "oeste": round(oeste + c * celda, 6),
+         "parcelas": n, "hectareas": round(ha, 4), "lat": round(slat / n, 6), "lon": round(slon / n, 6)}
+        for (f, c), (n, ha, slat, slon) in sorted(celdas_en_caja(session, caja, celda).items())
+    ]
+    return {"celda": celda, "filas": filas, "columnas": columnas,
+            "parcelas": sum(i["parcelas"] for i in items),
+            "hectareas": round(sum(i["hectareas"] for i in items), 4), "items": items}
+
 @app.get("/parcelas/{id_parcela}", response_model=Parcela)
 def obtener_parcela(id_parcela: int, session: Session = Depends(get_session)):
     obj = session.get(Parcela, id_parcela)
@@ -296,20 +777,33 @@ def obtener_parcela(id_parcela: int, session: Session = Depends(get_session)):
     return obj
 
 @app.get("/usuarios/{id_usuario}/parcelas", response_model=List[Parcela])
-def parcelas_de_usuario(id_usuario: int, session: Session = Depends(get_session)):
-    stmt = select(Parcela).where(Parcela.id_usuario == id_usuario)
-    return session.exec(stmt).all()
+def parcelas_de_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    session: Session = Depends(get_session),
+):
+    columnas = columnas_pedidas(fields, PARCELA_COLUMNAS)
+    stmt = _select_columnas(Parcela.__table__, columnas).where(Parcela.id_usuario == id_usuario)
+    return respuesta_json(request, filas_json(columnas, session.execute(stmt)))
 
 # =========================
 # CULTIVOS
 # =========================
 @app.post("/cultivos", response_model=Cultivo, status_code=201)
 def crear_cultivo(payload: Cultivo, session: Session = Depends(get_session)):
-    if not session.get(Parcela, payload.id_parcela):
+    parcela = session.get(Parcela, payload.id_parcela)
+    if not parcela:
         raise HTTPException(400, "id_parcela inválido")
+    id_usuario = parcela.id_usuario
     session.add(payload)
+    session.flush()
+    marcar_pendientes(session, [id_usuario])
+    registrar_altas(session, "cultivo", [(id_usuario, payload.id_cultivo)])
     session.commit()
     session.refresh(payload)
+    cache_metricas.invalidar(id_usuario)
+    _avisar(id_usuario, "parcelas-cultivos", [{"id_parcela": payload.id_parcela, "cultivos": 1}])
     return payload
 
 @app.get("/cultivos/{id_cultivo}", response_model=Cultivo)
@@ -320,9 +814,15 @@ def obtener_cultivo(id_cultivo: int, session: Session = Depends(get_session)):
     return obj
 
 @app.get("/parcelas/{id_parcela}/cultivos", response_model=List[Cultivo])
-def cultivos_de_parcela(id_parcela: int, session: Session = Depends(get_session)):
-    stmt = select(Cultivo).where(Cultivo.id_parcela == id_parcela)
-    return session.exec(stmt).all()
+def cultivos_de_parcela(
+    id_parcela: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    session: Session = Depends(get_session),
+):
+    columnas = columnas_pedidas(fields, CULTIVO_COLUMNAS)
+    stmt = _select_columnas(Cultivo.__table__, columnas).where(Cultivo.id_parcela == id_parcela)
+    return respuesta_json(request, filas_json(columnas, session.execute(stmt)))
 
 # =========================
 # GASTOS
@@ -340,6 +840,136 @@ def _coerce_gastos_dict(d: dict) -> dict:
                     d[k] = 0.0
     return d
 
+GASTO_CAMPOS = (
+    "gasto_agua", "gasto_gas", "gasto_luz", "gasto_semillas",
+    "gasto_fertilizantes", "gasto_mantenimiento", "gasto_combustible",
+)
+
+def _trimestre(fecha: datetime) -> int:
+    return (fecha.month - 1) // 3 + 1
+
+# UPSERT válido en SQLite (>= 3.24) y PostgreSQL
+_UPSERT_TRIMESTRE = text(
+    "INSERT INTO gastos_trimestrales (id_usuario, anio, trimestre, registros, "
+    + ", ".join(GASTO_CAMPOS) + ", total) "
+    "VALUES (:id_usuario, :anio, :trimestre, :registros, "
+    + ", ".join(f":{c}" for c in GASTO_CAMPOS) + ", :total) "
+    "ON CONFLICT (id_usuario, anio, trimestre) DO UPDATE SET "
+    "registros = gastos_trimestrales.registros + excluded.registros, "
+    + ", ".join(f"{c} = gastos_trimestrales.{c} + excluded.{c}" for c in GASTO_CAMPOS)
+    + ", total = gastos_trimestrales.total + excluded.total"
+)
+
+def _acumular_trimestre(session: Session, obj: Gastos) -> None:
+    """Suma el registro al acumulado trimestral (misma transacción que el INSERT)."""
+    params = {c: float(getattr(obj, c) or 0.0) for c in GASTO_CAMPOS}
+    params["total"] = sum(params.values())
+    params.update(
+        id_usuario=obj.id_usuario,
+        anio=obj.creado_en.year,
+        trimestre=_trimestre(obj.creado_en),
+        registros=1,
+    )
+    session.execute(_UPSERT_TRIMESTRE, params)
+
+def _avisar_gastos(filas: list) -> None:
+    """Publica, por usuario, lo que suman las filas nuevas a cada mes."""
+    por_usuario = {}
+    for f in filas:
+        meses = por_usuario.setdefault(f["id_usuario"], {})
+        d = meses.setdefault((f["creado_en"].year, f["creado_en"].month), [0.0, 0])
+        d[0] += sum(float(f.get(c) or 0.0) for c in GASTO_CAMPOS)
+        d[1] += 1
+    for uid, meses in por_usuario.items():
+        _avisar(uid, "gastos-trimestrales", [
+            {"anio": a, "mes": m, "total": total, "registros": n}
+            for (a, m), (total, n) in sorted(meses.items())
+        ])
+
+def _insertar_gastos(session: Session, data: dict) -> Gastos:
+    obj = Gastos(**data)  # type: ignore
+    # Fecha fijada aquí (UTC, igual que CURRENT_TIMESTAMP) para conocer el trimestre antes del commit
+    obj.creado_en = datetime.utcnow().replace(microsecond=0)
+    session.add(obj)
+    session.flush()
+    _acumular_trimestre(session, obj)
+    marcar_pendientes(session, [obj.id_usuario])
+    registrar_altas(session, "gastos", [(obj.id_usuario, obj.id_gastos)])
+    session.commit()
+    session.refresh(obj)
+    cache_metricas.invalidar(obj.id_usuario)
+    _avisar_gastos([obj.model_dump()])
+    return obj
+
+def _escribir_lote_gastos(filas: list) -> list:
+    """Escritura agrupada: un INSERT y un commit para todo el lote. Devuelve un Gastos o error por fila."""
+    with Session(engine) as session:
+        duenos = _duenos(session, Usuario.__table__, "id_usuario", {f["id_usuario"] for f in filas})
+        ahora = datetime.utcnow().replace(microsecond=0)
+        validas = [dict(f, creado_en=ahora) for f in filas if f["id_usuario"] in duenos]
+        ids = []
+        if validas:
+            tabla = Gastos.__table__
+            stmt = insert(tabla).returning(tabla.c.id_gastos, sort_by_parameter_order=True)
+            ids = list(session.execute(stmt, validas).scalars())
+            _acumular_trimestres_bulk(session, validas)
+            marcar_pendientes(session, set(duenos))
+            registrar_altas(session, "gastos", [(d["id_usuario"], i) for i, d in zip(ids, validas)])
+            session.commit()
+    for uid in duenos:
+        cache_metricas.invalidar(uid)
+    _avisar_gastos(validas)
+    resultados, guardadas = [], iter(zip(ids, validas))
+    for f in filas:
+        if f["id_usuario"] in duenos:
+            id_gastos, d = next(guardadas)
+            resultados.append(Gastos(id_gastos=id_gastos, **d))
+        else:
+            resultados.append(HTTPException(400, "id_usuario inválido"))
+    return resultados
+
+def reconstruir_gastos_trimestrales(session: Session, id_usuario: Optional[int] = None) -> int:
+    """Recalcula el acumulado desde `gastos` y los totales archivados (todo, o solo un usuario)."""
+    where = "WHERE creado_en IS NOT NULL"  # sin fecha no hay trimestre al cual asignarlos
+    params = {}
+    if id_usuario is not None:
+        where += " AND id_usuario = :id_usuario"
+        params["id_usuario"] = id_usuario
+        session.execute(text("DELETE FROM gastos_trimestrales WHERE id_usuario = :id_usuario"), params)
+    else:
+        session.execute(text("DELETE FROM gastos_trimestrales"))
+    sumas = ", ".join(f"SUM(COALESCE({c}, 0)) AS {c}" for c in GASTO_CAMPOS)
+    total = " + ".join(f"COALESCE({c}, 0)" for c in GASTO_CAMPOS)
+    dialecto = session.get_bind().dialect
+    origen = f"""
+        SELECT id_usuario,
+               {parte_fecha(dialecto, "year", "creado_en")} AS anio,
+               ({parte_fecha(dialecto, "month", "creado_en")} + 2) / 3 AS trimestre,
+               COUNT(*) AS registros, {sumas}, SUM({total}) AS total
+        FROM gastos
+        {where}
+        GROUP BY 1, 2, 3"""
+    # Lo movido al archivo frío ya no está en gastos: entra por sus totales mensuales
+    # (la tabla aún no existe mientras corre la migración 4 en una DB nueva)
+    if tabla_existe(session.connection(), "gastos_mensuales_archivados"):
+        donde = "WHERE id_usuario = :id_usuario" if id_usuario is not None else ""
+        origen += f"""
+        UNION ALL
+        SELECT id_usuario, anio, (mes + 2) / 3, registros, {", ".join(GASTO_CAMPOS)}, total
+        FROM gastos_mensuales_archivados
+        {donde}"""
+    result = session.execute(text(f"""
+        INSERT INTO gastos_trimestrales
+            (id_usuario, anio, trimestre, registros, {", ".join(GASTO_CAMPOS)}, total)
+        SELECT id_usuario, anio, trimestre, SUM(registros),
+               {", ".join(f"SUM({c})" for c in GASTO_CAMPOS)}, SUM(total)
+        FROM ({origen}
+        ) AS t
+        GROUP BY 1, 2, 3
+    """), params)
+    session.commit()
+    return result.rowcount
+
 @app.post("/gastos", response_model=Gastos, status_code=201)
 def crear_gastos(payload: GastosIn, session: Session = Depends(get_session)):
     if not payload.id_usuario:
@@ -347,11 +977,7 @@ def crear_gastos(payload: GastosIn, session: Session = Depends(get_session)):
     if not session.get(Usuario, payload.id_usuario):
         raise HTTPException(400, "id_usuario inválido")
     data = _coerce_gastos_dict(payload.model_dump())
-    obj = Gastos(**data)  # type: ignore
-    session.add(obj)
-    session.commit()
-    session.refresh(obj)
-    return obj
+    return _insertar_gastos(session, data)
 
 @app.post("/usuarios/{id_usuario}/gastos", response_model=Gastos, status_code=201)
 def crear_gastos_para_usuario(id_usuario: int, payload: GastosIn, session: Session = Depends(get_session)):
@@ -359,11 +985,7 @@ def crear_gastos_para_usuario(id_usuario: int, payload: GastosIn, session: Sessi
         raise HTTPException(400, "id_usuario inválido")
     data = _coerce_gastos_dict(payload.model_dump())
     data["id_usuario"] = id_usuario
-    obj = Gastos(**data)  # type: ignore
-    session.add(obj)
-    session.commit()
-    session.refresh(obj)
-    return obj
+    return _insertar_gastos(session, data)
 
 @app.get("/gastos/{id_gastos}", response_model=Gastos)
 def obtener_gasto(id_gastos: int, session: Session = Depends(get_session)):
@@ -372,16 +994,259 @@ def obtener_gasto(id_gastos: int, session: Session = Depends(get_session)):
         raise HTTPException(404, "Registro de gastos no encontrado")
     return obj
 
+INCLUDE_ARCHIVED_DESC = "Incluye los gastos movidos al archivo frío (ver /admin/gastos/archivo)"
+
+def _select_gastos_de_usuario(id_usuario: int, columnas: list, include_archived: bool):
+    stmt = _select_columnas(Gastos.__table__, columnas).where(Gastos.id_usuario == id_usuario)
+    if include_archived and ARCHIVO_DB:
+        # Lo archivado es lo más viejo: va primero, en el orden de su clave (id_usuario, creado_en)
+        frios = _select_columnas(gastos_archivo, columnas).where(gastos_archivo.c.id_usuario == id_usuario)
+        stmt = union_all(frios, stmt)
+    return stmt
+
 @app.get("/usuarios/{id_usuario}/gastos", response_model=List[Gastos])
-def gastos_de_usuario(id_usuario: int, session: Session = Depends(get_session)):
-    stmt = select(Gastos).where(Gastos.id_usuario == id_usuario)
-    return session.exec(stmt).all()
+def gastos_de_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    include_archived: bool = Query(False, description=INCLUDE_ARCHIVED_DESC),
+    session: Session = Depends(get_session),
+):
+    columnas = columnas_pedidas(fields, GASTOS_COLUMNAS)
+    stmt = _select_gastos_de_usuario(id_usuario, columnas, include_archived)
+    return respuesta_json(request, filas_json(columnas, session.execute(stmt)))
+
+# =========================
+# BULK (carga masiva)
+# =========================
+BULK_MAX_FILAS = int(os.getenv("BULK_MAX_FILAS", "200000"))
+_LOTE_IN = 500  # ids por consulta IN (límite de variables de SQLite)
+
+# recurso -> (schema de fila, tabla, PK, columna FK, tabla padre, PK padre)
+BULK_RECURSOS = {
+    "parcelas": (ParcelaIn, Parcela.__table__, "id_parcela", "id_usuario", Usuario.__table__, "id_usuario"),
+    "cultivos": (CultivoIn, Cultivo.__table__, "id_cultivo", "id_parcela", Parcela.__table__, "id_parcela"),
+    "gastos": (GastosBulkIn, Gastos.__table__, "id_gastos", "id_usuario", Usuario.__table__, "id_usuario"),
+}
+
+def _filas_csv(texto: str, schema) -> list:
+    lector = csv.DictReader(io.StringIO(texto))
+    # Un encabezado mal escrito fallaría igual en todas las filas: se rechaza el archivo
+    desconocidas = [c for c in lector.fieldnames or [] if c and c not in schema.model_fields]
+    if desconocidas:
+        raise HTTPException(422, f"Columnas desconocidas: {', '.join(desconocidas)}")
+    # Celdas vacías como NULL para que los opcionales no fallen la validación
+    return [{k: (v if v != "" else None) for k, v in fila.items() if k} for fila in lector]
+
+def _filas_ndjson(texto: str) -> list:
+    filas = []
+    for n, linea in enumerate(texto.splitlines(), start=1):
+        if linea.strip():
+            try:
+                filas.append(json.loads(linea))
+            except ValueError:
+                raise HTTPException(422, f"NDJSON inválido en la línea {n}")
+    return filas
+
+async def _leer_filas_bulk(request: Request, recurso: str) -> list:
+    """Acepta un arreglo JSON, NDJSON, CSV o un archivo multipart (campo 'archivo')."""
+    tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if tipo == "multipart/form-data":
+        form = await request.form()
+        archivo = form.get("archivo")
+        if archivo is None or not hasattr(archivo, "read"):
+            raise HTTPException(422, "Falta el archivo (campo 'archivo')")
+        nombre = (archivo.filename or "").lower()
+        texto = (await archivo.read()).decode("utf-8-sig")
+        if nombre.endswith(".csv"):
+            tipo = "text/csv"
+        elif nombre.endswith((".ndjson", ".jsonl")):
+            tipo = "application/x-ndjson"
+        else:
+            tipo = "application/json"
+    else:
+        texto = (await request.body()).decode("utf-8-sig")
+
+    if tipo in ("text/csv", "application/csv"):
+        filas = _filas_csv(texto, BULK_RECURSOS[recurso][0])
+    elif tipo in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        filas = _filas_ndjson(texto)
+    else:
+        try:
+            filas = json.loads(texto)
+        except ValueError:
+            raise HTTPException(422, "JSON inválido")
+        if not isinstance(filas, list):
+            raise HTTPException(422, "Se esperaba un arreglo JSON")
+    if len(filas) > BULK_MAX_FILAS:
+        raise HTTPException(413, f"Máximo {BULK_MAX_FILAS} filas por carga")
+    return filas
+
+def _duenos(session: Session, tabla, pk: str, ids: set) -> dict:
+    """{pk: id_usuario} de las filas padre que existen (usuario y parcela tienen id_usuario)."""
+    columna = tabla.c[pk]
+    duenos = {}
+    ordenados = sorted(ids)
+    for i in range(0, len(ordenados), _LOTE_IN):
+        lote = ordenados[i:i + _LOTE_IN]
+        duenos.update(session.execute(
+            select(columna, tabla.c.id_usuario).where(columna.in_(lote))
+        ).all())
+    return duenos
+
+def _acumular_trimestres_bulk(session: Session, filas: list) -> None:
+    """Suma al acumulado trimestral un delta por (usuario, año, trimestre), no uno por fila."""
+    deltas = {}
+    for f in filas:
+        clave = (f["id_usuario"], f["creado_en"].year, _trimestre(f["creado_en"]))
+        d = deltas.get(clave)
+        if d is None:
+            d = deltas[clave] = {c: 0.0 for c in GASTO_CAMPOS}
+            d.update(id_usuario=clave[0], anio=clave[1], trimestre=clave[2], registros=0, total=0.0)
+        d["registros"] += 1
+        for c in GASTO_CAMPOS:
+            d[c] += f[c]
+            d["total"] += f[c]
+    if deltas:
+        session.execute(_UPSERT_TRIMESTRE, list(deltas.values()))
+
+@app.post("/bulk/{recurso}", response_model=BulkOut)
+async def carga_masiva(
+    request: Request,
+    recurso: str = Path(..., pattern="^(parcelas|cultivos|gastos)$"),
+    session: Session = Depends(get_session),
+):
+    filas = await _leer_filas_bulk(request, recurso)
+    return await run_in_threadpool(_insertar_bulk, session, recurso, filas)
+
+def _insertar_bulk(session: Session, recurso: str, filas: list, dueno: Optional[int] = None,
+                   locales: Optional[list] = None) -> BulkOut:
+    """Con `dueno` (POST /sync) solo acepta filas de ese usuario y guarda el id_local de
+    cada fila (`locales`, alineado con `filas`) en la misma transacción."""
+    schema, tabla, pk, fk, tabla_padre, pk_padre = BULK_RECURSOS[recurso]
+    errores, validas = [], []
+    for n, fila in enumerate(filas, start=1):
+        if not isinstance(fila, dict):
+            errores.append({"fila": n, "error": "Se esperaba un objeto"})
+            continue
+        try:
+            validas.append((n, schema.model_validate(fila).model_dump()))
+        except ValidationError as e:
+            errores.append({"fila": n, "error": "; ".join(
+                f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+
+    # Una sola búsqueda (por lotes IN) para todas las llaves foráneas
+    duenos = _duenos(session, tabla_padre, pk_padre, {d[fk] for _, d in validas})
+    ahora = datetime.utcnow().replace(microsecond=0)
+    rows, numeros = [], []
+    for n, d in validas:
+        if d[fk] not in duenos or (dueno is not None and duenos[d[fk]] != dueno):
+            errores.append({"fila": n, "error": f"{fk} inválido"})
+            continue
+        if recurso == "gastos":
+            d = _coerce_gastos_dict(d)
+            d["creado_en"] = d.get("creado_en") or ahora
+        elif recurso == "parcelas":
+            d.update(campos_geo(d["ubicacion"], d["tamano"]))
+        rows.append(d)
+        numeros.append(n)
+    errores.sort(key=lambda e: e["fila"])
+
+    ids = []
+    if rows:
+        stmt = insert(tabla).returning(tabla.c[pk], sort_by_parameter_order=True)
+        ids = list(session.execute(stmt, rows).scalars())
+        if recurso == "gastos":
+            _acumular_trimestres_bulk(session, rows)
+        marcar_pendientes(session, {duenos[r[fk]] for r in rows})
+        registrar_altas(session, tabla.name, [(duenos[r[fk]], i) for r, i in zip(rows, ids)])
+        if locales is not None:
+            registrar_subidas(session, dueno, tabla.name, [(locales[n - 1], i) for n, i in zip(numeros, ids)])
+        session.commit()
+
+    for uid in {duenos[r[fk]] for r in rows}:
+        cache_metricas.invalidar(uid)
+    _avisar_bulk(recurso, rows, ids, duenos)
+    return BulkOut(insertados=len(ids), ids=ids, errores=errores)
+
+def _avisar_bulk(recurso: str, rows: list, ids: list, duenos: dict) -> None:
+    if recurso == "gastos":
+        _avisar_gastos(rows)
+        return
+    por_usuario = {}
+    for id_nuevo, r in zip(ids, rows):
+        if recurso == "parcelas":
+            item = {"id_parcela": id_nuevo, "parcela": r["nombre_parcela"], "cultivos": 0}
+            por_usuario.setdefault(r["id_usuario"], {})[id_nuevo] = item
+        else:
+            items = por_usuario.setdefault(duenos[r["id_parcela"]], {})
+            items.setdefault(r["id_parcela"], {"id_parcela": r["id_parcela"], "cultivos": 0})["cultivos"] += 1
+    for uid, items in por_usuario.items():
+        _avisar(uid, "parcelas-cultivos", list(items.values()))
 
 # =========================
 # MÉTRICAS
 # =========================
+def _etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidatos = [e.strip() for e in if_none_match.split(",")]
+    # If-None-Match usa comparación débil: W/"x" equivale a "x"
+    return "*" in candidatos or any(e.removeprefix("W/") == etag for e in candidatos)
+
+def _serializar_metrica(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _respuesta_metrica(request: Request, id_usuario: int, clave: tuple, calcular) -> Response:
+    """Sirve una métrica desde la caché (o la calcula) con ETag y 304 si no cambió."""
+    etag, cuerpo = cache_metricas.obtener_o_calcular(
+        id_usuario, clave, lambda: _serializar_metrica(calcular())
+    )
+    return _respuesta_con_etag(request, etag, cuerpo)
+
+def _respuesta_con_etag(request: Request, etag: str, cuerpo: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+@app.get("/metrics/cache")
+def estadisticas_cache_metricas():
+    return cache_metricas.estadisticas()
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+def metricas_prometheus():
+    cache = cache_metricas.estadisticas()
+    extra = {
+        "fintiva_metrics_cache_entries": cache["entradas"],
+        "fintiva_metrics_cache_hits": cache["hits"],
+        "fintiva_metrics_cache_misses": cache["misses"],
+        "fintiva_metrics_cache_evictions": cache["evictions"],
+        "fintiva_metrics_cache_expired": cache["vencidas"],
+    }
+    for k, v in servicio_hash.estadisticas().items():
+        if v is not None:
+            extra[f"fintiva_password_hash_{k}"] = v
+    for k, v in servicio_score.estadisticas().items():
+        extra[f"fintiva_score_{k}"] = v
+    for k, v in canal_eventos.estadisticas().items():
+        extra[f"fintiva_eventos_{k}"] = v
+    if GASTOS_ESCRITURA_AGRUPADA:
+        for k, v in cola_gastos.estadisticas().items():
+            extra[f"fintiva_gastos_cola_{k}"] = v
+    return PlainTextResponse(
+        registro_metricas.exposicion(extra), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.get("/metrics/parcelas-cultivos/{id_usuario}")
-def parcelas_cultivos(id_usuario: int, session: Session = Depends(get_session)):
+def parcelas_cultivos(id_usuario: int, request: Request, session: Session = Depends(get_session)):
+    return _respuesta_metrica(
+        request, id_usuario, ("parcelas-cultivos",),
+        lambda: _calcular_parcelas_cultivos(session, id_usuario),
+    )
+
+def _calcular_parcelas_cultivos(session: Session, id_usuario: int) -> dict:
     rows = session.exec(
         select(
             Parcela.id_parcela,
@@ -400,56 +1265,649 @@ def parcelas_cultivos(id_usuario: int, session: Session = Depends(get_session)):
     ]
     return {"items": data}
 
+def _alineado_a_trimestre(desde: Optional[date], hasta: Optional[date]) -> bool:
+    """True si el rango cae en bordes de trimestre (se puede responder con el acumulado)."""
+    if desde and not (desde.day == 1 and desde.month in (1, 4, 7, 10)):
+        return False
+    if hasta and (hasta + timedelta(days=1)).day != 1:
+        return False
+    return not hasta or hasta.month in (3, 6, 9, 12)
+
+def _alineado_a_mes(desde: Optional[date], hasta: Optional[date]) -> bool:
+    return (not desde or desde.day == 1) and (not hasta or (hasta + timedelta(days=1)).day == 1)
+
+def _gastos_por_mes(session: Session, id_usuario: int,
+                    desde: Optional[date], hasta: Optional[date], tabla: str = "gastos") -> list:
+    """[(anio, mes, total)] con un range scan sobre idx_gastos_usuario_creado (o la clave de archivo.gastos)."""
+    where = "id_usuario = :id_usuario AND creado_en IS NOT NULL"
+    params = {"id_usuario": id_usuario}
+    # Como Date: en SQLite 'YYYY-MM-DD' (el texto ISO de creado_en respeta el orden y usa
+    # el índice); en PostgreSQL un date de verdad
+    if desde:
+        where += " AND creado_en >= :desde"
+        params["desde"] = desde
+    if hasta:
+        where += " AND creado_en < :hasta"
+        params["hasta"] = hasta + timedelta(days=1)
+    total = " + ".join(f"COALESCE({c}, 0)" for c in GASTO_CAMPOS)
+    dialecto = session.get_bind().dialect
+    stmt = text(f"""
+        SELECT {parte_fecha(dialecto, "year", "creado_en")} AS anio,
+               {parte_fecha(dialecto, "month", "creado_en")} AS mes,
+               SUM({total}) AS total
+        FROM {tabla}
+        WHERE {where}
+        GROUP BY 1, 2
+    """)
+    fechas = [bindparam(p, type_=Date) for p in ("desde", "hasta") if p in params]
+    return session.execute(stmt.bindparams(*fechas), params).all()
+
+def _archivados_por_mes(session: Session, id_usuario: int,
+                        desde: Optional[date], hasta: Optional[date]) -> list:
+    """[(anio, mes, total)] de lo archivado: de los totales mensuales si el rango cae en
+    bordes de mes; si no (un día a mitad de mes), del archivo frío."""
+    if not ARCHIVO_DB:
+        return []
+    if not _alineado_a_mes(desde, hasta):
+        return _gastos_por_mes(session, id_usuario, desde, hasta, tabla="archivo.gastos")
+    GMA = GastosMensualesArchivados
+    stmt = select(GMA.anio, GMA.mes, GMA.total).where(GMA.id_usuario == id_usuario)
+    if desde:
+        stmt = stmt.where(GMA.anio * 100 + GMA.mes >= desde.year * 100 + desde.month)
+    if hasta:
+        stmt = stmt.where(GMA.anio * 100 + GMA.mes <= hasta.year * 100 + hasta.month)
+    return session.exec(stmt).all()
+
+def _gastos_por_trimestre(session: Session, id_usuario: int,
+                          desde: Optional[date], hasta: Optional[date]) -> list:
+    """[(anio, trimestre, total)] leídos del acumulado (rango ya alineado a trimestres)."""
+    stmt = (
+        select(GastosTrimestrales.anio, GastosTrimestrales.trimestre, GastosTrimestrales.total)
+        .where(GastosTrimestrales.id_usuario == id_usuario)
+    )
+    if desde:
+        stmt = stmt.where(GastosTrimestrales.anio >= desde.year)
+    if hasta:
+        stmt = stmt.where(GastosTrimestrales.anio <= hasta.year)
+    ini = (desde.year, _trimestre(desde)) if desde else None
+    fin = (hasta.year, _trimestre(hasta)) if hasta else None
+    return [
+        (a, t, total) for (a, t, total) in session.exec(stmt).all()
+        if (not ini or (a, t) >= ini) and (not fin or (a, t) <= fin)
+    ]
+
+def _etiqueta_periodo(serie: str, clave: tuple) -> str:
+    if serie == "anio":
+        return str(clave[0])
+    if serie == "trimestre":
+        return f"{clave[0]}-Q{clave[1]}"
+    return f"{clave[0]}-{clave[1]:02d}"
+
+def _siguiente_periodo(serie: str, clave: tuple) -> tuple:
+    if serie == "anio":
+        return (clave[0] + 1,)
+    tope = 4 if serie == "trimestre" else 12
+    return (clave[0] + 1, 1) if clave[1] == tope else (clave[0], clave[1] + 1)
+
+def _cantidad_periodos(serie: str, ini: tuple, fin: tuple) -> int:
+    if serie == "anio":
+        return fin[0] - ini[0] + 1
+    tope = 4 if serie == "trimestre" else 12
+    return (fin[0] - ini[0]) * tope + fin[1] - ini[1] + 1
+
+# Los rangos se cierran con hasta + 1 día: date.max no tiene día siguiente
+METRICAS_ANIO_MAX = 9998
+FECHA_MAX = date(METRICAS_ANIO_MAX, 12, 31)
+# Periodos por respuesta de ?serie= (1200 = 100 años por mes)
+SERIE_MAX_PERIODOS = int(os.getenv("SERIE_MAX_PERIODOS", "1200"))
+
+def _rango_metricas(anio: Optional[int], desde: Optional[date], hasta: Optional[date]) -> tuple:
+    if anio is not None:
+        if desde or hasta:
+            raise HTTPException(422, "Usa anio o desde/hasta, no ambos")
+        desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+    if (desde and desde > FECHA_MAX) or (hasta and hasta > FECHA_MAX):
+        raise HTTPException(422, f"Las fechas no pueden pasar de {FECHA_MAX.isoformat()}")
+    if desde and hasta and desde > hasta:
+        raise HTTPException(422, "desde debe ser anterior a hasta")
+    return desde, hasta
+
 @app.get("/metrics/gastos-trimestrales/{id_usuario}")
-def gastos_trimestrales(id_usuario: int, session: Session = Depends(get_session)):
-    total_expr = (
-        func.coalesce(Gastos.gasto_agua, 0)
-        + func.coalesce(Gastos.gasto_gas, 0)
-        + func.coalesce(Gastos.gasto_luz, 0)
-        + func.coalesce(Gastos.gasto_semillas, 0)
-        + func.coalesce(Gastos.gasto_fertilizantes, 0)
-        + func.coalesce(Gastos.gasto_mantenimiento, 0)
-        + func.coalesce(Gastos.gasto_combustible, 0)
+def gastos_trimestrales(
+    id_usuario: int,
+    request: Request,
+    anio: Optional[int] = Query(None, ge=1900, le=METRICAS_ANIO_MAX, description="Solo ese año"),
+    desde: Optional[date] = Query(None, description="Fecha inicial (inclusive)"),
+    hasta: Optional[date] = Query(None, description="Fecha final (inclusive)"),
+    serie: Optional[str] = Query(
+        None, pattern="^(mes|trimestre|anio)$",
+        description="Serie multi-año agrupada por mes, trimestre o año",
+    ),
+    session: Session = Depends(get_session),
+):
+    desde, hasta = _rango_metricas(anio, desde, hasta)
+    return _respuesta_metrica(
+        request, id_usuario, ("gastos-trimestrales", desde, hasta, serie),
+        lambda: _calcular_gastos_trimestrales(session, id_usuario, desde, hasta, serie),
     )
 
-    # Q = ((mes-1)//3)+1
-    month_num = func.cast(func.strftime("%m", Gastos.creado_en), Integer)
-    q_expr = ((month_num - 1) / 3 + 1).label("q")
+def _calcular_gastos_trimestrales(session: Session, id_usuario: int, desde: Optional[date],
+                                  hasta: Optional[date], serie: Optional[str]) -> dict:
+    # Acumulado trimestral si alcanza; si no, range scan mensual sobre gastos
+    mensual = serie == "mes" or not _alineado_a_trimestre(desde, hasta)
+    if mensual:
+        # Un mismo mes puede venir de ambos lados; abajo se suma por periodo
+        rows = (_gastos_por_mes(session, id_usuario, desde, hasta)
+                + _archivados_por_mes(session, id_usuario, desde, hasta))
+    else:
+        rows = _gastos_por_trimestre(session, id_usuario, desde, hasta)
+    trimestre_de = (lambda mes: (mes - 1) // 3 + 1) if mensual else int
 
-    rows = session.exec(
-        select(
-            q_expr,
-            func.sum(total_expr).label("total")
-        )
-        .where(Gastos.id_usuario == id_usuario)
-        .group_by(q_expr)
-        .order_by(q_expr)
-    ).all()
+    if serie is None:
+        qmap = {}
+        for (_, periodo, total) in rows:
+            q = trimestre_de(int(periodo))
+            qmap[q] = qmap.get(q, 0.0) + float(total or 0)
+        data = [
+            {"trimestre": "Q1", "total": qmap.get(1, 0.0)},
+            {"trimestre": "Q2", "total": qmap.get(2, 0.0)},
+            {"trimestre": "Q3", "total": qmap.get(3, 0.0)},
+            {"trimestre": "Q4", "total": qmap.get(4, 0.0)},
+        ]
+        return {"items": data}
 
-    qmap = {int(q): float(total or 0) for (q, total) in rows}
-    data = [
-        {"trimestre": "Q1", "total": qmap.get(1, 0.0)},
-        {"trimestre": "Q2", "total": qmap.get(2, 0.0)},
-        {"trimestre": "Q3", "total": qmap.get(3, 0.0)},
-        {"trimestre": "Q4", "total": qmap.get(4, 0.0)},
-    ]
-    return {"items": data}
+    totales = {}
+    for (a, periodo, total) in rows:
+        if serie == "anio":
+            clave = (int(a),)
+        elif serie == "trimestre":
+            clave = (int(a), trimestre_de(int(periodo)))
+        else:
+            clave = (int(a), int(periodo))
+        totales[clave] = totales.get(clave, 0.0) + float(total or 0)
+
+    # Serie continua (periodos sin gastos en 0) entre los extremos pedidos o encontrados
+    def clave_de(d: date) -> tuple:
+        if serie == "anio":
+            return (d.year,)
+        return (d.year, _trimestre(d) if serie == "trimestre" else d.month)
+
+    ini = clave_de(desde) if desde else min(totales, default=None)
+    fin = clave_de(hasta) if hasta else max(totales, default=None)
+    # Con un extremo abierto el otro sale de los datos: se valida ya resuelto
+    if ini is not None and fin is not None and _cantidad_periodos(serie, ini, fin) > SERIE_MAX_PERIODOS:
+        raise HTTPException(422, f"La serie pasa de {SERIE_MAX_PERIODOS} periodos; acota desde/hasta")
+    data = []
+    clave = ini
+    while clave is not None and fin is not None and clave <= fin:
+        data.append({"periodo": _etiqueta_periodo(serie, clave), "total": totales.get(clave, 0.0)})
+        clave = _siguiente_periodo(serie, clave)
+    return {"serie": serie, "items": data}
+
+# =========================
+# EVENTOS EN VIVO (dashboard)
+# =========================
+# El dashboard pide las métricas una vez y luego aplica los deltas de este stream:
+#   parcelas-cultivos    {"items": [{"id_parcela", "cultivos": +n, "parcela" si es nueva}]}
+#   gastos-trimestrales  {"items": [{"anio", "mes", "total": +x, "registros": +n}]}
+#   usuario              {"campos": [...]} o {"borrado": true}
+#   recargar             volver a pedir las métricas (If-None-Match evita el cuerpo si no cambió)
+# Solo el propio usuario, con su Bearer token en el header (el EventSource del navegador no
+# manda headers: el cliente lee el stream con fetch)
+@app.get("/usuarios/{id_usuario}/eventos")
+async def eventos_de_usuario(
+    id_usuario: int,
+    request: Request,
+    usuario: UsuarioActual = Depends(current_user),
+):
+    """Server-Sent Events; sin escrituras del usuario solo viaja el heartbeat."""
+    if usuario.id_usuario != id_usuario:
+        raise HTTPException(403, "Solo puedes ver tus propios eventos")
+    canal_eventos.verificar_cupo()
+    return StreamingResponse(
+        canal_eventos.flujo(id_usuario, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: que nginx no retenga los eventos
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics/eventos")
+def estadisticas_eventos():
+    return canal_eventos.estadisticas()
+
+# =========================
+# SCORE CREDITICIO
+# =========================
+SCORE_REFRESCO_S = float(os.getenv("SCORE_REFRESCO_S", "60"))  # 0 = solo bajo demanda
+servicio_score = ServicioScore(engine, DATABASE_URL, SCORE_REFRESCO_S)
+
+@app.get("/usuarios/{id_usuario}/score", response_model=ScoreOut)
+def score_de_usuario(id_usuario: int, session: Session = Depends(get_session)):
+    if not session.get(Usuario, id_usuario):
+        raise HTTPException(404, "Usuario no encontrado")
+    obj = session.get(Score, id_usuario)
+    # Sin calcular o con cambios aún no procesados: se calcula ahora (un lote de uno)
+    if obj is None or obj.pendiente or obj.version != MODELO_VERSION:
+        servicio_score.recalcular_usuarios([id_usuario])
+        obj = session.get(Score, id_usuario, populate_existing=True)
+    return ScoreOut(
+        id_usuario=id_usuario, puntaje=obj.puntaje, nivel=obj.nivel, version=obj.version,
+        calculado_en=obj.calculado_en, variables={v: getattr(obj, v) for v in VARIABLES},
+    )
+
+@app.post("/admin/score/recalcular")
+def recalcular_scores(todos: bool = Query(False, description="Todos los usuarios, no solo los pendientes")):
+    hechos = servicio_score.recalcular_todos() if todos else servicio_score.recalcular_pendientes()
+    return {"recalculados": hechos, **servicio_score.ultima}
+
+# =========================
+# DASHBOARD (todo el tablero del agricultor en una llamada)
+# =========================
+# Secciones que se pueden pedir con ?fields=; sin fields se devuelven todas
+DASHBOARD_CAMPOS = ("usuario", "parcelas", "cultivos", "gastos", "resumen_gastos",
+                    "parcelas_cultivos", "gastos_trimestrales")
+
+def _campos_dashboard(fields: Optional[str]) -> tuple:
+    if not fields:
+        return DASHBOARD_CAMPOS
+    pedidos = {f.strip() for f in fields.split(",") if f.strip()}
+    desconocidos = pedidos - set(DASHBOARD_CAMPOS)
+    if desconocidos:
+        raise HTTPException(422, f"fields desconocidos: {', '.join(sorted(desconocidos))}")
+    return tuple(c for c in DASHBOARD_CAMPOS if c in pedidos)  # orden fijo -> clave de caché estable
+
+def _fila_json(fila) -> dict:
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in fila._mapping.items()}
+
+def _calcular_dashboard(session: Session, id_usuario: int, campos: tuple, gastos_limit: int) -> dict:
+    """Una consulta por sección como máximo; los cultivos de todas las parcelas con un solo IN."""
+    usuario = session.get(Usuario, id_usuario)
+    if not usuario:
+        raise HTTPException(404, "Usuario no encontrado")
+    out = {}
+    if "usuario" in campos:
+        out["usuario"] = usuario.model_dump(exclude={"contrasena_hash"})
+
+    if "parcelas" in campos or "cultivos" in campos:
+        parcelas = [_fila_json(f) for f in session.execute(
+            select(*Parcela.__table__.c).where(Parcela.id_usuario == id_usuario)
+            .order_by(Parcela.id_parcela)
+        )]
+        if "cultivos" in campos:
+            por_parcela = {p["id_parcela"]: [] for p in parcelas}
+            if por_parcela:
+                for f in session.execute(
+                    select(*Cultivo.__table__.c).where(Cultivo.id_parcela.in_(list(por_parcela)))
+                    .order_by(Cultivo.id_cultivo)
+                ):
+                    por_parcela[f.id_parcela].append(_fila_json(f))
+            for p in parcelas:
+                p["cultivos"] = por_parcela[p["id_parcela"]]
+        out["parcelas"] = parcelas
+
+    if "gastos" in campos:
+        # Los más recientes primero (idx_gastos_usuario_creado en reversa)
+        out["gastos"] = [_fila_json(f) for f in session.execute(
+            select(*Gastos.__table__.c).where(Gastos.id_usuario == id_usuario)
+            .order_by(Gastos.creado_en.desc(), Gastos.id_gastos.desc())
+            .limit(gastos_limit)
+        )]
+
+    if "resumen_gastos" in campos:
+        columnas = [func.coalesce(func.sum(getattr(Gastos, c)), 0.0).label(c) for c in GASTO_CAMPOS]
+        fila = session.execute(
+            select(func.count().label("registros"), func.max(Gastos.creado_en).label("ultimo"), *columnas)
+            .where(Gastos.id_usuario == id_usuario)
+        ).one()
+        resumen = _fila_json(fila)
+        if ARCHIVO_DB:
+            GMA = GastosMensualesArchivados
+            archivado = session.execute(
+                select(func.coalesce(func.sum(GMA.registros), 0), func.max(GMA.ultimo),
+                       *(func.coalesce(func.sum(getattr(GMA, c)), 0.0) for c in GASTO_CAMPOS))
+                .where(GMA.id_usuario == id_usuario)
+            ).one()
+            resumen["registros"] += archivado[0]
+            if resumen["ultimo"] is None and archivado[1] is not None:
+                resumen["ultimo"] = archivado[1].isoformat()
+            for c, v in zip(GASTO_CAMPOS, archivado[2:]):
+                resumen[c] += v
+        resumen["total"] = sum(float(resumen[c]) for c in GASTO_CAMPOS)
+        out["resumen_gastos"] = resumen
+
+    if "parcelas_cultivos" in campos:
+        out["parcelas_cultivos"] = _calcular_parcelas_cultivos(session, id_usuario)["items"]
+    if "gastos_trimestrales" in campos:
+        out["gastos_trimestrales"] = _calcular_gastos_trimestrales(session, id_usuario, None, None, None)["items"]
+    return out
+
+@app.get("/usuarios/{id_usuario}/dashboard")
+def dashboard_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=f"Secciones separadas por coma: {','.join(DASHBOARD_CAMPOS)}"),
+    gastos_limit: int = Query(20, ge=0, le=500, description="Gastos recientes a incluir"),
+    session: Session = Depends(get_session),
+):
+    campos = _campos_dashboard(fields)
+    return _respuesta_metrica(
+        request, id_usuario, ("dashboard", campos, gastos_limit),
+        lambda: _calcular_dashboard(session, id_usuario, campos, gastos_limit),
+    )
+
+# =========================
+# SINCRONIZACIÓN INCREMENTAL (clientes de campo)
+# =========================
+# GET /sync?since=<token>: solo lo que cambió (ver sincronizacion.py), por tabla y como
+# columnas + filas (sin repetir nombres de campo), comprimido si el cliente acepta gzip/br.
+# POST /sync: altas hechas sin conexión, cada una con un id_local del cliente.
+SYNC_LIMITE_MAX = int(os.getenv("SYNC_LIMITE_MAX", "20000"))
+SYNC_SUBIDA_MAX_FILAS = int(os.getenv("SYNC_SUBIDA_MAX_FILAS", "5000"))
+SYNC_SUBIDA_MAX_BYTES = int(os.getenv("SYNC_SUBIDA_MAX_BYTES", str(8 * 1024 * 1024)))  # ya descomprimido
+
+# tabla de sync_cambio -> (tabla, PK, columnas que viajan)
+SYNC_TABLAS = {
+    "usuario": (Usuario.__table__, "id_usuario", USUARIO_COLUMNAS),
+    "parcela": (Parcela.__table__, "id_parcela", PARCELA_COLUMNAS),
+    "cultivo": (Cultivo.__table__, "id_cultivo", CULTIVO_COLUMNAS),
+    "gastos": (Gastos.__table__, "id_gastos", GASTOS_COLUMNAS),
+}
+# En este orden: un cultivo puede apuntar (id_parcela_local) a una parcela del mismo envío
+SYNC_SUBIDA_RECURSOS = {"parcelas": "parcela", "cultivos": "cultivo", "gastos": "gastos"}
+
+@app.get("/sync")
+def sincronizar(
+    request: Request,
+    since: str = Query("0", description="Token de la sincronización anterior; 0 = todo"),
+    limit: int = Query(5000, ge=1, le=SYNC_LIMITE_MAX, description="Cambios por página"),
+    usuario: UsuarioActual = Depends(current_user),
+    session: Session = Depends(get_session),
+):
+    """Cambios del usuario del token posteriores a `since`. Con mas=true, pedir de nuevo con el token."""
+    if not since.isdigit():
+        raise HTTPException(422, "since inválido")
+    cambios = cambios_desde(session, usuario.id_usuario, int(since), limit + 1)
+    mas = len(cambios) > limit
+    cambios = cambios[:limit]
+    vigentes = {}
+    for _, tabla, id_fila in cambios:
+        vigentes.setdefault(tabla, []).append(id_fila)
+    cuerpo = {"token": str(cambios[-1][0]) if cambios else since, "mas": mas}
+    for tabla, ids in vigentes.items():
+        t, pk, columnas = SYNC_TABLAS[tabla]
+        filas = []
+        for i in range(0, len(ids), _LOTE_IN):
+            stmt = _select_columnas(t, columnas).where(t.c[pk].in_(ids[i:i + _LOTE_IN]))
+            filas.extend(tuple(f) for f in session.execute(stmt))
+        # Un gasto ya archivado no está en la tabla caliente y no viaja
+        if filas:
+            cuerpo[tabla] = {"columnas": list(columnas), "filas": filas}
+    return respuesta_json(request, dumps(cuerpo))
+
+async def _leer_subida(request: Request) -> dict:
+    """Objeto {"parcelas": [...], "cultivos": [...], "gastos": [...]}, opcionalmente en gzip."""
+    cuerpo = await request.body()
+    if request.headers.get("content-encoding", "").strip().lower() == "gzip":
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            cuerpo = d.decompress(cuerpo, SYNC_SUBIDA_MAX_BYTES)
+        except zlib.error:
+            raise HTTPException(400, "gzip inválido")
+        if d.unconsumed_tail:
+            raise HTTPException(413, f"Máximo {SYNC_SUBIDA_MAX_BYTES} bytes descomprimidos")
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError:
+        raise HTTPException(422, "JSON inválido")
+    if not isinstance(datos, dict) or not all(isinstance(datos.get(r, []), list) for r in SYNC_SUBIDA_RECURSOS):
+        raise HTTPException(422, "Se esperaba un objeto con listas parcelas, cultivos y gastos")
+    if sum(len(datos.get(r, [])) for r in SYNC_SUBIDA_RECURSOS) > SYNC_SUBIDA_MAX_FILAS:
+        raise HTTPException(413, f"Máximo {SYNC_SUBIDA_MAX_FILAS} filas por subida")
+    return datos
+
+def _subir(session: Session, id_usuario: int, datos: dict) -> dict:
+    locales_pedidos = [f.get(c) for r in SYNC_SUBIDA_RECURSOS for f in datos.get(r, []) if isinstance(f, dict)
+                       for c in ("id_local", "id_parcela_local") if isinstance(f.get(c), str)]
+    previas = subidas_previas(session, id_usuario, locales_pedidos)
+    parcelas_previas = {local: i for local, (tabla, i) in previas.items() if tabla == "parcela"}
+    ids = {r: {} for r in SYNC_SUBIDA_RECURSOS}
+    errores, vistos = [], set()
+    for recurso, tabla in SYNC_SUBIDA_RECURSOS.items():
+        filas, locales, numeros = [], [], []
+        for n, fila in enumerate(datos.get(recurso, []), start=1):
+            local = fila.get("id_local") if isinstance(fila, dict) else None
+            error = None
+            if not isinstance(local, str) or not 0 < len(local) <= 64:
+                error = "id_local requerido (texto de hasta 64 caracteres)"
+            elif local in vistos:
+                error = "id_local repetido"
+            elif local in previas and previas[local][0] != tabla:
+                error = "id_local ya usado en otra tabla"
+            if error:
+                errores.append({"recurso": recurso, "fila": n, "error": error})
+                continue
+            vistos.add(local)
+            if local in previas:
+                ids[recurso][local] = previas[local][1]  # reintento: ya estaba
+                continue
+            d = {k: v for k, v in fila.items() if k not in ("id_local", "id_parcela_local")}
+            if recurso == "cultivos":
+                if "id_parcela_local" in fila:
+                    ref = fila["id_parcela_local"] if isinstance(fila["id_parcela_local"], str) else None
+                    d["id_parcela"] = ids["parcelas"].get(ref) or parcelas_previas.get(ref)
+                    if d["id_parcela"] is None:
+                        errores.append({"recurso": recurso, "fila": n,
+                                        "error": "id_parcela_local desconocido (o su parcela falló)"})
+                        continue
+            else:
+                d["id_usuario"] = id_usuario
+            filas.append(d)
+            locales.append(local)
+            numeros.append(n)
+        if not filas:
+            continue
+        r = _insertar_bulk(session, recurso, filas, dueno=id_usuario, locales=locales)
+        fallidas = {e["fila"] for e in r.errores}
+        insertadas = [local for k, local in enumerate(locales, start=1) if k not in fallidas]
+        ids[recurso].update(zip(insertadas, r.ids))
+        errores += [{"recurso": recurso, "fila": numeros[e["fila"] - 1], "error": e["error"]} for e in r.errores]
+    return {"ids": ids, "errores": errores}
+
+@app.post("/sync")
+async def subir_cambios(
+    request: Request,
+    usuario: UsuarioActual = Depends(current_user),
+    session: Session = Depends(get_session),
+):
+    """Altas hechas sin conexión. Devuelve el id del servidor de cada id_local; reintentar es seguro."""
+    datos = await _leer_subida(request)
+    resultado = await run_in_threadpool(_subir, session, usuario.id_usuario, datos)
+    return respuesta_json(request, dumps(resultado))
 
 # =========================
 # Reporte demo
 # =========================
+REPORTE_CULTIVOS_COLS = ["id_usuario","nombre_completo","id_parcela","nombre_parcela",
+                         "id_cultivo","tipo_cultivo","mes_siembra","mes_cosecha"]
+REPORTE_LOTE = 500  # filas por chunk enviado al cliente
+
+def _codificar_cursor(nombre_completo: str, id_cultivo: int) -> str:
+    crudo = json.dumps([nombre_completo, id_cultivo], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+def _decodificar_cursor(cursor: str) -> tuple:
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        nombre, id_cultivo = json.loads(crudo)
+        return str(nombre), int(id_cultivo)
+    except Exception:
+        raise HTTPException(400, "cursor inválido")
+
+def _lotes_reporte_cultivos(sql, params: dict, limite: Optional[int]):
+    """Genera listas de filas desde un cursor del servidor; memoria constante."""
+    # Conexión propia: el generador vive más que la sesión de la dependencia
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=REPORTE_LOTE).execute(sql, params)
+        if limite is not None:
+            yield result.fetchmany(limite)
+            return
+        for lote in result.partitions(REPORTE_LOTE):
+            yield lote
+
+def _reporte_json(lotes):
+    yield "["
+    primero = True
+    for lote in lotes:
+        chunk = ",".join(
+            json.dumps(dict(zip(REPORTE_CULTIVOS_COLS, r)), ensure_ascii=False) for r in lote
+        )
+        if chunk:
+            yield chunk if primero else "," + chunk
+            primero = False
+    yield "]"
+
+def _reporte_ndjson(lotes):
+    for lote in lotes:
+        yield "".join(
+            json.dumps(dict(zip(REPORTE_CULTIVOS_COLS, r)), ensure_ascii=False) + "\n" for r in lote
+        )
+
+def _reporte_csv(lotes):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(REPORTE_CULTIVOS_COLS)
+    for lote in lotes:
+        writer.writerows(lote)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
 @app.get("/reportes/cultivos-por-usuario")
-def reporte_cultivos_por_usuario(session: Session = Depends(get_session)):
-    sql = text("""
+def reporte_cultivos_por_usuario(
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Sin limit se exporta todo"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    estado: Optional[str] = Query(None),
+    tipo_cultivo: Optional[str] = Query(None),
+):
+    where, params = [], {}
+    if cursor:
+        params["c_nombre"], params["c_id"] = _decodificar_cursor(cursor)
+        # Keyset: continúa después de (nombre_completo, id_cultivo) sin OFFSET
+        where.append("(u.nombre_completo, c.id_cultivo) > (:c_nombre, :c_id)")
+    if estado:
+        where.append("u.estado = :estado")
+        params["estado"] = estado
+    if tipo_cultivo:
+        where.append("c.tipo_cultivo = :tipo_cultivo")
+        params["tipo_cultivo"] = tipo_cultivo
+    sql = text(f"""
         SELECT u.id_usuario, u.nombre_completo,
                p.id_parcela, p.nombre_parcela,
                c.id_cultivo, c.tipo_cultivo, c.mes_siembra, c.mes_cosecha
         FROM usuario u
         JOIN parcela p  ON p.id_usuario = u.id_usuario
         JOIN cultivo c  ON c.id_parcela = p.id_parcela
-        ORDER BY u.nombre_completo, p.nombre_parcela
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY u.nombre_completo, c.id_cultivo
+        {"LIMIT :limite" if limit else ""}
     """)
-    rows = session.exec(sql).all()
-    cols = ["id_usuario","nombre_completo","id_parcela","nombre_parcela",
-            "id_cultivo","tipo_cultivo","mes_siembra","mes_cosecha"]
-    return [dict(zip(cols, r)) for r in rows]
+    headers = {}
+    if limit:
+        params["limite"] = limit
+    lotes = _lotes_reporte_cultivos(sql, params, limit)
+    if limit:
+        # Una página está acotada por limit: se lee antes para poder anunciar el cursor
+        pagina = next(lotes, [])
+        lotes.close()
+        if len(pagina) == limit:
+            ultima = pagina[-1]
+            headers["X-Next-Cursor"] = _codificar_cursor(ultima[1], ultima[4])
+        lotes = iter([pagina])
+
+    if formato == "ndjson":
+        return StreamingResponse(_reporte_ndjson(lotes), media_type="application/x-ndjson", headers=headers)
+    if formato == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="cultivos_por_usuario.csv"'
+        return StreamingResponse(_reporte_csv(lotes), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(_reporte_json(lotes), media_type="application/json", headers=headers)
+
+# =========================
+# ANALÍTICA POR COHORTES (admin)
+# =========================
+# Snapshot columnar en NumPy (ver analitica.py); se importa al final porque usa GASTO_CAMPOS
+from analitica import analitica, router as router_analitica  # noqa: E402
+app.include_router(router_analitica)
+
+# =========================
+# ARCHIVO FRÍO DE GASTOS (admin)
+# =========================
+# Gastos anteriores al horizonte fuera de la tabla caliente (ver archivo.py)
+from archivo import archivo_gastos, router as router_archivo  # noqa: E402
+app.include_router(router_archivo)
+
+# =========================
+# MODO ASYNC (opcional)
+# =========================
+def _reemplazar_rutas(app: FastAPI, router) -> None:
+    """Incluye `router` quitando antes las rutas síncronas con el mismo path y método."""
+    nuevas = {(r.path, m) for r in router.routes for m in r.methods}
+    app.router.routes[:] = [
+        r for r in app.router.routes
+        if not (isinstance(r, APIRoute) and any((r.path, m) in nuevas for m in r.methods))
+    ]
+    app.include_router(router)
+
+# Con DB_ASYNC=1 las lecturas se atienden con AsyncSession (ver rutas_async.py);
+# las escrituras siguen en el engine síncrono.
+if DB_ASYNC:
+    from rutas_async import router as router_async
+    _reemplazar_rutas(app, router_async)
+
+    @app.on_event("shutdown")
+    async def cerrar_async_engine():
+        await async_engine.dispose()
+
+# =========================
+# ESCRITURA AGRUPADA DE GASTOS (opcional)
+# =========================
+# Con GASTOS_ESCRITURA_AGRUPADA=1 las altas de gastos van a una cola y un solo hilo
+# las escribe por lotes (un commit cada GASTOS_LOTE_MS o GASTOS_LOTE_MAX filas).
+# La respuesta llega después del commit de su lote, con su id_gastos (committed; ver
+# en cola_escritura.py qué se puede perder ante un corte con synchronous=NORMAL).
+GASTOS_ESCRITURA_AGRUPADA = os.getenv("GASTOS_ESCRITURA_AGRUPADA", "0").lower() in ("1", "true", "si", "sí", "yes")
+cola_gastos = ColaEscritura(
+    _escribir_lote_gastos,
+    max_filas=int(os.getenv("GASTOS_LOTE_MAX", "500")),
+    espera_ms=float(os.getenv("GASTOS_LOTE_MS", "2")),
+    max_cola=int(os.getenv("GASTOS_COLA_MAX", "10000")),
+    nombre="escritor-gastos",
+)
+
+@app.get("/metrics/gastos-cola")
+def estadisticas_cola_gastos():
+    return {"activa": GASTOS_ESCRITURA_AGRUPADA, **cola_gastos.estadisticas()}
+
+if GASTOS_ESCRITURA_AGRUPADA:
+    router_gastos = APIRouter()
+
+    # async: la request espera su lote sin ocupar un hilo del threadpool
+    @router_gastos.post("/gastos", response_model=Gastos, status_code=201)
+    async def crear_gastos_agrupado(payload: GastosIn):
+        if not payload.id_usuario:
+            raise HTTPException(422, "Falta id_usuario")
+        return await cola_gastos.enviar(_coerce_gastos_dict(payload.model_dump()))
+
+    @router_gastos.post("/usuarios/{id_usuario}/gastos", response_model=Gastos, status_code=201)
+    async def crear_gastos_para_usuario_agrupado(id_usuario: int, payload: GastosIn):
+        data = _coerce_gastos_dict(payload.model_dump())
+        data["id_usuario"] = id_usuario
+        return await cola_gastos.enviar(data)
+
+    _reemplazar_rutas(app, router_gastos)
+
+    @app.on_event("shutdown")
+    def vaciar_cola_gastos():
+        cola_gastos.detener()  # lo que quede en cola se escribe antes de salir
@@ -0,0 +1,284 @@
+# migraciones.py — migraciones numeradas del esquema con versión guardada en la DB
+#
+# schema_version guarda una fila por migración aplicada. Al arrancar, migrar()
+# lee la versión con una sola consulta y, si está al día, no ejecuta DDL ni
+# reflexión. Si hay pendientes las aplica todas en UNA transacción (en SQLite
+# con BEGIN IMMEDIATE, que además serializa a varios workers arrancando a la vez).
+#
+# Las migraciones son idempotentes para DBs creadas antes de este esquema
+# versionado (por init_db.py o por create_all): crean con checkfirst, agregan
+# columnas solo si faltan y no duplican un índice que ya exista con otro nombre.
+# Las tablas se crean desde los modelos de main.py, por lo que este módulo se usa
+# con main ya importado. Una migración nueva = una función @migracion(N, ...) al final.
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session, SQLModel
+
+VERSION_DDL = """CREATE TABLE IF NOT EXISTS schema_version (
+    version     INTEGER PRIMARY KEY,
+    nombre      VARCHAR(120) NOT NULL,
+    aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+
+class Migracion(NamedTuple):
+    version: int
+    nombre: str
+    aplicar: Callable[[Connection], None]
+
+
+MIGRACIONES: List[Migracion] = []
+
+
+def migracion(version: int, nombre: str):
+    def registrar(fn):
+        MIGRACIONES.append(Migracion(version, nombre, fn))
+        return fn
+    return registrar
+
+
+def version_esperada() -> int:
+    return max(m.version for m in MIGRACIONES)
+
+
+def version_actual(conn: Connection) -> int:
+    try:
+        return conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+    except DBAPIError:
+        conn.rollback()
+        return 0  # DB sin versionar (nueva o anterior a este módulo)
+
+
+def migrar(engine: Engine, hasta: Optional[int] = None) -> List[int]:
+    """Aplica las migraciones pendientes (hasta `hasta`). Devuelve las versiones aplicadas."""
+    objetivo = hasta if hasta is not None else version_esperada()
+    with engine.connect() as conn:
+        if version_actual(conn) >= objetivo:
+            return []  # camino normal de arranque: una sola consulta
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            # pysqlite no abre transacción para DDL; se abre a mano para que todo sea atómico
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        conn.exec_driver_sql(VERSION_DDL)
+        actual = conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+        aplicadas = []
+        for m in sorted(MIGRACIONES):
+            if actual < m.version <= objetivo:
+                m.aplicar(conn)
+                conn.execute(text("INSERT INTO schema_version (version, nombre) VALUES (:v, :n)"),
+                             {"v": m.version, "n": m.nombre})
+                aplicadas.append(m.version)
+        conn.commit()
+    return aplicadas
+
+
+def estado(engine: Engine) -> dict:
+    with engine.connect() as conn:
+        actual = version_actual(conn)
+    return {
+        "version": actual,
+        "esperada": version_esperada(),
+        "pendientes": [(m.version, m.nombre) for m in sorted(MIGRACIONES) if m.version > actual],
+    }
+
+
+def tabla_existe(conn: Connection, nombre: str) -> bool:
+    return inspect(conn).has_table(nombre)
+
+
+# =========================
+# Utilidades para las migraciones
+# =========================
+def _indices(tabla) -> list:
+    # Table.indexes es un set: por nombre, para que el orden (y el volcado) no cambie entre corridas
+    return sorted(tabla.indexes, key=lambda idx: idx.name)
+
+
+def _crear_tabla(conn: Connection, nombre: str) -> None:
+    if tabla_existe(conn, nombre):
+        return
+    tabla = SQLModel.metadata.tables[nombre]
+    conn.execute(CreateTable(tabla))
+    for idx in _indices(tabla):
+        idx.create(conn)
+
+
+def _agregar_columna(conn: Connection, tabla: str, columna: str, tipo: str) -> None:
+    if columna not in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+        conn.exec_driver_sql(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+
+
+def _crear_indices(conn: Connection, tabla: str) -> None:
+    """Índices del modelo que falten; se omite uno si ya hay otro sobre las mismas columnas."""
+    existentes = inspect(conn).get_indexes(tabla)
+    nombres = {i["name"] for i in existentes}
+    columnas = {tuple(i["column_names"]) for i in existentes}
+    for idx in _indices(SQLModel.metadata.tables[tabla]):
+        if idx.name in nombres or tuple(c.name for c in idx.columns) in columnas:
+            continue
+        idx.create(conn)
+
+
+# =========================
+# Migraciones
+# =========================
+@migracion(1, "tablas_base")
+def _m1(conn: Connection) -> None:
+    for tabla in ("usuario", "parcela", "cultivo", "gastos"):
+        _crear_tabla(conn, tabla)
+
+
+@migracion(2, "gastos_creado_en")
+def _m2(conn: Connection) -> None:
+    # SQLite no acepta DEFAULT no constante en ADD COLUMN; la app siempre escribe creado_en
+    tipo = "DATETIME" if conn.dialect.name == "sqlite" else "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+    _agregar_columna(conn, "gastos", "creado_en", tipo)
+
+
+@migracion(3, "indices")
+def _m3(conn: Connection) -> None:
+    # FKs de parcela/cultivo, búsqueda por CURP/teléfono, orden por nombre, rango de gastos
+    for tabla in ("usuario", "parcela", "cultivo", "gastos"):
+        _crear_indices(conn, tabla)
+
+
+@migracion(4, "gastos_trimestrales")
+def _m4(conn: Connection) -> None:
+    from main import reconstruir_gastos_trimestrales
+
+    existia = tabla_existe(conn, "gastos_trimestrales")
+    _crear_tabla(conn, "gastos_trimestrales")
+    if not existia:
+        # La sesión se une a la transacción de la migración (no la confirma por su cuenta)
+        with Session(bind=conn) as session:
+            reconstruir_gastos_trimestrales(session)
+
+
+USUARIO_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS usuario_fts USING fts5(
+        nombre_completo, curp, telefono,
+        content='usuario', content_rowid='id_usuario',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS usuario_fts_ai AFTER INSERT ON usuario BEGIN
+        INSERT INTO usuario_fts(rowid, nombre_completo, curp, telefono)
+        VALUES (new.id_usuario, new.nombre_completo, new.curp, new.telefono);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS usuario_fts_ad AFTER DELETE ON usuario BEGIN
+        INSERT INTO usuario_fts(usuario_fts, rowid, nombre_completo, curp, telefono)
+        VALUES ('delete', old.id_usuario, old.nombre_completo, old.curp, old.telefono);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS usuario_fts_au AFTER UPDATE OF nombre_completo, curp, telefono ON usuario BEGIN
+        INSERT INTO usuario_fts(usuario_fts, rowid, nombre_completo, curp, telefono)
+        VALUES ('delete', old.id_usuario, old.nombre_completo, old.curp, old.telefono);
+        INSERT INTO usuario_fts(rowid, nombre_completo, curp, telefono)
+        VALUES (new.id_usuario, new.nombre_completo, new.curp, new.telefono);
+    END""",
+]
+
+
+@migracion(5, "usuario_fts")
+def _m5(conn: Connection) -> None:
+    # Búsqueda de usuarios sin acentos y por prefijo; solo SQLite con FTS5
+    if conn.dialect.name != "sqlite":
+        return
+    if not conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+        return  # /usuarios?q= sigue funcionando con LIKE
+    existia = tabla_existe(conn, "usuario_fts")
+    for ddl in USUARIO_FTS_DDL:
+        conn.exec_driver_sql(ddl)
+    if not existia:
+        conn.exec_driver_sql("INSERT INTO usuario_fts(usuario_fts) VALUES ('rebuild')")
+
+
+@migracion(6, "token_revocado")
+def _m6(conn: Connection) -> None:
+    _crear_tabla(conn, "token_revocado")
+
+
+@migracion(7, "score")
+def _m7(conn: Connection) -> None:
+    _crear_tabla(conn, "score")
+    # Los usuarios existentes quedan pendientes para el primer recálculo
+    conn.exec_driver_sql(
+        "INSERT INTO score (id_usuario, pendiente) SELECT id_usuario, 1 FROM usuario "
+        "WHERE id_usuario NOT IN (SELECT id_usuario FROM score)"
+    )
+
+
+@migracion(8, "gastos_mensuales_archivados")
+def _m8(conn: Connection) -> None:
+    # Totales de lo que el job de archivo.py mueve al archivo frío
+    _crear_tabla(conn, "gastos_mensuales_archivados")
+
+
+PARCELA_GEO_DDL = [
+    # Un punto por parcela (min = max, en float32 redondeado hacia afuera): solo da
+    # candidatos, el filtro exacto se hace sobre parcela.latitud/longitud
+    """CREATE VIRTUAL TABLE IF NOT EXISTS parcela_geo USING rtree(
+        id_parcela, min_lat, max_lat, min_lon, max_lon
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS parcela_geo_ai AFTER INSERT ON parcela
+    WHEN new.latitud IS NOT NULL AND new.longitud IS NOT NULL BEGIN
+        INSERT INTO parcela_geo VALUES (new.id_parcela, new.latitud, new.latitud,
+                                        new.longitud, new.longitud);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS parcela_geo_ad AFTER DELETE ON parcela BEGIN
+        DELETE FROM parcela_geo WHERE id_parcela = old.id_parcela;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS parcela_geo_au AFTER UPDATE OF latitud, longitud ON parcela BEGIN
+        DELETE FROM parcela_geo WHERE id_parcela = old.id_parcela;
+        INSERT INTO parcela_geo SELECT new.id_parcela, new.latitud, new.latitud,
+                                       new.longitud, new.longitud
+        WHERE new.latitud IS NOT NULL AND new.longitud IS NOT NULL;
+    END""",
+]
+
+
+@migracion(9, "parcela_geo")
+def _m9(conn: Connection) -> None:
+    from geo import campos_geo
+
+    for columna in ("latitud", "longitud", "hectareas"):
+        _agregar_columna(conn, "parcela", columna, "FLOAT")
+    # Las parcelas existentes: se parsean ubicacion y tamano una sola vez
+    filas = conn.exec_driver_sql("SELECT id_parcela, ubicacion, tamano FROM parcela").all()
+    derivadas = [{"id_parcela": i, **campos_geo(u, t)} for i, u, t in filas]
+    if derivadas:
+        conn.execute(text("UPDATE parcela SET latitud = :latitud, longitud = :longitud, "
+                          "hectareas = :hectareas WHERE id_parcela = :id_parcela"), derivadas)
+    _crear_indices(conn, "parcela")
+    # /parcelas/cercanas y /parcelas/mapa funcionan sin él, filtrando sobre parcela
+    if conn.dialect.name != "sqlite":
+        return
+    if not conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_RTREE')").scalar():
+        return
+    existia = tabla_existe(conn, "parcela_geo")
+    for ddl in PARCELA_GEO_DDL:
+        conn.exec_driver_sql(ddl)
+    if not existia:
+        conn.exec_driver_sql(
+            "INSERT INTO parcela_geo SELECT id_parcela, latitud, latitud, longitud, longitud "
+            "FROM parcela WHERE latitud IS NOT NULL AND longitud IS NOT NULL")
+
+
+@migracion(10, "sync_cambio")
+def _m10(conn: Connection) -> None:
+    existia = tabla_existe(conn, "sync_cambio")
+    _crear_tabla(conn, "sync_cambio")
+    _crear_tabla(conn, "sync_subida")
+    if existia:
+        return
+    # Lo que ya existe entra como alta: un cliente nuevo (since=0) recibe todo una vez
+    conn.exec_driver_sql(
+        "INSERT INTO sync_cambio (id_usuario, tabla, id_fila) "
+        "SELECT id_usuario, 'usuario', id_usuario FROM usuario "
+        "UNION ALL SELECT id_usuario, 'parcela', id_parcela FROM parcela "
+        "UNION ALL SELECT p.id_usuario, 'cultivo', c.id_cultivo "
+        "FROM cultivo c JOIN parcela p ON p.id_parcela = c.id_parcela "
+        "UNION ALL SELECT id_usuario, 'gastos', id_gastos FROM gastos"
+    )
@@ -0,0 +1,74 @@
+# migrar.py — crea o actualiza el esquema de la DB (reemplaza a init_db.py)
+#
+# Uso (desde backend/):
+#   python migrar.py                          # aplica lo pendiente en db.sqlite3 / DATABASE_URL
+#   python migrar.py --estado                 # versión actual y migraciones pendientes
+#   python migrar.py --db-url sqlite:////tmp/x.sqlite3 --hasta 3
+#   python migrar.py --volcar-esquema fintiva_schema.sql   # DDL resultante (solo SQLite)
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+# Tablas internas de una tabla virtual FTS5 o R*Tree (las crea solo el CREATE VIRTUAL TABLE)
+_SOMBRA = re.compile(r"^(.+)_(data|idx|content|docsize|config|rowid|node|parent)$")
+
+
+def volcar_esquema(engine, destino: str) -> None:
+    with engine.connect() as conn:
+        filas = conn.exec_driver_sql(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, rowid"
+        ).all()
+        versiones = conn.exec_driver_sql("SELECT version, nombre FROM schema_version ORDER BY version").all()
+    partes = [
+        "-- fintiva_schema.sql — GENERADO con `python migrar.py --volcar-esquema`; no editar a mano.\n"
+        "-- La fuente del esquema son las migraciones de migraciones.py.\n"
+        "PRAGMA foreign_keys = ON;",
+    ]
+    virtuales = {nombre for tipo, nombre, sql in filas
+                 if tipo == "table" and sql.upper().startswith("CREATE VIRTUAL TABLE")}
+    for tipo, nombre, sql in filas:
+        sombra = _SOMBRA.match(nombre)
+        if tipo == "table" and sombra and sombra.group(1) in virtuales:
+            continue
+        partes.append("\n".join(l.rstrip() for l in sql.strip().splitlines()) + ";")
+    # Una DB creada con este archivo queda al día para el runner
+    partes += [f"INSERT INTO schema_version (version, nombre) VALUES ({v}, '{n}');" for v, n in versiones]
+    Path(destino).write_text("\n\n".join(partes) + "\n", encoding="utf-8")
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Migraciones del esquema de FINTIVA")
+    ap.add_argument("--db-url", help="Por defecto DATABASE_URL o backend/db.sqlite3")
+    ap.add_argument("--estado", action="store_true", help="Solo muestra la versión y lo pendiente")
+    ap.add_argument("--hasta", type=int, help="Aplica hasta esta versión")
+    ap.add_argument("--volcar-esquema", metavar="ARCHIVO", help="Escribe el DDL resultante")
+    args = ap.parse_args()
+
+    if args.db_url:
+        os.environ["DATABASE_URL"] = args.db_url  # antes de importar main/db
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import main
+    import migraciones
+
+    print("DB:", main.engine.url.render_as_string(hide_password=True))
+    if args.estado:
+        e = migraciones.estado(main.engine)
+        print(f"Versión {e['version']} de {e['esperada']}")
+        for v, nombre in e["pendientes"]:
+            print(f"  pendiente {v:>3}  {nombre}")
+        return
+    t0 = time.perf_counter()
+    aplicadas = migraciones.migrar(main.engine, args.hasta)
+    print(f"Aplicadas {aplicadas or 'ninguna (ya al día)'} en {(time.perf_counter() - t0) * 1000:.0f} ms")
+    if args.volcar_esquema:
+        volcar_esquema(main.engine, args.volcar_esquema)
+        print("Esquema escrito en", args.volcar_esquema)
+
+
+if __name__ == "__main__":
+    main_cli()
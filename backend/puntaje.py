@@ -0,0 +1,343 @@
+# puntaje.py — score crediticio por usuario, calculado por lotes con NumPy
+#
+# Variables (todas a partir de parcela, cultivo y gastos_trimestrales):
+#   hectareas        superficie total (tamano: "3.5 ha", "50", "2000 m2")
+#   tenencia         seguridad de la tenencia, ponderada por superficie
+#   riego            fracción de la superficie con riego (no "temporal")
+#   rendimiento      producción del año pasado por hectárea
+#   crecimiento      producción año pasado vs antepasado (-1..1)
+#   historial        trimestres con gastos registrados en los últimos 8
+#   estabilidad      1 - coeficiente de variación del gasto trimestral
+#   diversificacion  número de cultivos (hasta 5)
+# El puntaje (300..850) es una logística de la suma ponderada: un modelo
+# explicable y fijo (MODELO_VERSION), no entrenado.
+#
+# Recalcular solo lo que cambió: cada escritura de parcelas/cultivos/gastos suma
+# 1 a score.pendiente en su misma transacción (marcar_pendientes). El recálculo
+# lee `pendiente` junto con las variables y al guardar le resta lo que vio, así
+# que una escritura concurrente deja la fila pendiente para la siguiente vuelta.
+# Un recálculo completo divide los usuarios en rangos de id y, si son muchos,
+# los reparte en un pool de procesos; solo el proceso principal escribe.
+# Este módulo no importa main: los procesos del pool lo cargan solo con db y numpy.
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+MODELO_VERSION = 1
+VARIABLES = ("hectareas", "tenencia", "riego", "rendimiento", "crecimiento",
+             "historial", "estabilidad", "diversificacion")
+# Peso de cada variable ya escalada a ~[0, 1] (crecimiento a [-1, 1]) y sesgo
+PESOS = np.array([0.6, 1.0, 0.8, 1.2, 0.8, 1.0, 0.8, 0.4])
+SESGO = -3.0
+NIVELES = ((740, "A"), (670, "B"), (580, "C"), (500, "D"), (0, "E"))
+TENENCIA = {"propia": 1.0, "ejidal": 0.8, "comunal": 0.6, "rentada": 0.3}
+TENENCIA_DESCONOCIDA = 0.5
+
+SCORE_LOTE = int(os.getenv("SCORE_LOTE", "20000"))            # usuarios por lote
+SCORE_PROCESOS = int(os.getenv("SCORE_PROCESOS", str(os.cpu_count() or 1)))
+SCORE_POOL_MIN = int(os.getenv("SCORE_POOL_MIN", "100000"))   # menos que esto: en el mismo proceso
+_LOTE_IN = 500  # ids por consulta IN (límite de variables de SQLite)
+
+_TAMANO = re.compile(r"([0-9]+(?:[.,][0-9]+)?)\s*([a-z²0-9]*)")
+
+
+def hectareas(tamano: Optional[str]) -> float:
+    """'3.5 ha' -> 3.5; '2000 m2' -> 0.2; un número solo se toma como hectáreas."""
+    m = _TAMANO.search((tamano or "").lower())
+    if not m:
+        return 0.0
+    valor = float(m.group(1).replace(",", "."))
+    unidad = m.group(2)
+    if unidad.startswith("m"):  # m2, m², mts2, mn2
+        return valor / 10_000
+    return valor
+
+
+def periodo_actual(ahora: Optional[datetime] = None) -> int:
+    ahora = ahora or datetime.utcnow()
+    return ahora.year * 4 + (ahora.month - 1) // 3
+
+
+# =========================
+# Lectura y cálculo por lote
+# =========================
+def _leer_lote(conn, donde: str, params: dict) -> dict:
+    """Filas crudas de un lote de usuarios; `donde` filtra la columna id_usuario."""
+    def filas(sql):
+        return conn.execute(text(sql), params).cursor.fetchall()
+
+    return {
+        "usuarios": filas(f"""
+            SELECT u.id_usuario, COALESCE(s.pendiente, 0) FROM usuario u
+            LEFT JOIN score s ON s.id_usuario = u.id_usuario
+            WHERE u.{donde} ORDER BY u.id_usuario"""),
+        "parcelas": filas(f"""
+            SELECT id_usuario, tamano, LOWER(COALESCE(tipo_tenencia, '')), LOWER(COALESCE(sistema_riego, ''))
+            FROM parcela WHERE {donde}"""),
+        "cultivos": filas(f"""
+            SELECT p.id_usuario, COALESCE(c.produccion_anio_pasado, 0), COALESCE(c.produccion_anio_antepasado, 0)
+            FROM cultivo c JOIN parcela p ON p.id_parcela = c.id_parcela WHERE p.{donde}"""),
+        "trimestres": filas(f"""
+            SELECT id_usuario, anio * 4 + trimestre - 1, total
+            FROM gastos_trimestrales WHERE {donde}"""),
+    }
+
+
+def calcular(crudo: dict, periodo: int) -> dict:
+    """Variables y puntaje de todos los usuarios del lote, sin ciclos por usuario."""
+    if not crudo["usuarios"]:
+        return {"ids": np.zeros(0, np.int64)}
+    usuarios = np.array(crudo["usuarios"], dtype=np.int64)
+    ids, vistos = usuarios[:, 0], usuarios[:, 1]
+    n = len(ids)
+
+    def indice(filas):
+        return np.searchsorted(ids, np.fromiter((f[0] for f in filas), np.int64, len(filas)))
+
+    def suma(i, pesos):
+        return np.bincount(i, weights=pesos, minlength=n)
+
+    p = crudo["parcelas"]
+    ip = indice(p)
+    area = np.fromiter((hectareas(f[1]) for f in p), np.float64, len(p))
+    seg = np.fromiter((TENENCIA.get(f[2], TENENCIA_DESCONOCIDA) for f in p), np.float64, len(p))
+    con_riego = np.fromiter((f[3] not in ("", "temporal") for f in p), np.float64, len(p))
+    ha = suma(ip, area)
+    ha_div = np.maximum(ha, 1e-9)
+    tenencia = np.where(ha > 0, suma(ip, area * seg) / ha_div, TENENCIA_DESCONOCIDA)
+    riego = np.where(ha > 0, suma(ip, area * con_riego) / ha_div, 0.0)
+
+    c = np.array(crudo["cultivos"], dtype=np.float64).reshape(-1, 3)
+    ic = np.searchsorted(ids, c[:, 0].astype(np.int64))
+    pasado, antepasado = suma(ic, c[:, 1]), suma(ic, c[:, 2])
+    n_cultivos = np.bincount(ic, minlength=n)
+    rendimiento = pasado / np.maximum(ha, 0.1)
+    crecimiento = np.clip((pasado - antepasado) / np.maximum(antepasado, 1), -1, 1)
+
+    # Gasto por trimestre en los últimos 8, como matriz usuarios × 8
+    t = np.array(crudo["trimestres"], dtype=np.float64).reshape(-1, 3)
+    edad = periodo - t[:, 1].astype(np.int64)
+    reciente = (edad >= 0) & (edad < 8)
+    gasto = np.zeros((n, 8))
+    np.add.at(gasto, (np.searchsorted(ids, t[reciente, 0].astype(np.int64)), edad[reciente]), t[reciente, 2])
+    con_gasto = (gasto > 0).sum(axis=1)
+    media = gasto.sum(axis=1) / np.maximum(con_gasto, 1)
+    desv = np.sqrt((((gasto - media[:, None]) ** 2) * (gasto > 0)).sum(axis=1) / np.maximum(con_gasto, 1))
+    cv = np.where(con_gasto > 1, desv / np.maximum(media, 1e-9), 1.0)
+
+    # Se guardan en sus unidades (ha, trimestres, cultivos) y se escalan para el puntaje
+    variables = np.column_stack([ha, tenencia, riego, rendimiento, crecimiento,
+                                 con_gasto, 1 - np.minimum(cv, 1), n_cultivos])
+    escaladas = np.column_stack([
+        np.minimum(np.log1p(ha) / np.log1p(50), 1),
+        tenencia,
+        riego,
+        np.minimum(np.log1p(rendimiento) / np.log1p(100), 1),
+        crecimiento,
+        con_gasto / 8,
+        variables[:, 6],
+        np.minimum(n_cultivos, 5) / 5,
+    ])
+    z = SESGO + escaladas @ PESOS
+    puntaje = np.round(300 + 550 / (1 + np.exp(-z)), 1)
+    nivel = np.full(n, NIVELES[-1][1], dtype=object)
+    for corte, letra in reversed(NIVELES[:-1]):
+        nivel[puntaje >= corte] = letra
+    return {"ids": ids, "vistos": vistos, "variables": np.round(variables, 4),
+            "puntaje": puntaje, "nivel": nivel}
+
+
+_UPSERT_SCORE = text(
+    "INSERT INTO score (id_usuario, puntaje, nivel, " + ", ".join(VARIABLES)
+    + ", version, calculado_en, pendiente) VALUES (:id_usuario, :puntaje, :nivel, "
+    + ", ".join(f":{v}" for v in VARIABLES) + ", :version, :calculado_en, 0) "
+    "ON CONFLICT (id_usuario) DO UPDATE SET puntaje = excluded.puntaje, nivel = excluded.nivel, "
+    + ", ".join(f"{v} = excluded.{v}" for v in VARIABLES)
+    + ", version = excluded.version, calculado_en = excluded.calculado_en, "
+    "pendiente = CASE WHEN score.pendiente > :visto THEN score.pendiente - :visto ELSE 0 END"
+)
+
+_MARCAR = text(
+    "INSERT INTO score (id_usuario, pendiente) VALUES (:id_usuario, 1) "
+    "ON CONFLICT (id_usuario) DO UPDATE SET pendiente = score.pendiente + 1"
+)
+
+
+def marcar_pendientes(conn, ids: Iterable[int]) -> None:
+    """Marca usuarios para recálculo; va en la transacción de la escritura que lo causa."""
+    filas = [{"id_usuario": i} for i in sorted(set(ids))]
+    if filas:
+        conn.execute(_MARCAR, filas)
+
+
+def guardar(conn, r: dict) -> int:
+    if not len(r["ids"]):
+        return 0
+    ahora = datetime.utcnow().replace(microsecond=0)
+    filas = [
+        {"id_usuario": i, "visto": v, "puntaje": p, "nivel": nv, "version": MODELO_VERSION,
+         "calculado_en": ahora, **dict(zip(VARIABLES, fila))}
+        for i, v, p, nv, fila in zip(r["ids"].tolist(), r["vistos"].tolist(), r["puntaje"].tolist(),
+                                     r["nivel"].tolist(), r["variables"].tolist())
+    ]
+    conn.execute(_UPSERT_SCORE, filas)
+    return len(filas)
+
+
+def _leer_consistente(engine, donde: str, params: dict) -> dict:
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN")  # pendiente y variables del mismo instante
+        crudo = _leer_lote(conn, donde, params)
+        conn.rollback()
+    return crudo
+
+
+# Cada proceso del pool abre su propio engine una sola vez
+_engine_proceso = None
+
+
+def _calcular_rango(db_url: str, desde: int, hasta: int, periodo: int) -> dict:
+    global _engine_proceso
+    if _engine_proceso is None:
+        from db import crear_engine
+        _engine_proceso = crear_engine(db_url)
+    crudo = _leer_consistente(_engine_proceso, "id_usuario BETWEEN :desde AND :hasta",
+                              {"desde": desde, "hasta": hasta})
+    return calcular(crudo, periodo)
+
+
+class ServicioScore:
+    """Recalcula los scores pendientes cada `intervalo_s` y bajo demanda."""
+
+    def __init__(self, engine, db_url: str, intervalo_s: float):
+        self.engine = engine
+        self.db_url = db_url
+        self.intervalo_s = intervalo_s
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.ultima = {"usuarios": 0, "duracion_s": 0.0, "procesos": 1}
+        self.total_calculados = 0
+
+    def recalcular_usuarios(self, ids: list) -> int:
+        """Recalcula estos usuarios en el proceso actual (lotes IN de _LOTE_IN)."""
+        periodo = periodo_actual()
+        hechos = 0
+        for i in range(0, len(ids), _LOTE_IN):
+            lote = ids[i:i + _LOTE_IN]
+            marcas = ", ".join(f":u{k}" for k in range(len(lote)))
+            crudo = _leer_consistente(self.engine, f"id_usuario IN ({marcas})",
+                                      {f"u{k}": u for k, u in enumerate(lote)})
+            with self.engine.begin() as conn:
+                hechos += guardar(conn, calcular(crudo, periodo))
+        self.total_calculados += hechos
+        return hechos
+
+    def recalcular_pendientes(self) -> int:
+        with self._lock:
+            t0 = time.perf_counter()
+            with self.engine.connect() as conn:
+                ids = list(conn.execute(text("SELECT id_usuario FROM score WHERE pendiente > 0")).scalars())
+            hechos = self.recalcular_usuarios(ids)
+            self.ultima = {"usuarios": hechos, "duracion_s": round(time.perf_counter() - t0, 3), "procesos": 1}
+            return hechos
+
+    def recalcular_todos(self, procesos: Optional[int] = None) -> int:
+        """Todos los usuarios por rangos de id; en paralelo si son SCORE_POOL_MIN o más."""
+        with self._lock:
+            t0 = time.perf_counter()
+            with self.engine.connect() as conn:
+                minimo, maximo, total = conn.execute(text(
+                    "SELECT MIN(id_usuario), MAX(id_usuario), COUNT(*) FROM usuario")).one()
+            if not total:
+                return 0
+            # Rangos de ~SCORE_LOTE usuarios suponiendo ids casi contiguos
+            paso = max(1, int(SCORE_LOTE * (maximo - minimo + 1) / total))
+            rangos = [(a, min(a + paso - 1, maximo)) for a in range(minimo, maximo + 1, paso)]
+            procesos = procesos or (SCORE_PROCESOS if total >= SCORE_POOL_MIN else 1)
+            periodo = periodo_actual()
+            hechos = 0
+            if procesos > 1:
+                # spawn: no hereda hilos ni conexiones abiertas del servidor
+                with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    for r in pool.map(_calcular_rango, *zip(*[(self.db_url, a, b, periodo) for a, b in rangos])):
+                        with self.engine.begin() as conn:
+                            hechos += guardar(conn, r)
+            else:
+                for a, b in rangos:
+                    crudo = _leer_consistente(self.engine, "id_usuario BETWEEN :desde AND :hasta",
+                                              {"desde": a, "hasta": b})
+                    with self.engine.begin() as conn:
+                        hechos += guardar(conn, calcular(crudo, periodo))
+            self.total_calculados += hechos
+            self.ultima = {"usuarios": hechos, "duracion_s": round(time.perf_counter() - t0, 3),
+                           "procesos": procesos}
+            return hechos
+
+    def marcar_version_anterior(self) -> None:
+        """Un cambio de MODELO_VERSION deja pendientes los scores calculados con la anterior."""
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE score SET pendiente = pendiente + 1 "
+                              "WHERE version IS NOT NULL AND version <> :v"), {"v": MODELO_VERSION})
+
+    def iniciar(self) -> None:
+        if self.intervalo_s <= 0 or self._hilo is not None:
+            return
+
+        def ciclo():
+            try:
+                self.marcar_version_anterior()
+            except Exception as e:
+                print(">>> score: no se pudo revisar la versión del modelo:", e)
+            while not self._parar.wait(self.intervalo_s):
+                try:
+                    self.recalcular_pendientes()
+                except Exception as e:  # la próxima vuelta lo reintenta
+                    print(">>> score: error al recalcular:", e)
+
+        self._hilo = threading.Thread(target=ciclo, name="score", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+
+    def estadisticas(self) -> dict:
+        with self.engine.connect() as conn:
+            pendientes = conn.execute(text("SELECT COUNT(*) FROM score WHERE pendiente > 0")).scalar()
+        return {"pendientes": pendientes, "calculados_total": self.total_calculados,
+                "ultimo_lote_usuarios": self.ultima["usuarios"],
+                "ultimo_lote_segundos": self.ultima["duracion_s"]}
+
+
+def main_cli():
+    import argparse
+    import sys
+    from pathlib import Path
+
+    ap = argparse.ArgumentParser(description="Recalcula el score crediticio")
+    ap.add_argument("--db-url", help="Por defecto DATABASE_URL o backend/db.sqlite3")
+    ap.add_argument("--todos", action="store_true", help="Todos los usuarios (si no, solo los pendientes)")
+    ap.add_argument("--procesos", type=int, help=f"Procesos del pool (por defecto {SCORE_PROCESOS} "
+                                                 f"si hay {SCORE_POOL_MIN}+ usuarios)")
+    args = ap.parse_args()
+    if args.db_url:
+        os.environ["DATABASE_URL"] = args.db_url
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from db import DATABASE_URL, crear_engine
+
+    servicio = ServicioScore(crear_engine(DATABASE_URL), DATABASE_URL, 0)
+    hechos = servicio.recalcular_todos(args.procesos) if args.todos else servicio.recalcular_pendientes()
+    print(f"{hechos} scores en {servicio.ultima['duracion_s']:.1f} s ({servicio.ultima['procesos']} procesos)")
+
+
+if __name__ == "__main__":
+    main_cli()
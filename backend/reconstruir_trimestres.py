@@ -0,0 +1,14 @@
+# reconstruir_trimestres.py — recalcula gastos_trimestrales a partir de la tabla gastos
+# Uso: python reconstruir_trimestres.py [id_usuario]
+import sys
+
+from sqlmodel import Session
+
+from main import engine, create_db_and_tables, reconstruir_gastos_trimestrales
+
+id_usuario = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+create_db_and_tables()
+with Session(engine) as session:
+    filas = reconstruir_gastos_trimestrales(session, id_usuario)
+print("Listo. Filas en gastos_trimestrales:", filas)
@@ -0,0 +1,87 @@
+# respuestas.py — JSON directo de filas SQL, sin modelos, con compresión opcional
+#
+# Las rutas de listas seleccionan solo las columnas pedidas y serializan las
+# tuplas tal cual: sin construir objetos ORM ni validar cada fila con Pydantic.
+# - orjson si está instalado (datetime, floats y UTF-8 nativos); si no, json.
+# - Con Accept-Encoding y un cuerpo de al menos COMPRESION_MIN_BYTES se comprime
+#   con brotli (si el paquete está instalado) o gzip.
+import gzip
+import json
+import os
+from datetime import date, datetime
+from typing import Iterable, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response
+
+try:
+    import orjson
+except ImportError:  # opcional: requirements.txt lo incluye
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # opcional (pip install brotli): sin él se ofrece solo gzip
+    brotli = None
+
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+GZIP_NIVEL = int(os.getenv("GZIP_NIVEL", "5"))
+BROTLI_CALIDAD = int(os.getenv("BROTLI_CALIDAD", "4"))  # 4-5: buena razón sin costo alto de CPU
+
+
+def _fecha_iso(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    raise TypeError(f"No serializable: {type(v).__name__}")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_fecha_iso).encode("utf-8")
+
+
+def filas_json(columnas: Sequence[str], filas: Iterable[tuple]) -> bytes:
+    return dumps([dict(zip(columnas, f)) for f in filas])
+
+
+def columnas_pedidas(fields: Optional[str], permitidas: Sequence[str]) -> list:
+    """Columnas de ?fields=a,b (en el orden de `permitidas`); sin fields, todas."""
+    if not fields:
+        return list(permitidas)
+    pedidas = {f.strip() for f in fields.split(",") if f.strip()}
+    desconocidas = pedidas - set(permitidas)
+    if desconocidas:
+        raise HTTPException(422, f"fields desconocidos: {', '.join(sorted(desconocidas))}")
+    return [c for c in permitidas if c in pedidas]
+
+
+def _codificacion(accept_encoding: str) -> Optional[str]:
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, params = parte.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+    if brotli is not None and aceptadas.get("br", 0) > 0:
+        return "br"
+    if aceptadas.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def respuesta_json(request: Request, cuerpo: bytes, headers: Optional[dict] = None) -> Response:
+    headers = dict(headers or {})
+    if len(cuerpo) >= COMPRESION_MIN_BYTES:
+        headers["Vary"] = "Accept-Encoding"
+        codificacion = _codificacion(request.headers.get("accept-encoding", ""))
+        if codificacion == "br":
+            cuerpo = brotli.compress(cuerpo, quality=BROTLI_CALIDAD)
+        elif codificacion == "gzip":
+            cuerpo = gzip.compress(cuerpo, compresslevel=GZIP_NIVEL)
+        if codificacion:
+            headers["Content-Encoding"] = codificacion
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
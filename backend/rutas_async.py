@@ -0,0 +1,146 @@
+# rutas_async.py — versiones async de las rutas de lectura (solo con DB_ASYNC=1)
+#
+# main.py las registra en lugar de sus equivalentes síncronas. Las métricas
+# reutilizan las mismas funciones de cálculo vía AsyncSession.run_sync, así
+# que la lógica SQL vive en un solo lugar.
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import get_async_session
+from main import (
+    Usuario, Parcela, Cultivo, Gastos,
+    cache_metricas, _serializar_metrica, _respuesta_con_etag, _rango_metricas, METRICAS_ANIO_MAX,
+    _calcular_parcelas_cultivos, _calcular_gastos_trimestrales,
+    DASHBOARD_CAMPOS, _campos_dashboard, _calcular_dashboard,
+    PARCELA_COLUMNAS, CULTIVO_COLUMNAS, GASTOS_COLUMNAS, FIELDS_DESC, _select_columnas,
+    INCLUDE_ARCHIVED_DESC, _select_gastos_de_usuario,
+)
+from respuestas import columnas_pedidas, filas_json, respuesta_json
+
+router = APIRouter()
+
+
+async def _respuesta_metrica(request: Request, session: AsyncSession, id_usuario: int,
+                             clave: tuple, calcular):
+    entrada = cache_metricas.obtener(id_usuario, clave)
+    if entrada is None:
+        generacion = cache_metricas.generacion(id_usuario)
+        cuerpo = _serializar_metrica(await session.run_sync(calcular))
+        entrada = (cache_metricas.guardar(id_usuario, clave, cuerpo, generacion), cuerpo)
+    return _respuesta_con_etag(request, *entrada)
+
+
+@router.get("/usuarios/{id_usuario}", response_model=Usuario)
+async def obtener_usuario(id_usuario: int, session: AsyncSession = Depends(get_async_session)):
+    obj = await session.get(Usuario, id_usuario)
+    if not obj:
+        raise HTTPException(404, "Usuario no encontrado")
+    return obj
+
+
+@router.get("/parcelas/{id_parcela}", response_model=Parcela)
+async def obtener_parcela(id_parcela: int, session: AsyncSession = Depends(get_async_session)):
+    obj = await session.get(Parcela, id_parcela)
+    if not obj:
+        raise HTTPException(404, "Parcela no encontrada")
+    return obj
+
+
+@router.get("/usuarios/{id_usuario}/parcelas", response_model=List[Parcela])
+async def parcelas_de_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    session: AsyncSession = Depends(get_async_session),
+):
+    columnas = columnas_pedidas(fields, PARCELA_COLUMNAS)
+    stmt = _select_columnas(Parcela.__table__, columnas).where(Parcela.id_usuario == id_usuario)
+    return respuesta_json(request, filas_json(columnas, await session.execute(stmt)))
+
+
+@router.get("/cultivos/{id_cultivo}", response_model=Cultivo)
+async def obtener_cultivo(id_cultivo: int, session: AsyncSession = Depends(get_async_session)):
+    obj = await session.get(Cultivo, id_cultivo)
+    if not obj:
+        raise HTTPException(404, "Cultivo no encontrado")
+    return obj
+
+
+@router.get("/parcelas/{id_parcela}/cultivos", response_model=List[Cultivo])
+async def cultivos_de_parcela(
+    id_parcela: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    session: AsyncSession = Depends(get_async_session),
+):
+    columnas = columnas_pedidas(fields, CULTIVO_COLUMNAS)
+    stmt = _select_columnas(Cultivo.__table__, columnas).where(Cultivo.id_parcela == id_parcela)
+    return respuesta_json(request, filas_json(columnas, await session.execute(stmt)))
+
+
+@router.get("/gastos/{id_gastos}", response_model=Gastos)
+async def obtener_gasto(id_gastos: int, session: AsyncSession = Depends(get_async_session)):
+    obj = await session.get(Gastos, id_gastos)
+    if not obj:
+        raise HTTPException(404, "Registro de gastos no encontrado")
+    return obj
+
+
+@router.get("/usuarios/{id_usuario}/gastos", response_model=List[Gastos])
+async def gastos_de_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    include_archived: bool = Query(False, description=INCLUDE_ARCHIVED_DESC),
+    session: AsyncSession = Depends(get_async_session),
+):
+    columnas = columnas_pedidas(fields, GASTOS_COLUMNAS)
+    stmt = _select_gastos_de_usuario(id_usuario, columnas, include_archived)
+    return respuesta_json(request, filas_json(columnas, await session.execute(stmt)))
+
+
+@router.get("/metrics/parcelas-cultivos/{id_usuario}")
+async def parcelas_cultivos(id_usuario: int, request: Request,
+                            session: AsyncSession = Depends(get_async_session)):
+    return await _respuesta_metrica(
+        request, session, id_usuario, ("parcelas-cultivos",),
+        lambda s: _calcular_parcelas_cultivos(s, id_usuario),
+    )
+
+
+@router.get("/metrics/gastos-trimestrales/{id_usuario}")
+async def gastos_trimestrales(
+    id_usuario: int,
+    request: Request,
+    anio: Optional[int] = Query(None, ge=1900, le=METRICAS_ANIO_MAX, description="Solo ese año"),
+    desde: Optional[date] = Query(None, description="Fecha inicial (inclusive)"),
+    hasta: Optional[date] = Query(None, description="Fecha final (inclusive)"),
+    serie: Optional[str] = Query(
+        None, pattern="^(mes|trimestre|anio)$",
+        description="Serie multi-año agrupada por mes, trimestre o año",
+    ),
+    session: AsyncSession = Depends(get_async_session),
+):
+    desde, hasta = _rango_metricas(anio, desde, hasta)
+    return await _respuesta_metrica(
+        request, session, id_usuario, ("gastos-trimestrales", desde, hasta, serie),
+        lambda s: _calcular_gastos_trimestrales(s, id_usuario, desde, hasta, serie),
+    )
+
+
+@router.get("/usuarios/{id_usuario}/dashboard")
+async def dashboard_usuario(
+    id_usuario: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=f"Secciones separadas por coma: {','.join(DASHBOARD_CAMPOS)}"),
+    gastos_limit: int = Query(20, ge=0, le=500, description="Gastos recientes a incluir"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    campos = _campos_dashboard(fields)
+    return await _respuesta_metrica(
+        request, session, id_usuario, ("dashboard", campos, gastos_limit),
+        lambda s: _calcular_dashboard(s, id_usuario, campos, gastos_limit),
+    )
@@ -0,0 +1,118 @@
+# sesiones.py — verificación de JWT con caché de claims y lista de revocación
+#
+# - CacheClaims guarda los claims ya verificados por digest del token, con TTL
+#   acotado por el propio `exp`: una request autenticada no vuelve a decodificar
+#   ni a tocar la DB mientras el token esté en caché.
+# - Revocaciones mantiene en memoria los jti revocados (logout) y, por usuario,
+#   el instante a partir del cual los tokens anteriores dejan de valer (cambio de
+#   contraseña). La fuente de verdad es la tabla token_revocado; cada proceso la
+#   relee de forma incremental cada `intervalo_s` segundos.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+def digest_token(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class CacheClaims:
+    def __init__(self, max_entradas: int = 10000, ttl_s: float = 300.0):
+        self.max_entradas = max_entradas
+        self.ttl_s = ttl_s
+        self._entradas: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, token: str) -> Optional[dict]:
+        clave = digest_token(token)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[1] <= time.time():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def guardar(self, token: str, claims: dict) -> None:
+        if self.max_entradas <= 0:
+            return
+        # Nunca más allá del exp del token
+        vence = min(time.time() + self.ttl_s, float(claims.get("exp", 0)))
+        with self._lock:
+            self._entradas[digest_token(token)] = (claims, vence)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / consultas) if consultas else 0.0,
+            }
+
+
+class Revocaciones:
+    """`cargar(desde_id)` devuelve filas (id, jti, id_usuario, revocado_en, expira_en) con id > desde_id."""
+
+    def __init__(self, cargar: Callable[[int], Iterable[tuple]], intervalo_s: float = 5.0):
+        self._cargar = cargar
+        self.intervalo_s = intervalo_s
+        self._jtis: Dict[str, float] = {}          # jti -> expira_en
+        self._cortes: Dict[int, Tuple[float, float]] = {}  # id_usuario -> (revocado_en, expira_en)
+        self._ultimo_id = 0
+        self._proximo_refresco = 0.0
+        self._lock = threading.Lock()
+
+    def necesita_refresco(self) -> bool:
+        return time.monotonic() >= self._proximo_refresco
+
+    def refrescar(self) -> None:
+        # Un solo hilo relee la tabla; los demás siguen con lo que ya hay en memoria
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            filas = list(self._cargar(self._ultimo_id))
+            ahora = time.time()
+            for (id_fila, jti, id_usuario, revocado_en, expira_en) in filas:
+                self._agregar(jti, id_usuario, revocado_en, expira_en)
+                self._ultimo_id = max(self._ultimo_id, id_fila)
+            # Lo ya vencido no puede volver a presentarse: se descarta
+            self._jtis = {j: e for j, e in self._jtis.items() if e > ahora}
+            self._cortes = {u: c for u, c in self._cortes.items() if c[1] > ahora}
+            self._proximo_refresco = time.monotonic() + self.intervalo_s
+        finally:
+            self._lock.release()
+
+    def _agregar(self, jti: Optional[str], id_usuario: Optional[int],
+                 revocado_en: float, expira_en: float) -> None:
+        if jti:
+            self._jtis[jti] = expira_en
+        elif id_usuario is not None:
+            previo = self._cortes.get(id_usuario)
+            if previo is None or previo[0] < revocado_en:
+                self._cortes[id_usuario] = (revocado_en, expira_en)
+
+    def agregar(self, jti: Optional[str] = None, id_usuario: Optional[int] = None,
+                revocado_en: float = 0.0, expira_en: float = 0.0) -> None:
+        """Aplica en este proceso una revocación recién escrita (sin esperar al refresco)."""
+        self._agregar(jti, id_usuario, revocado_en, expira_en)
+
+    def revocado(self, claims: dict) -> bool:
+        if claims.get("jti") in self._jtis:
+            return True
+        corte = self._cortes.get(int(claims["sub"]))
+        return corte is not None and float(claims.get("iat", 0)) <= corte[0]
+
+    def estadisticas(self) -> dict:
+        return {"jtis": len(self._jtis), "usuarios": len(self._cortes), "ultimo_id": self._ultimo_id}
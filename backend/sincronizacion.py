@@ -0,0 +1,82 @@
+# sincronizacion.py — registro de cambios para la sincronización incremental (/sync)
+#
+# sync_cambio guarda a lo sumo una fila por fila sincronizable (usuario, parcela,
+# cultivo, gastos) con el seq de su último cambio. seq es AUTOINCREMENT: no se
+# reutiliza aunque se borre la fila más alta. Los handlers la escriben en la misma
+# transacción que el cambio, como marcar_pendientes:
+#   - un alta agrega su fila;
+#   - una modificación reemplaza la anterior (queda una por fila, con seq nuevo);
+#   - borrar un usuario quita todo lo suyo de ambas tablas. No hay tombstone: /sync
+#     solo responde al usuario del token y borrar revoca sus tokens, así que el
+#     cliente se entera por el 401 y descarta lo que tenga guardado.
+# El cliente guarda el seq más alto que recibió (el token) y pide lo posterior con
+# un range scan sobre (id_usuario, seq): el trabajo y el payload dependen de lo que
+# cambió, no del historial.
+#
+# Los gastos que archivo.py mueve al archivo frío dejan de viajar (como en
+# /usuarios/{id}/gastos sin include_archived) y el job borra aquí su fila.
+# En SQLite los escritores se serializan y seq sigue el orden de commit; en
+# PostgreSQL dos transacciones concurrentes pueden confirmar fuera de orden.
+#
+# sync_subida recuerda qué id del servidor recibió cada id_local que subió un
+# cliente (POST /sync): reintentar una subida cuya respuesta se perdió no duplica.
+from typing import Iterable
+
+from sqlalchemy import bindparam, text
+
+_LOTE_IN = 500  # ids por consulta IN (límite de variables de SQLite)
+
+_ALTA = text("INSERT INTO sync_cambio (id_usuario, tabla, id_fila) VALUES (:id_usuario, :tabla, :id_fila)")
+_QUITAR = text("DELETE FROM sync_cambio WHERE tabla = :tabla AND id_fila = :id_fila")
+
+_DESDE = text("""
+    SELECT seq, tabla, id_fila FROM sync_cambio
+    WHERE id_usuario = :id_usuario AND seq > :desde
+    ORDER BY seq
+    LIMIT :limite
+""")
+
+_PREVIAS = text(
+    "SELECT id_local, tabla, id_fila FROM sync_subida WHERE id_usuario = :id_usuario AND id_local IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+_SUBIDA = text("INSERT INTO sync_subida (id_usuario, id_local, tabla, id_fila) "
+               "VALUES (:id_usuario, :id_local, :tabla, :id_fila)")
+
+
+def registrar_altas(conn, tabla: str, pares: Iterable[tuple]) -> None:
+    """Filas nuevas: pares (id_usuario, id_fila). Va antes del commit del alta."""
+    filas = [{"id_usuario": u, "tabla": tabla, "id_fila": i} for u, i in pares]
+    if filas:
+        conn.execute(_ALTA, filas)
+
+
+def registrar_cambio(conn, tabla: str, id_usuario: int, id_fila: int) -> None:
+    conn.execute(_QUITAR, {"tabla": tabla, "id_fila": id_fila})
+    registrar_altas(conn, tabla, [(id_usuario, id_fila)])
+
+
+def olvidar_usuario(conn, id_usuario: int) -> None:
+    conn.execute(text("DELETE FROM sync_cambio WHERE id_usuario = :id"), {"id": id_usuario})
+    conn.execute(text("DELETE FROM sync_subida WHERE id_usuario = :id"), {"id": id_usuario})
+
+
+def cambios_desde(conn, id_usuario: int, desde: int, limite: int) -> list:
+    """[(seq, tabla, id_fila)] posteriores a `desde`, en orden de seq."""
+    return conn.execute(_DESDE, {"id_usuario": id_usuario, "desde": desde, "limite": limite}).all()
+
+
+def subidas_previas(conn, id_usuario: int, ids_locales: Iterable[str]) -> dict:
+    """{id_local: (tabla, id_fila)} de lo que este usuario ya subió."""
+    ordenados = sorted(set(ids_locales))
+    previas = {}
+    for i in range(0, len(ordenados), _LOTE_IN):
+        filas = conn.execute(_PREVIAS, {"id_usuario": id_usuario, "ids": ordenados[i:i + _LOTE_IN]})
+        previas.update((local, (tabla, id_fila)) for local, tabla, id_fila in filas)
+    return previas
+
+
+def registrar_subidas(conn, id_usuario: int, tabla: str, pares: Iterable[tuple]) -> None:
+    """pares (id_local, id_fila) de un alta hecha por POST /sync; misma transacción."""
+    filas = [{"id_usuario": id_usuario, "id_local": local, "tabla": tabla, "id_fila": i} for local, i in pares]
+    if filas:
+        conn.execute(_SUBIDA, filas)
@@ -0,0 +1,26 @@
+# tests/conftest.py — la app de pruebas usa una DB SQLite temporal, nunca db.sqlite3
+#
+# Uso (desde backend/):  python -m pytest -q tests
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_TMP = tempfile.TemporaryDirectory()
+# Antes de importar main/db (el engine se arma al importar)
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP.name}/pruebas.sqlite3"
+os.environ.setdefault("SCORE_REFRESCO_S", "0")
+os.environ.setdefault("ANALITICA_REFRESCO_S", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
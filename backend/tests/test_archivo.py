@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import archivo_gastos
+
+
+@pytest.mark.skipif(not archivo_gastos.disponible, reason="requiere SQLite en disco")
+def test_archivar_invalida_metricas_del_usuario(cliente):
+    r = cliente.post("/usuarios", json={"nombre_completo": "Archivo", "contrasena_hash": "secreta123"})
+    uid = r.json()["id_usuario"]
+    viejo = (datetime.now() - timedelta(days=3 * 365)).isoformat(timespec="seconds")
+    filas = [{"id_usuario": uid, "gasto_agua": 10, "creado_en": viejo},
+             {"id_usuario": uid, "gasto_agua": 20}]  # el id máximo nunca se archiva
+    assert cliente.post("/bulk/gastos", json=filas).json()["insertados"] == 2
+
+    ruta = f"/usuarios/{uid}/dashboard?fields=gastos"
+    antes = cliente.get(ruta)
+    assert len(antes.json()["gastos"]) == 2
+    assert archivo_gastos.archivar(12)["filas"] >= 1
+
+    despues = cliente.get(ruta, headers={"If-None-Match": antes.headers["etag"]})
+    assert despues.status_code == 200
+    assert len(despues.json()["gastos"]) == 1
@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def id_usuario(cliente):
+    r = cliente.post("/usuarios", json={"nombre_completo": "Carga Masiva", "contrasena_hash": "secreta123"})
+    assert r.status_code == 201
+    return r.json()["id_usuario"]
+
+
+def test_csv_con_columna_mal_escrita_se_rechaza(cliente, id_usuario):
+    csv = f"id_usuario,gasto_agua,gasto_fertilizante\n{id_usuario},10,300\n"
+    r = cliente.post("/bulk/gastos", content=csv, headers={"content-type": "text/csv"})
+    assert r.status_code == 422
+    assert "gasto_fertilizante" in r.json()["detail"]
+
+
+def test_json_con_columna_mal_escrita_es_error_de_fila(cliente, id_usuario):
+    filas = [
+        {"id_usuario": id_usuario, "gasto_fertilizante": 300},
+        {"id_usuario": id_usuario, "gasto_fertilizantes": 300},
+    ]
+    r = cliente.post("/bulk/gastos", json=filas)
+    assert r.status_code == 200
+    cuerpo = r.json()
+    assert cuerpo["insertados"] == 1
+    assert [e["fila"] for e in cuerpo["errores"]] == [1]
+    assert "gasto_fertilizante" in cuerpo["errores"][0]["error"]
@@ -0,0 +1,41 @@
+from cache_metricas import CacheMetricas
+
+
+def test_invalidaciones_acotadas():
+    cache = CacheMetricas(max_entradas=4)
+    for uid in range(1000):
+        cache.invalidar(uid)
+    assert cache.estadisticas()["usuarios_invalidados"] == 4
+
+
+def test_no_guarda_calculo_anterior_a_invalidacion():
+    cache = CacheMetricas(max_entradas=2)
+    marca = cache.generacion(1)
+    cache.invalidar(1)
+    cache.guardar(1, "k", b"viejo", marca)
+    assert cache.obtener(1, "k") is None
+    # Aunque la invalidación de 1 ya haya salido del registro
+    marca = cache.generacion(1)
+    cache.invalidar(1)
+    cache.invalidar(2)
+    cache.invalidar(3)
+    cache.guardar(1, "k", b"viejo", marca)
+    assert cache.obtener(1, "k") is None
+    marca = cache.generacion(1)
+    cache.guardar(1, "k", b"nuevo", marca)
+    assert cache.obtener(1, "k")[1] == b"nuevo"
+
+
+def test_entradas_vencen(monkeypatch):
+    import cache_metricas
+
+    ahora = [1000.0]
+    monkeypatch.setattr(cache_metricas.time, "monotonic", lambda: ahora[0])
+    cache = CacheMetricas(max_edad_s=60)
+    cache.guardar(1, "k", b"x", cache.generacion(1))
+    ahora[0] += 59
+    assert cache.obtener(1, "k") is not None
+    ahora[0] += 2
+    assert cache.obtener(1, "k") is None
+    assert cache.estadisticas()["vencidas"] == 1
+    assert cache.estadisticas()["entradas"] == 0
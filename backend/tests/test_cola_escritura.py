@@ -0,0 +1,67 @@
+import sys
+import threading
+
+import pytest
+
+from cola_escritura import ColaEscritura
+from contrasenas import Saturado
+
+
+@pytest.fixture
+def cambios_de_hilo_frecuentes():
+    # Sin el lock, con cambios de hilo tan seguidos se pierden incrementos y se pasa de max_cola
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(intervalo)
+
+
+def _enviar_desde_hilos(cola, hilos=8, por_hilo=500) -> tuple:
+    futuros, rechazadas = [], [0]
+    lock = threading.Lock()
+
+    def enviar(base):
+        for i in range(base, base + por_hilo):
+            try:
+                f = cola.enviar_nowait(i)
+            except Saturado:
+                with lock:
+                    rechazadas[0] += 1
+                continue
+            with lock:
+                futuros.append(f)
+
+    ts = [threading.Thread(target=enviar, args=(n * por_hilo,)) for n in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return futuros, rechazadas[0]
+
+
+def test_contadores_con_envios_concurrentes(cambios_de_hilo_frecuentes):
+    cola = ColaEscritura(lambda filas: [ValueError("impar") if f % 2 else f for f in filas],
+                         max_filas=50, espera_ms=1, max_cola=200)
+    futuros, rechazadas = _enviar_desde_hilos(cola)
+    cola.detener()
+
+    est = cola.estadisticas()
+    assert est["filas"] == len(futuros)
+    assert est["rechazadas"] == rechazadas
+    assert est["filas"] + est["rechazadas"] == 4000
+    assert est["errores"] == sum(f.exception() is not None for f in futuros)
+
+
+def test_no_pasa_de_max_cola(cambios_de_hilo_frecuentes):
+    seguir = threading.Event()
+
+    def escribir_lote(filas):
+        seguir.wait()
+        return filas
+
+    cola = ColaEscritura(escribir_lote, max_filas=50, espera_ms=1, max_cola=200)
+    futuros, _ = _enviar_desde_hilos(cola)
+    # El escritor quedó trabado con su primer lote; el resto esperó en cola
+    assert len(futuros) <= 200 + 50
+    seguir.set()
+    cola.detener()
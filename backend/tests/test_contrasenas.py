@@ -0,0 +1,20 @@
+from contrasenas import ServicioHash
+
+
+def _con_ln(guardado: str, ln: int) -> str:
+    return guardado.replace(guardado.split("$")[2].split(",")[0], f"ln={ln}")
+
+
+def test_rehash_solo_hacia_arriba():
+    servicio = ServicioHash(workers=1, ln=15)
+    guardado = servicio.hashear_sync("clave")
+    assert servicio.necesita_rehash("clave")  # texto plano heredado
+    assert not servicio.necesita_rehash(guardado)
+    assert servicio.necesita_rehash(_con_ln(guardado, 14))
+    # Otro worker que calibró más alto no debe provocar un downgrade aquí
+    assert not servicio.necesita_rehash(_con_ln(guardado, 16))
+
+
+def test_memoria_acota_ln_max():
+    assert ServicioHash(workers=1, mem_max=64 * 1024 * 1024).ln_max == 16
+    assert ServicioHash(workers=1, mem_max=32 * 1024 * 1024).ln_max == 15
@@ -0,0 +1,31 @@
+import sqlite3
+from pathlib import Path
+
+import migraciones
+from db import crear_engine
+from migrar import volcar_esquema
+
+ESQUEMA = Path(__file__).resolve().parent.parent / "fintiva_schema.sql"
+
+
+def test_esquema_carga_en_db_vacia():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(ESQUEMA.read_text(encoding="utf-8"))
+    version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    assert version == migraciones.version_esperada()
+    # Las tablas virtuales funcionan con sus tablas internas recreadas
+    conn.execute("INSERT INTO usuario (id_usuario, nombre_completo, contrasena_hash) VALUES (1, 'Óscar', 'x')")
+    conn.execute("INSERT INTO parcela (id_parcela, id_usuario, nombre_parcela, latitud, longitud) "
+                 "VALUES (1, 1, 'El Llano', 19.54, -96.91)")
+    assert conn.execute("SELECT rowid FROM usuario_fts WHERE usuario_fts MATCH 'oscar'").fetchall() == [(1,)]
+    assert conn.execute("SELECT id_parcela FROM parcela_geo WHERE min_lat <= 20 AND max_lat >= 19").fetchall() == [(1,)]
+
+
+def test_esquema_al_dia_con_las_migraciones(tmp_path):
+    import main  # noqa: F401  registra los modelos en SQLModel.metadata
+
+    engine = crear_engine(f"sqlite:///{tmp_path}/nueva.sqlite3")
+    migraciones.migrar(engine)
+    volcar_esquema(engine, str(tmp_path / "esquema.sql"))
+    engine.dispose()
+    assert (tmp_path / "esquema.sql").read_text(encoding="utf-8") == ESQUEMA.read_text(encoding="utf-8")
@@ -0,0 +1,13 @@
+import main
+
+
+def _token(id_usuario: int) -> dict:
+    return {"authorization": "Bearer " + main.create_access_token({"sub": str(id_usuario)})}
+
+
+def test_eventos_sin_token_es_401(cliente):
+    assert cliente.get("/usuarios/1/eventos").status_code == 401
+
+
+def test_eventos_de_otro_usuario_es_403(cliente):
+    assert cliente.get("/usuarios/1/eventos", headers=_token(2)).status_code == 403
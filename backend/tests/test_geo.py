@@ -0,0 +1,23 @@
+import main
+
+
+def test_mapa_caja_chica_usa_indice(cliente):
+    r = cliente.post("/usuarios", json={"nombre_completo": "Mapa", "contrasena_hash": "secreta123"})
+    id_usuario = r.json()["id_usuario"]
+    for nombre, ubicacion, tamano in (("A", "19.55,-96.95", "2 ha"), ("B", "19.551,-96.949", "3 ha"),
+                                      ("C", "25.0,-100.0", "1 ha")):
+        r = cliente.post("/parcelas", json={"id_usuario": id_usuario, "nombre_parcela": nombre,
+                                            "ubicacion": ubicacion, "tamano": tamano})
+        assert r.status_code == 201
+
+    caja = {"sur": 19.5, "oeste": -97, "norte": 19.6, "este": -96.9}
+    r = cliente.get("/parcelas/mapa", params={**caja, "celda": 0.01})
+    assert r.status_code == 200
+    assert (r.json()["parcelas"], r.json()["hectareas"]) == (2, 5)
+
+    with main.engine.connect() as conn:
+        plan = " ".join(f[-1] for f in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*), SUM(hectareas) FROM parcela "
+            "WHERE latitud BETWEEN ? AND ? AND longitud BETWEEN ? AND ?",
+            (caja["sur"], caja["norte"], caja["oeste"], caja["este"])))
+    assert "COVERING INDEX idx_parcela_lat_lon_ha" in plan
@@ -0,0 +1,30 @@
+import copy
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+import instrumentacion
+from instrumentacion import instalar_hooks_sql
+
+
+def test_execute_fallido_no_deja_tiempos_colgados():
+    engine = create_engine("sqlite://")
+    instalar_hooks_sql(engine)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        info = copy.deepcopy(dict(conn.info))
+        for _ in range(3):
+            with pytest.raises(IntegrityError):
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+        assert dict(conn.info) == info
+
+        stats = [0, 0.0]
+        token = instrumentacion._stats_request.set(stats)
+        try:
+            conn.execute(text("SELECT 1"))
+        finally:
+            instrumentacion._stats_request.reset(token)
+        assert stats[0] == 1
+        assert 0 <= stats[1] < 1
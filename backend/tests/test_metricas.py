@@ -0,0 +1,21 @@
+import pytest
+
+RUTA = "/metrics/gastos-trimestrales/1"
+
+
+@pytest.mark.parametrize("params", [{"anio": 9999}, {"hasta": "9999-12-31"}, {"desde": "9999-01-01"}])
+def test_fechas_al_limite_son_422(cliente, params):
+    assert cliente.get(RUTA, params=params).status_code == 422
+
+
+def test_ultimo_anio_permitido(cliente):
+    r = cliente.get(RUTA, params={"anio": 9998, "serie": "mes"})
+    assert r.status_code == 200
+    assert len(r.json()["items"]) == 12
+
+
+def test_serie_acotada(cliente):
+    r = cliente.get(RUTA, params={"desde": "2020-01-01", "hasta": "2400-12-31", "serie": "mes"})
+    assert r.status_code == 422
+    r = cliente.get(RUTA, params={"desde": "2020-01-01", "hasta": "2400-12-31", "serie": "anio"})
+    assert r.status_code == 200
@@ -0,0 +1,17 @@
+from sqlalchemy import text
+
+import main
+
+_FILAS = text("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < :total) "
+              "SELECT x FROM n")
+
+
+def test_reporte_en_lotes_de_reporte_lote():
+    total = 2 * main.REPORTE_LOTE + 234
+    lotes = list(main._lotes_reporte_cultivos(_FILAS, {"total": total}, None))
+    assert [len(l) for l in lotes] == [main.REPORTE_LOTE, main.REPORTE_LOTE, 234]
+
+
+def test_reporte_con_limit_es_un_solo_lote():
+    lotes = list(main._lotes_reporte_cultivos(_FILAS, {"total": 1000}, 10))
+    assert [len(l) for l in lotes] == [10]
@@ -0,0 +1,17 @@
+def test_patch_de_contrasena_devuelve_el_usuario_y_revoca_tokens(cliente):
+    r = cliente.post("/usuarios", json={"nombre_completo": "Cambio Clave", "telefono": "5550001111",
+                                        "contrasena_hash": "vieja12345"})
+    uid = r.json()["id_usuario"]
+    login = cliente.post("/auth/login", json={"identificador": "5550001111", "contrasena": "vieja12345"})
+    viejo = {"authorization": "Bearer " + login.json()["access_token"]}
+
+    r = cliente.patch(f"/usuarios/{uid}", json={"contrasena_hash": "nueva12345"})
+    assert r.status_code == 200
+    cuerpo = r.json()
+    assert cuerpo["id_usuario"] == uid
+    assert cuerpo["nombre_completo"] == "Cambio Clave"
+    assert cuerpo["telefono"] == "5550001111"
+
+    assert cliente.get("/auth/me", headers=viejo).status_code == 401
+    nuevo = cliente.post("/auth/login", json={"identificador": "5550001111", "contrasena": "nueva12345"})
+    assert nuevo.status_code == 200